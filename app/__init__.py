@@ -4,9 +4,10 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_wtf.csrf import CSRFProtect
 from flask_login import LoginManager
 from app.config import Config
+from app.replica import SessionRoutage
 
 # Extensions Flask
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': SessionRoutage})
 csrf = CSRFProtect()
 login_manager = LoginManager()
 
@@ -15,6 +16,12 @@ def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
     
+    # Derrière un proxy (Railway, reverse proxy), remote_addr est l'IP du client et non celle du proxy
+    if app.config.get('PROXIES_DE_CONFIANCE'):
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        proxies = app.config['PROXIES_DE_CONFIANCE']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
+    
     # Initialiser les extensions
     db.init_app(app)
     csrf.init_app(app)
@@ -26,8 +33,9 @@ def create_app(config_class=Config):
     login_manager.login_message_category = 'info'
     
     # User loader pour Flask-Login
-    from app.auth import User, load_user
+    from app.auth import load_user, load_user_from_request
     login_manager.user_loader(load_user)
+    login_manager.request_loader(load_user_from_request)  # jeton d'API (Authorization: Bearer)
     
     # Context processor pour rendre datetime disponible dans les templates
     from datetime import datetime
@@ -35,6 +43,14 @@ def create_app(config_class=Config):
     def inject_now():
         return {'now': datetime.now}
     
+    # Assets front précompilés (CSS Tailwind, Alpine.js) servis avec cache immutable
+    from app.assets import register_assets
+    register_assets(app)
+    
+    # Filtre Jinja pour afficher les montants Decimal au centime
+    from app.montants import format_montant
+    app.add_template_filter(format_montant, 'montant')
+    
     # Configuration du logging (enregistrement des erreurs)
     if not app.debug:  # Seulement en production
         import os
@@ -66,11 +82,75 @@ def create_app(config_class=Config):
     from app.errors import register_error_handlers
     register_error_handlers(app)
     
+    # Lecture de ses propres écritures quand un réplica est configuré
+    from app.replica import register_replica
+    register_replica(app)
+    
+    # Cache des listes filtrées (générations de tables partagées entre workers)
+    from app.cache_requetes import register_cache_requetes
+    register_cache_requetes(app)
+    
+    # Profil de production SQLite (WAL, busy_timeout...) si la base est un fichier SQLite
+    from app.profil_sqlite import register_sqlite
+    register_sqlite(app)
+    
+    # Enregistrer les commandes CLI (flask <commande>)
+    from app.commands import register_commands
+    register_commands(app)
+
+    # API JSON versionnée (/api/v1)
+    from app.api import register_api
+    register_api(app)
+
     # Importer et enregistrer les routes
     with app.app_context():
         from app import routes
         
         # Créer les tables de la base de données
         db.create_all()
+        
+        # Premier démarrage : compte admin repris de ADMIN_USERNAME / ADMIN_PASSWORD_HASH
+        from app.auth import creer_admin_initial
+        creer_admin_initial(app)
+    
+    # Préchargement gunicorn (gunicorn.conf.py) : les modules lourds et le moteur PDF
+    # sont chargés une fois dans le maître et partagés par les workers forkés
+    if app.config.get('PRELOAD_APP'):
+        from app.modules_differes import precharger
+        precharger(app)
+    
+    # Préchauffage optionnel du moteur PDF (imports, CSS, polices, logo)
+    if app.config.get('PDF_WARMUP'):
+        from app.pdf import prechauffer_pdf
+        prechauffer_pdf(app)
+    
+    # Un thread ne survit pas au fork : en préchargement, post_fork les lance dans chaque worker
+    if not app.config.get('PRELOAD_APP'):
+        demarrer_services(app)
     
     return app
+
+
+def demarrer_services(app):
+    """Lance les threads de fond activés dans la configuration
+
+    Appelé par create_app, ou par le hook post_fork de gunicorn.conf.py
+    quand l'application est préchargée dans le processus maître.
+
+    Args:
+        app: L'instance Flask
+    """
+    # Tâches planifiées (expiration des devis, factures en retard), exécutées par un seul worker
+    if app.config.get('TACHES_PLANIFIEES'):
+        from app.taches import demarrer_planificateur
+        demarrer_planificateur(app)
+    
+    # Envoi des emails en file (devis, factures, relances) hors des requêtes
+    if app.config.get('EMAIL_ENVOI_AUTO'):
+        from app.emails import demarrer_envoi_emails
+        demarrer_envoi_emails(app)
+    
+    # Diffusion du journal des événements métier vers les puits (EVENEMENTS_PUITS)
+    if app.config.get('EVENEMENTS_DIFFUSION_AUTO'):
+        from app.evenements import demarrer_diffusion_evenements
+        demarrer_diffusion_evenements(app)
@@ -0,0 +1,631 @@
+"""API JSON versionnée (/api/v1) : clients, devis avec lignes, factures et paiements
+
+Pour les intégrations, qui n'ont plus à analyser le HTML :
+- authentification par la session ou par jeton (Authorization: Bearer <jeton>,
+  voir flask utilisateur-jeton) ;
+- sélection des champs : ?fields=id,numero,total_ttc (seules ces colonnes sont lues) ;
+- pagination par curseur : ?limit=100&cursor=<next_cursor> (reprise sur l'id, sans OFFSET) ;
+- écritures par lots : une liste de documents par requête, validés avec les
+  mêmes règles que les formulaires puis enregistrés dans une seule
+  transaction (tout ou rien).
+
+Les montants sont en texte (Decimal exact), les dates au format ISO 8601.
+"""
+import base64
+from datetime import date
+from flask import Blueprint, request, jsonify, abort
+from flask_login import current_user
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException
+from app import db, csrf
+from app.models import Client, Devis, DevisArchive, DevisLigne, Facture, FactureArchive, ClientResume
+from app.forms import ClientForm, DevisForm
+from app.calculs import normaliser_ligne, calculer_totaux_lignes
+from app.duplication import prochains_numeros_devis
+from app.facturation import prochains_numeros_factures, convertir_en_facture
+from app.paiements import appliquer_paiement
+from app.evenements import enregistrer_evenement
+from app.montants import to_decimal, arrondir, ZERO
+from app.replica import lecture_replica
+from app.resume_clients import actualiser_resumes
+
+api_v1 = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+# Pagination des listes
+LIMITE_DEFAUT = 50
+LIMITE_MAX = 500
+
+# Nombre maximum de documents par requête d'écriture
+LOT_MAX = 200
+
+METHODES_ECRITURE = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+def register_api(app):
+    """Enregistre l'API v1
+
+    La protection CSRF des formulaires ne s'applique pas : les écritures
+    exigent un corps JSON, qu'un site tiers ne peut pas envoyer sans CORS.
+
+    Args:
+        app: L'instance Flask
+    """
+    csrf.exempt(api_v1)
+    app.register_blueprint(api_v1)
+
+
+@api_v1.before_request
+def verifier_requete():
+    """Authentification obligatoire, corps JSON pour les écritures"""
+    if not current_user.is_authenticated:
+        abort(401, description='Authentification requise (session ou en-tête Authorization: Bearer <jeton>)')
+    if request.method in METHODES_ECRITURE and not request.is_json:
+        abort(415, description='Corps JSON attendu (Content-Type: application/json)')
+
+
+@api_v1.errorhandler(HTTPException)
+def erreur_http(erreur):
+    """Erreurs en JSON plutôt qu'en page HTML"""
+    return jsonify({'error': erreur.description}), erreur.code
+
+
+# ========== SÉRIALISATION ET SÉLECTION DES CHAMPS ==========
+
+def _texte(valeur):
+    return str(valeur)
+
+
+def _iso(valeur):
+    return valeur.isoformat()
+
+
+class Ressource:
+    """Champs exposés d'un modèle
+
+    Les colonnes ne sont lues que si elles sont demandées (load_only) ; les
+    champs calculés déclarent les relations à charger en une requête.
+    """
+
+    def __init__(self, colonnes, calcules=None, par_defaut=None):
+        """
+        Args:
+            colonnes: dict nom de colonne -> conversion JSON (None : valeur telle quelle)
+            calcules: dict nom -> (fonction(modèle) -> options de chargement, fonction(objet) -> valeur)
+            par_defaut: Champs renvoyés sans ?fields (défaut : toutes les colonnes)
+        """
+        self.colonnes = colonnes
+        self.calcules = calcules or {}
+        self.par_defaut = par_defaut or list(colonnes)
+
+    def champs(self, par_defaut=None):
+        """Champs demandés par ?fields=a,b,c, sinon les champs par défaut"""
+        demandes = request.args.get('fields')
+        if not demandes:
+            return par_defaut or self.par_defaut
+        champs = [champ.strip() for champ in demandes.split(',') if champ.strip()]
+        inconnus = [champ for champ in champs if champ not in self.colonnes and champ not in self.calcules]
+        if inconnus:
+            abort(400, description=f'Champs inconnus : {", ".join(inconnus)}')
+        return champs
+
+    def options(self, modele, champs):
+        """Options de chargement SQLAlchemy pour ne lire que les champs demandés"""
+        colonnes = [getattr(modele, champ) for champ in champs if champ in self.colonnes]
+        options = [db.load_only(modele.id, *colonnes)]
+        for champ in champs:
+            if champ in self.calcules:
+                options.extend(self.calcules[champ][0](modele))
+        return options
+
+    def serialiser(self, objet, champs):
+        resultat = {}
+        for champ in champs:
+            if champ in self.colonnes:
+                valeur = getattr(objet, champ)
+                conversion = self.colonnes[champ]
+                resultat[champ] = conversion(valeur) if conversion and valeur is not None else valeur
+            else:
+                resultat[champ] = self.calcules[champ][1](objet)
+        return resultat
+
+
+def _sans_chargement(modele):
+    return []
+
+
+def _resume_json(client):
+    resume = client.resume
+    if resume is None:
+        return None
+    return {
+        'nb_devis': resume.nb_devis,
+        'nb_devis_ouverts': resume.nb_devis_ouverts,
+        'total_facture': str(resume.total_facture),
+        'reste_a_payer': str(resume.reste_a_payer),
+        'derniere_activite': resume.derniere_activite.isoformat() if resume.derniere_activite else None,
+    }
+
+
+def _lignes_json(devis):
+    return [{
+        'ordre': ligne.ordre,
+        'tache': ligne.tache,
+        'vehicule': ligne.vehicule,
+        'description': ligne.description,
+        'quantite': ligne.quantite,
+        'unite': ligne.unite,
+        'prix_unitaire_ht': str(ligne.prix_unitaire_ht),
+        'tva_pourcent': str(ligne.tva_pourcent),
+        'total_ttc': str(ligne.total_ttc),
+    } for ligne in sorted(devis.lignes, key=lambda ligne: ligne.ordre or 0)]
+
+
+CLIENTS = Ressource(
+    colonnes={
+        'id': None, 'nom': None, 'entreprise': None, 'adresse': None, 'ville': None,
+        'code_postal': None, 'telephone': None, 'email': None, 'created_at': _iso,
+    },
+    calcules={
+        'resume': (lambda modele: [db.joinedload(modele.resume)], _resume_json),
+    },
+)
+
+DEVIS = Ressource(
+    colonnes={
+        'id': None, 'numero': None, 'date': _iso, 'client_id': None, 'numero_serie': None,
+        'inventaire': None, 'statut': None, 'validite_jours': None, 'remise_pourcent': _texte,
+        'acompte': _texte, 'total_ht': _texte, 'total_ttc': _texte, 'created_at': _iso, 'updated_at': _iso,
+    },
+    calcules={
+        'lignes': (lambda modele: [db.selectinload(modele.lignes)], _lignes_json),
+        'facture_id': (lambda modele: [db.selectinload(modele.facture)],
+                       lambda devis: devis.facture.id if devis.facture else None),
+        'archive': (_sans_chargement, lambda devis: devis.archive),
+    },
+)
+
+FACTURES = Ressource(
+    colonnes={
+        'id': None, 'numero': None, 'date': _iso, 'devis_id': None, 'client_id': None,
+        'montant_ttc': _texte, 'acompte': _texte, 'reste_a_payer': _texte, 'etat_paiement': None,
+        'mode_paiement': None, 'date_paiement': _iso, 'en_retard': None, 'created_at': _iso,
+    },
+    calcules={
+        'archive': (_sans_chargement, lambda facture: facture.archive),
+    },
+)
+
+
+# ========== LECTURE : PAGINATION PAR CURSEUR ==========
+
+def _encoder_curseur(dernier_id):
+    return base64.urlsafe_b64encode(f'id:{dernier_id}'.encode()).decode().rstrip('=')
+
+
+def _decoder_curseur(curseur):
+    try:
+        prefixe, valeur = base64.urlsafe_b64decode(curseur + '=' * (-len(curseur) % 4)).decode().split(':', 1)
+        if prefixe == 'id':
+            return int(valeur)
+    except (ValueError, UnicodeDecodeError):
+        pass
+    abort(400, description='Curseur invalide')
+
+
+def _liste(ressource, modele, requete):
+    """Page de résultats triés par id, reprise après le curseur
+
+    Returns:
+        Réponse JSON {"data": [...], "next_cursor": "..." ou null}
+    """
+    champs = ressource.champs()
+    limite = max(1, min(request.args.get('limit', LIMITE_DEFAUT, type=int), LIMITE_MAX))
+
+    requete = requete.options(*ressource.options(modele, champs))
+    curseur = request.args.get('cursor')
+    if curseur:
+        requete = requete.filter(modele.id > _decoder_curseur(curseur))
+
+    # Une ligne de plus que la limite : indique s'il reste une page
+    objets = requete.order_by(modele.id).limit(limite + 1).all()
+    suivant = _encoder_curseur(objets[limite - 1].id) if len(objets) > limite else None
+    return jsonify({
+        'data': [ressource.serialiser(objet, champs) for objet in objets[:limite]],
+        'next_cursor': suivant,
+    })
+
+
+def _detail(ressource, modeles, id, par_defaut=None):
+    """Document par id, cherché dans la table courante puis dans les archives"""
+    champs = ressource.champs(par_defaut)
+    for modele in modeles:
+        objet = modele.query.options(*ressource.options(modele, champs)).filter(modele.id == id).first()
+        if objet is not None:
+            return jsonify({'data': ressource.serialiser(objet, champs)})
+    abort(404, description=f'Document {id} introuvable')
+
+
+@api_v1.route('/clients')
+@lecture_replica
+def clients_liste():
+    """Clients, filtrables par ?email="""
+    requete = Client.query
+    if request.args.get('email'):
+        requete = requete.filter(Client.email == request.args['email'])
+    return _liste(CLIENTS, Client, requete)
+
+
+@api_v1.route('/clients/<int:id>')
+@lecture_replica
+def client_detail(id):
+    return _detail(CLIENTS, (Client,), id)
+
+
+@api_v1.route('/devis')
+@lecture_replica
+def devis_liste():
+    """Devis courants, filtrables par ?statut= et ?client_id="""
+    requete = Devis.query
+    if request.args.get('statut'):
+        requete = requete.filter(Devis.statut == request.args['statut'])
+    if request.args.get('client_id', type=int):
+        requete = requete.filter(Devis.client_id == request.args.get('client_id', type=int))
+    return _liste(DEVIS, Devis, requete)
+
+
+@api_v1.route('/devis/<int:id>')
+@lecture_replica
+def devis_detail(id):
+    """Devis courant ou archivé, avec ses lignes par défaut"""
+    return _detail(DEVIS, (Devis, DevisArchive), id, par_defaut=[*DEVIS.colonnes, 'lignes', 'facture_id', 'archive'])
+
+
+@api_v1.route('/factures')
+@lecture_replica
+def factures_liste():
+    """Factures courantes, filtrables par ?etat=, ?client_id= et ?en_retard=1"""
+    requete = Facture.query
+    if request.args.get('etat'):
+        requete = requete.filter(Facture.etat_paiement == request.args['etat'])
+    if request.args.get('client_id', type=int):
+        requete = requete.filter(Facture.client_id == request.args.get('client_id', type=int))
+    if request.args.get('en_retard') == '1':
+        requete = requete.filter(Facture.en_retard.is_(True))
+    return _liste(FACTURES, Facture, requete)
+
+
+@api_v1.route('/factures/<int:id>')
+@lecture_replica
+def facture_detail(id):
+    """Facture courante ou archivée"""
+    return _detail(FACTURES, (Facture, FactureArchive), id)
+
+
+# ========== ÉCRITURE PAR LOTS ==========
+
+def _lot(cle):
+    """Documents envoyés : liste JSON, objet {cle: [...]} ou objet seul
+
+    Returns:
+        list[dict]
+    """
+    donnees = request.get_json(silent=True)
+    if isinstance(donnees, dict) and isinstance(donnees.get(cle), list):
+        donnees = donnees[cle]
+    elif isinstance(donnees, dict):
+        donnees = [donnees]
+    if not isinstance(donnees, list) or not donnees or not all(isinstance(d, dict) for d in donnees):
+        abort(400, description=f'Liste de documents attendue (ou {{"{cle}": [...]}})')
+    if len(donnees) > LOT_MAX:
+        abort(413, description=f'{LOT_MAX} documents maximum par requête')
+    return donnees
+
+
+def _valider_formulaire(classe_formulaire, donnees, existant=None):
+    """Valide un document avec le formulaire WTForms de l'interface (mêmes règles)
+
+    Args:
+        classe_formulaire: ClientForm, DevisForm...
+        donnees: dict JSON du document (champs inconnus refusés)
+        existant: Valeurs actuelles (dict), complétées par `donnees` pour une mise à jour partielle
+
+    Returns:
+        tuple: (formulaire validé ou None, dict des erreurs)
+    """
+    valeurs = dict(existant or {})
+    valeurs.update(donnees)
+    formdata = MultiDict({nom: str(valeur) for nom, valeur in valeurs.items() if valeur is not None})
+
+    formulaire = classe_formulaire(formdata=formdata, meta={'csrf': False})
+    inconnus = set(donnees) - set(formulaire._fields)
+    if inconnus:
+        return None, {nom: ['Champ inconnu'] for nom in sorted(inconnus)}
+    if not formulaire.validate():
+        return None, dict(formulaire.errors)
+    return formulaire, {}
+
+
+def _clients_inconnus(client_ids):
+    """Ids de clients référencés qui n'existent pas (une requête)"""
+    client_ids = {client_id for client_id in client_ids if client_id is not None}
+    if not client_ids:
+        return set()
+    # Sans autoflush : les devis du lot ne sont pas encore écrits
+    with db.session.no_autoflush:
+        return client_ids - set(db.session.scalars(db.select(Client.id).where(Client.id.in_(client_ids))))
+
+
+def _repondre_lot(ressource, objets, erreurs, statut=200):
+    """Tout ou rien : erreurs de validation -> 422 et annulation, sinon commit et documents écrits"""
+    if erreurs:
+        db.session.rollback()
+        erreurs = sorted(erreurs, key=lambda erreur: erreur['index'])
+        return jsonify({'error': 'Lot refusé : aucun document enregistré', 'details': erreurs}), 422
+    db.session.commit()
+    champs = ressource.champs()
+    return jsonify({'data': [ressource.serialiser(objet, champs) for objet in objets]}), statut
+
+
+def _extraire(donnees, *cles):
+    """Retire du document les clés traitées hors formulaire (id, lignes)"""
+    donnees = dict(donnees)
+    return donnees, [donnees.pop(cle, None) for cle in cles]
+
+
+def _par_id(modele, lot):
+    """Documents du lot chargés en une requête (clé 'id' obligatoire)"""
+    ids = [donnees.get('id') for donnees in lot]
+    if not all(isinstance(id_document, int) for id_document in ids):
+        abort(400, description='Chaque document doit avoir un "id" entier')
+    return {objet.id: objet for objet in modele.query.filter(modele.id.in_(ids))}
+
+
+def _valeurs_client(client):
+    return {nom: getattr(client, nom) for nom in ('nom', 'entreprise', 'adresse', 'ville', 'code_postal',
+                                                   'telephone', 'email')}
+
+
+@api_v1.route('/clients', methods=['POST'])
+def clients_creer():
+    """Crée un lot de clients"""
+    clients, erreurs = [], []
+    for index, donnees in enumerate(_lot('clients')):
+        formulaire, erreurs_document = _valider_formulaire(ClientForm, donnees)
+        if erreurs_document:
+            erreurs.append({'index': index, 'erreurs': erreurs_document})
+            continue
+        client = Client(resume=ClientResume())
+        formulaire.populate_obj(client)
+        db.session.add(client)
+        clients.append(client)
+    return _repondre_lot(CLIENTS, clients, erreurs, 201)
+
+
+@api_v1.route('/clients', methods=['PATCH'])
+def clients_modifier():
+    """Modifie un lot de clients (mise à jour partielle, "id" obligatoire)"""
+    lot = _lot('clients')
+    existants = _par_id(Client, lot)
+    clients, erreurs = [], []
+    for index, donnees in enumerate(lot):
+        donnees, (id_client,) = _extraire(donnees, 'id')
+        client = existants.get(id_client)
+        if client is None:
+            erreurs.append({'index': index, 'erreurs': {'id': ['Client introuvable']}})
+            continue
+        formulaire, erreurs_document = _valider_formulaire(ClientForm, donnees, _valeurs_client(client))
+        if erreurs_document:
+            erreurs.append({'index': index, 'erreurs': erreurs_document})
+            continue
+        formulaire.populate_obj(client)
+        clients.append(client)
+    return _repondre_lot(CLIENTS, clients, erreurs)
+
+
+def _lignes(lignes, remise_pourcent):
+    """Lignes de devis JSON normalisées et vérifiées (totaux compris)
+
+    Returns:
+        tuple: (lignes, None), ou (None, message d'erreur) si elles sont refusées
+    """
+    if not isinstance(lignes, list) or not all(isinstance(ligne, dict) for ligne in lignes):
+        return None, 'Liste de lignes attendue'
+    try:
+        lignes = [normaliser_ligne(ligne) for ligne in lignes]
+        # En cache pour _remplir_devis
+        calculer_totaux_lignes(lignes, remise_pourcent)
+    except ValueError as e:
+        return None, str(e)
+    return lignes, None
+
+
+def _remplir_devis(devis, formulaire, lignes):
+    """Reporte les champs validés et, si fournies, remplace les lignes ; recalcule les totaux"""
+    devis.client_id = formulaire.client_id.data
+    devis.date = formulaire.date.data
+    devis.numero_serie = formulaire.numero_serie.data
+    devis.inventaire = formulaire.inventaire.data
+    devis.validite_jours = formulaire.validite_jours.data
+    devis.remise_pourcent = arrondir(formulaire.remise_pourcent.data)
+    devis.acompte = arrondir(formulaire.acompte.data)
+    devis.statut = formulaire.statut.data
+    if lignes is not None:
+        devis.lignes = [DevisLigne(ordre=idx + 1, total_ttc=ZERO, **ligne) for idx, ligne in enumerate(lignes)]
+    devis.appliquer_totaux(calculer_totaux_lignes(devis.lignes, devis.remise_pourcent))
+
+
+def _erreurs_clients(devis_indexes):
+    """Erreurs des devis dont le client n'existe pas
+
+    Args:
+        devis_indexes: Liste de (index dans le lot, devis)
+    """
+    inconnus = _clients_inconnus(devis.client_id for _, devis in devis_indexes)
+    return [{'index': index, 'erreurs': {'client_id': ['Client introuvable']}}
+            for index, devis in devis_indexes if devis.client_id in inconnus]
+
+
+def _valeurs_devis(devis):
+    return {
+        'client_id': devis.client_id,
+        'date': devis.date.isoformat() if devis.date else None,
+        'numero_serie': devis.numero_serie,
+        'inventaire': devis.inventaire,
+        'validite_jours': devis.validite_jours,
+        'remise_pourcent': devis.remise_pourcent,
+        'acompte': devis.acompte,
+        'statut': devis.statut,
+    }
+
+
+@api_v1.route('/devis', methods=['POST'])
+def devis_creer():
+    """Crée un lot de devis avec leurs lignes (numéros consécutifs)"""
+    lot = _lot('devis')
+    numeros = prochains_numeros_devis(len(lot))
+    tous, erreurs = [], []
+    for index, donnees in enumerate(lot):
+        donnees, (lignes,) = _extraire(donnees, 'lignes')
+        formulaire, erreurs_document = _valider_formulaire(DevisForm, donnees, {'statut': 'brouillon'})
+        if not erreurs_document:
+            lignes, erreur = _lignes(lignes if lignes is not None else [], formulaire.remise_pourcent.data)
+            if erreur:
+                erreurs_document['lignes'] = [erreur]
+        if erreurs_document:
+            erreurs.append({'index': index, 'erreurs': erreurs_document})
+            continue
+        devis = Devis(numero=numeros[index])
+        _remplir_devis(devis, formulaire, lignes)
+        db.session.add(devis)
+        tous.append((index, devis))
+
+    erreurs.extend(_erreurs_clients(tous))
+    tous = [devis for _, devis in tous]
+    if not erreurs:
+        for devis in tous:
+            enregistrer_evenement('devis.cree', devis, origine='api')
+        actualiser_resumes(*{devis.client_id for devis in tous})
+    return _repondre_lot(DEVIS, tous, erreurs, 201)
+
+
+@api_v1.route('/devis', methods=['PATCH'])
+def devis_modifier():
+    """Modifie un lot de devis ("id" obligatoire ; "lignes", si présent, remplace toutes les lignes)
+
+    Comme dans l'interface, un devis accepté ou facturé n'est plus modifiable.
+    """
+    lot = _lot('devis')
+    existants = _par_id(Devis, lot)
+    tous, erreurs, clients, anciens_statuts = [], [], set(), {}
+    for index, donnees in enumerate(lot):
+        donnees, (id_devis, lignes) = _extraire(donnees, 'id', 'lignes')
+        devis = existants.get(id_devis)
+        if devis is None:
+            erreurs.append({'index': index, 'erreurs': {'id': ['Devis introuvable']}})
+            continue
+        if devis.statut == 'accepte' or devis.facture:
+            erreurs.append({'index': index, 'erreurs': {'id': ['Devis verrouillé (accepté ou facturé)']}})
+            continue
+        formulaire, erreurs_document = _valider_formulaire(DevisForm, donnees, _valeurs_devis(devis))
+        if lignes is not None and not erreurs_document:
+            lignes, erreur = _lignes(lignes, formulaire.remise_pourcent.data)
+            if erreur:
+                erreurs_document['lignes'] = [erreur]
+        if erreurs_document:
+            erreurs.append({'index': index, 'erreurs': erreurs_document})
+            continue
+        clients.update((devis.client_id, formulaire.client_id.data))
+        anciens_statuts[devis.id] = devis.statut
+        _remplir_devis(devis, formulaire, lignes)
+        tous.append((index, devis))
+
+    erreurs.extend(_erreurs_clients(tous))
+    tous = [devis for _, devis in tous]
+    if not erreurs:
+        for devis in tous:
+            enregistrer_evenement('devis.modifie', devis, origine='api')
+            if devis.statut != anciens_statuts[devis.id]:
+                enregistrer_evenement('devis.statut', devis, ancien_statut=anciens_statuts[devis.id])
+        actualiser_resumes(*clients)
+    return _repondre_lot(DEVIS, tous, erreurs)
+
+
+@api_v1.route('/factures', methods=['POST'])
+def factures_creer():
+    """Convertit un lot de devis en factures : [{"devis_id": ...}, ...]"""
+    lot = _lot('factures')
+    ids = [donnees.get('devis_id') for donnees in lot]
+    devis_par_id = {devis.id: devis for devis in
+                    Devis.query.options(db.selectinload(Devis.facture))
+                    .filter(Devis.id.in_([id_devis for id_devis in ids if isinstance(id_devis, int)]))}
+    numeros = prochains_numeros_factures(len(lot))
+
+    factures, erreurs, deja_vus = [], [], set()
+    for index, id_devis in enumerate(ids):
+        devis = devis_par_id.get(id_devis)
+        if devis is None:
+            erreurs.append({'index': index, 'erreurs': {'devis_id': ['Devis introuvable']}})
+        elif devis.facture or id_devis in deja_vus:
+            erreurs.append({'index': index, 'erreurs': {'devis_id': ['Une facture existe déjà pour ce devis']}})
+        else:
+            deja_vus.add(id_devis)
+            factures.append(convertir_en_facture(devis, numeros[index]))
+
+    if not erreurs:
+        actualiser_resumes(*{facture.client_id for facture in factures})
+    return _repondre_lot(FACTURES, factures, erreurs, 201)
+
+
+@api_v1.route('/paiements', methods=['POST'])
+def paiements_enregistrer():
+    """Enregistre un lot de paiements : [{"facture_id", "montant", "mode_paiement"?, "date"?}, ...]
+
+    Plusieurs paiements d'une même facture sont appliqués dans l'ordre du lot ;
+    un paiement supérieur au reste à payer est refusé.
+
+    Returns:
+        Les factures mises à jour
+    """
+    lot = _lot('paiements')
+    ids = [donnees.get('facture_id') for donnees in lot]
+    factures_par_id = {facture.id: facture for facture in
+                       Facture.query.filter(Facture.id.in_([i for i in ids if isinstance(i, int)]))}
+
+    factures, erreurs = {}, []
+    for index, donnees in enumerate(lot):
+        facture = factures_par_id.get(donnees.get('facture_id'))
+        try:
+            montant = arrondir(to_decimal(donnees.get('montant'), defaut=ZERO))
+        except ValueError:
+            montant = None
+        date_paiement = _date_paiement(donnees.get('date'))
+        erreurs_document = {}
+        if facture is None:
+            erreurs_document['facture_id'] = ['Facture introuvable']
+        elif montant is None:
+            erreurs_document['montant'] = ['Montant trop grand']
+        elif montant <= 0:
+            erreurs_document['montant'] = ['Le montant doit être supérieur à 0']
+        elif montant > facture.reste_a_payer:
+            erreurs_document['montant'] = [f'Supérieur au reste à payer ({facture.reste_a_payer} €)']
+        if date_paiement is False:
+            erreurs_document['date'] = ['Date invalide (AAAA-MM-JJ)']
+        if erreurs_document:
+            erreurs.append({'index': index, 'erreurs': erreurs_document})
+            continue
+        appliquer_paiement(facture, montant, donnees.get('mode_paiement') or 'Paiement par virement', date_paiement)
+        factures[facture.id] = facture
+
+    if not erreurs:
+        actualiser_resumes(*{facture.client_id for facture in factures.values()})
+    return _repondre_lot(FACTURES, list(factures.values()), erreurs)
+
+
+def _date_paiement(valeur):
+    """Date ISO optionnelle : date, None si absente, False si invalide"""
+    if not valeur:
+        return None
+    try:
+        return date.fromisoformat(str(valeur))
+    except ValueError:
+        return False
@@ -0,0 +1,190 @@
+"""Archivage des devis et factures clos
+
+Les documents clos depuis longtemps sont déplacés (INSERT ... SELECT puis
+DELETE, par lots) des tables courantes vers les tables *_archives : les
+listes, compteurs et recherches du quotidien ne parcourent plus l'historique
+et leurs index restent petits.
+
+Les documents gardent leur id dans les archives (emails, événements et
+liens y renvoient) : les tables courantes ne doivent donc jamais le
+réattribuer. PostgreSQL ne réutilise pas les valeurs de ses séquences ;
+sous SQLite, les tables devis, devis_lignes et factures sont déclarées
+AUTOINCREMENT, et celles d'une base plus ancienne sont reconstruites
+ainsi au premier archivage (voir proteger_ids_sqlite).
+
+Sont archivés, s'ils datent de plus de ARCHIVE_APRES_JOURS :
+- les devis refusés ou expirés, et les brouillons / devis envoyés périmés sans facture ;
+- les devis dont la facture est entièrement payée (avec la facture).
+"""
+from datetime import date, datetime, timedelta
+from sqlalchemy.schema import CreateTable
+from app import db
+from app.models import (Devis, DevisArchive, DevisLigne, DevisLigneArchive,
+                        Facture, FactureArchive)
+
+TAILLE_LOT = 500
+
+# (table courante, table d'archive, colonne de rattachement au devis)
+TABLES_ARCHIVEES = (
+    (Devis, DevisArchive, 'id'),
+    (DevisLigne, DevisLigneArchive, 'devis_id'),
+    (Facture, FactureArchive, 'devis_id'),
+)
+
+
+def requete_archivables(age_jours):
+    """Requête des ids de devis clos plus anciens que `age_jours`
+
+    Le devis et la facture les plus récents (plus grand id) ne sont jamais
+    archivés : la numérotation (N°xxx, 001...) repart du dernier document
+    de la table courante.
+
+    Args:
+        age_jours: Âge minimum (en jours, d'après la date du devis)
+
+    Returns:
+        Query sur Devis.id, triée par id
+    """
+    limite = date.today() - timedelta(days=age_jours)
+    dernier_devis = db.session.query(db.func.max(Devis.id)).scalar()
+    derniere_facture = db.session.query(db.func.max(Facture.id)).scalar()
+
+    # Un devis daté d'avant `limite` avec une validité <= age_jours est forcément expiré
+    # (évite l'arithmétique de dates, différente entre SQLite et PostgreSQL)
+    expire = db.or_(Devis.validite_jours.is_(None), Devis.validite_jours <= age_jours)
+
+    return (db.session.query(Devis.id)
+            .outerjoin(Facture, Facture.devis_id == Devis.id)
+            .filter(Devis.date < limite, Devis.id != dernier_devis)
+            .filter(db.or_(
+                db.and_(Facture.id.is_(None), Devis.statut.in_(('refuse', 'expire'))),
+                db.and_(Facture.id.is_(None), Devis.statut.in_(('brouillon', 'envoye')), expire),
+                db.and_(Facture.etat_paiement == 'Payé', Facture.id != derniere_facture)))
+            .order_by(Devis.id))
+
+
+def deplacer_lot(ids_devis):
+    """Copie un lot dans les tables d'archive puis le supprime des tables courantes
+
+    Tout le lot est déplacé dans une seule transaction.
+
+    Args:
+        ids_devis: ids des devis à archiver
+    """
+    maintenant = datetime.utcnow()
+
+    for modele, modele_archive, colonne in TABLES_ARCHIVEES:
+        colonnes = [c.name for c in modele.__table__.columns]
+        selection = db.select(*[modele.__table__.c[nom] for nom in colonnes])
+        if modele is Devis:
+            colonnes.append('archived_at')
+            selection = selection.add_columns(db.literal(maintenant))
+        selection = selection.where(modele.__table__.c[colonne].in_(ids_devis))
+        db.session.execute(db.insert(modele_archive.__table__).from_select(colonnes, selection))
+
+    # Suppression dans l'ordre inverse des clés étrangères (factures, lignes, devis)
+    for modele, _, colonne in reversed(TABLES_ARCHIVEES):
+        db.session.execute(db.delete(modele.__table__).where(modele.__table__.c[colonne].in_(ids_devis)))
+
+    db.session.commit()
+
+
+def _reconstruire_autoincrement(connexion, table):
+    """Recrée une table SQLite avec AUTOINCREMENT en gardant ses lignes et ses ids
+
+    Procédure de la documentation SQLite (nouvelle table, copie, suppression
+    de l'ancienne, renommage), dans la transaction en cours de `connexion`.
+    """
+    temporaire = f'{table.name}_autoincrement'
+    ddl = str(CreateTable(table).compile(dialect=connexion.dialect))
+    connexion.exec_driver_sql(ddl.replace(f'CREATE TABLE {table.name} (', f'CREATE TABLE {temporaire} (', 1))
+
+    # Colonnes présentes dans l'ancienne table (une base ancienne peut en manquer)
+    presentes = {nom for (nom,) in connexion.execute(db.text('SELECT name FROM pragma_table_info(:table)'),
+                                                      {'table': table.name})}
+    colonnes = ', '.join(colonne.name for colonne in table.columns if colonne.name in presentes)
+    connexion.exec_driver_sql(f'INSERT INTO {temporaire} ({colonnes}) SELECT {colonnes} FROM {table.name}')
+    connexion.exec_driver_sql(f'DROP TABLE {table.name}')
+    connexion.exec_driver_sql(f'ALTER TABLE {temporaire} RENAME TO {table.name}')
+    for index in table.indexes:
+        index.create(connexion)
+
+
+def proteger_ids_sqlite():
+    """Empêche SQLite de réattribuer aux documents courants des ids déjà archivés
+
+    Sans AUTOINCREMENT, SQLite attribue max(id) + 1 : si les derniers
+    documents de la table courante sont supprimés, leurs ids (et ceux des
+    documents archivés au-dessus) reviennent. Les tables qui ne sont pas
+    encore AUTOINCREMENT sont reconstruites, puis leur compteur
+    (sqlite_sequence) est porté au-delà des ids des archives.
+
+    Sans effet sur les autres bases.
+
+    Returns:
+        list: Noms des tables reconstruites
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return []
+
+    reconstruites = []
+    # Hors transaction : PRAGMA foreign_keys est ignoré dans une transaction ouverte
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connexion:
+        cles_etrangeres = connexion.exec_driver_sql('PRAGMA foreign_keys').scalar()
+        connexion.exec_driver_sql('PRAGMA foreign_keys=OFF')
+        try:
+            connexion.exec_driver_sql('BEGIN IMMEDIATE')
+            try:
+                for modele, modele_archive, _ in TABLES_ARCHIVEES:
+                    table = modele.__table__
+                    ddl = connexion.execute(db.text("SELECT sql FROM sqlite_master WHERE type = 'table' "
+                                                    "AND name = :table"), {'table': table.name}).scalar()
+                    if 'AUTOINCREMENT' not in ddl.upper():
+                        _reconstruire_autoincrement(connexion, table)
+                        reconstruites.append(table.name)
+
+                    compteur = max(
+                        connexion.execute(db.text('SELECT seq FROM sqlite_sequence WHERE name = :table'),
+                                          {'table': table.name}).scalar() or 0,
+                        connexion.execute(db.select(db.func.max(table.c.id))).scalar() or 0,
+                        connexion.execute(db.select(db.func.max(modele_archive.__table__.c.id))).scalar() or 0,
+                    )
+                    connexion.execute(db.text('DELETE FROM sqlite_sequence WHERE name = :table'),
+                                      {'table': table.name})
+                    connexion.execute(db.text('INSERT INTO sqlite_sequence (name, seq) VALUES (:table, :seq)'),
+                                      {'table': table.name, 'seq': compteur})
+
+                if connexion.exec_driver_sql('PRAGMA foreign_key_check').first() is not None:
+                    raise RuntimeError('Clés étrangères invalides après reconstruction des tables')
+                connexion.exec_driver_sql('COMMIT')
+            except Exception:
+                connexion.exec_driver_sql('ROLLBACK')
+                raise
+        finally:
+            connexion.exec_driver_sql(f'PRAGMA foreign_keys={int(cles_etrangeres)}')
+
+    return reconstruites
+
+
+def archiver(age_jours, taille_lot=TAILLE_LOT, simulation=False):
+    """Archive par lots tous les documents clos plus anciens que `age_jours`
+
+    Args:
+        age_jours: Âge minimum (en jours, d'après la date du devis)
+        taille_lot: Nombre de devis déplacés par transaction
+        simulation: Si vrai, compte les devis archivables sans rien déplacer
+
+    Returns:
+        int: Nombre de devis archivés (ou archivables en simulation)
+    """
+    if simulation:
+        return requete_archivables(age_jours).count()
+
+    proteger_ids_sqlite()
+    total = 0
+    while True:
+        ids_devis = [id_devis for (id_devis,) in requete_archivables(age_jours).limit(taille_lot)]
+        if not ids_devis:
+            return total
+        deplacer_lot(ids_devis)
+        total += len(ids_devis)
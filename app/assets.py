@@ -0,0 +1,42 @@
+"""Assets front précompilés (CSS Tailwind, Alpine.js) à nom haché"""
+import os
+import json
+from flask import request, url_for
+
+# Un fichier haché ne change jamais de contenu : cache navigateur d'un an
+CACHE_IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def register_assets(app):
+    """Charge le manifest des assets et expose asset_url() aux templates
+
+    Sans build (python scripts/build_assets.py), asset_url() retourne None et
+    les templates retombent sur les CDN : pratique en développement uniquement.
+
+    Args:
+        app: L'instance Flask
+    """
+    chemin = os.path.join(app.static_folder, 'dist', 'manifest.json')
+    manifeste = {}
+    if os.path.exists(chemin):
+        with open(chemin) as fichier:
+            manifeste = json.load(fichier)
+    elif not app.debug:
+        app.logger.warning('Assets non compilés (app/static/dist/manifest.json absent) : CSS et Alpine via CDN')
+
+    def asset_url(nom):
+        """URL du fichier haché correspondant à `nom` (ex: 'app.css'), ou None"""
+        chemin_hache = manifeste.get(nom)
+        return url_for('static', filename=chemin_hache) if chemin_hache else None
+
+    @app.context_processor
+    def inject_assets():
+        return {'asset_url': asset_url}
+
+    prefixe_dist = f'{app.static_url_path}/dist/'
+
+    @app.after_request
+    def cache_assets(response):
+        if request.path.startswith(prefixe_dist) and response.status_code == 200:
+            response.headers['Cache-Control'] = CACHE_IMMUTABLE
+        return response
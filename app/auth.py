@@ -1,40 +1,77 @@
 """Module d'authentification"""
-import os
-from flask_login import UserMixin
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import abort
+from flask_login import UserMixin, current_user
+from sqlalchemy import event
 from werkzeug.security import check_password_hash, generate_password_hash
+from app import db
+from app.models import Utilisateur
+
+# Cache du user_loader : évite une requête SQL par page vue
+# Le TTL borne le délai de prise en compte d'un changement fait par un autre worker (ou la CLI)
+USER_CACHE_TAILLE = 256
+USER_CACHE_TTL = 60  # secondes
 
 
 class User(UserMixin):
-    """Classe utilisateur simple pour l'authentification
-    
-    Pour l'instant, un seul utilisateur admin défini dans .env
-    Plus tard, on pourra migrer vers une table en base de données
+    """Utilisateur connecté : instantané détaché de la ligne `users` (lecture seule)
+
+    L'identifiant de session reste le nom d'utilisateur, comme avant la table
+    `users` : les cookies "se souvenir de moi" existants restent valides.
     """
     
-    def __init__(self, username):
-        self.id = username
+    def __init__(self, id, username, role, actif=True):
+        self.id = id
         self.username = username
+        self.role = role
+        self.actif = actif
+    
+    def get_id(self):
+        return self.username
+    
+    @property
+    def is_active(self):
+        return self.actif
+    
+    @property
+    def est_admin(self):
+        return self.role == 'admin'
+    
+    @classmethod
+    def depuis_utilisateur(cls, utilisateur):
+        """Construit l'instantané à partir d'une ligne Utilisateur"""
+        return cls(utilisateur.id, utilisateur.username, utilisateur.role, utilisateur.actif)
     
     @staticmethod
     def get(username):
-        """Récupère un utilisateur par son username
+        """Récupère un utilisateur par son username (à travers le cache)
         
         Args:
             username: Le nom d'utilisateur
             
         Returns:
-            User si les identifiants correspondent, None sinon
+            User si l'utilisateur existe, None sinon
         """
-        admin_username = os.environ.get('ADMIN_USERNAME', 'admin')
+        trouve, user = _cache.lire(username)
+        if trouve:
+            return user
         
-        if username == admin_username:
-            return User(username)
-        return None
+        utilisateur = Utilisateur.query.filter_by(username=username).first()
+        user = User.depuis_utilisateur(utilisateur) if utilisateur else None
+        _cache.ecrire(username, user)
+        return user
     
     @staticmethod
     def authenticate(username, password):
         """Vérifie les identifiants de connexion
         
+        Le hachage (volontairement lent) n'est calculé que pour un compte actif existant.
+        
         Args:
             username: Le nom d'utilisateur
             password: Le mot de passe
@@ -42,17 +79,50 @@ class User(UserMixin):
         Returns:
             User si authentification réussie, None sinon
         """
-        admin_username = os.environ.get('ADMIN_USERNAME')
-        admin_password_hash = os.environ.get('ADMIN_PASSWORD_HASH')
+        utilisateur = Utilisateur.query.filter_by(username=username).first()
         
-        if not admin_username or not admin_password_hash:
-            return None
-        
-        if username == admin_username and check_password_hash(admin_password_hash, password):
-            return User(username)
+        if utilisateur and utilisateur.actif and check_password_hash(utilisateur.password_hash, password or ''):
+            return User.depuis_utilisateur(utilisateur)
         return None
 
 
+class _CacheUtilisateurs:
+    """Cache LRU avec expiration, propre à chaque processus"""
+    
+    def __init__(self, taille, ttl):
+        self._taille = taille
+        self._ttl = ttl
+        self._verrou = threading.Lock()
+        self._entrees = OrderedDict()  # username -> (instant de chargement, User ou None)
+    
+    def lire(self, username):
+        """Retourne (trouvé, user) ; une entrée expirée compte comme absente"""
+        with self._verrou:
+            entree = self._entrees.get(username)
+            if entree is None or time.monotonic() - entree[0] >= self._ttl:
+                return False, None
+            self._entrees.move_to_end(username)
+            return True, entree[1]
+    
+    def ecrire(self, username, user):
+        with self._verrou:
+            self._entrees[username] = (time.monotonic(), user)
+            self._entrees.move_to_end(username)
+            while len(self._entrees) > self._taille:
+                self._entrees.popitem(last=False)
+    
+    def vider(self, *args):
+        with self._verrou:
+            self._entrees.clear()
+
+
+_cache = _CacheUtilisateurs(USER_CACHE_TAILLE, USER_CACHE_TTL)
+
+# Changement de mot de passe, de rôle ou désactivation : le cache local est vidé
+for _evenement in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Utilisateur, _evenement, _cache.vider)
+
+
 def load_user(user_id):
     """Fonction pour charger l'utilisateur (requis par Flask-Login)
     
@@ -63,3 +133,76 @@ def load_user(user_id):
         User ou None
     """
     return User.get(user_id)
+
+
+def load_user_from_request(request):
+    """Authentifie un client de l'API par jeton (en-tête Authorization: Bearer <jeton>)
+
+    Seule l'empreinte SHA-256 du jeton est stockée ; la résolution passe par
+    le même cache que les sessions.
+
+    Args:
+        request: La requête Flask
+
+    Returns:
+        User actif, ou None
+    """
+    entete = request.headers.get('Authorization', '')
+    if not entete.startswith('Bearer '):
+        return None
+    empreinte = _empreinte_jeton(entete[len('Bearer '):].strip())
+    
+    cle = f'jeton:{empreinte}'
+    trouve, user = _cache.lire(cle)
+    if not trouve:
+        utilisateur = Utilisateur.query.filter_by(api_token_hash=empreinte).first()
+        user = User.depuis_utilisateur(utilisateur) if utilisateur else None
+        _cache.ecrire(cle, user)
+    return user if user is not None and user.is_active else None
+
+
+def _empreinte_jeton(jeton):
+    return hashlib.sha256(jeton.encode()).hexdigest()
+
+
+def generer_jeton_api(utilisateur):
+    """Crée un nouveau jeton d'API (remplace le précédent), le commit reste à faire
+
+    Returns:
+        str: Le jeton en clair, à transmettre une seule fois à l'intégration
+    """
+    jeton = secrets.token_urlsafe(32)
+    utilisateur.api_token_hash = _empreinte_jeton(jeton)
+    return jeton
+
+
+def role_requis(role):
+    """Décorateur : réserve une route aux utilisateurs ayant `role` (après login_required)"""
+    def decorateur(vue):
+        @wraps(vue)
+        def vue_protegee(*args, **kwargs):
+            if current_user.role != role:
+                abort(403)
+            return vue(*args, **kwargs)
+        return vue_protegee
+    return decorateur
+
+
+def creer_admin_initial(app):
+    """Crée le compte admin à partir de ADMIN_USERNAME / ADMIN_PASSWORD_HASH si la table est vide
+
+    Args:
+        app: L'instance Flask (appelé dans son contexte, après db.create_all())
+    """
+    username = app.config.get('ADMIN_USERNAME')
+    password_hash = app.config.get('ADMIN_PASSWORD_HASH')
+    
+    if username and password_hash and not db.session.query(Utilisateur.id).first():
+        db.session.add(Utilisateur(username=username, password_hash=password_hash, role='admin'))
+        db.session.commit()
+        app.logger.info(f'Compte admin initial créé : {username}')
+
+
+def definir_mot_de_passe(utilisateur, password):
+    """Hache et enregistre un nouveau mot de passe (le commit reste à faire)"""
+    utilisateur.password_hash = generate_password_hash(password)
@@ -0,0 +1,230 @@
+"""Brouillons de devis enregistrés automatiquement pendant la saisie
+
+Le formulaire de devis garde son état dans le navigateur ; il l'enregistre
+côté serveur par petits envois (quelques secondes après la dernière frappe)
+qui ne contiennent que les lignes modifiées, repérées par un identifiant
+stable (uid) attribué par le navigateur :
+- {"op": "ajouter", "uid": ..., "ligne": {...}} : ajoute une ligne à la fin ;
+- {"op": "modifier", "uid": ..., "champs": {...}} : change quelques champs ;
+- {"op": "supprimer", "uid": ...} ;
+- {"op": "ordonner", "uids": [...]} : nouvel ordre des lignes.
+
+Verrouillage optimiste : chaque envoi porte la version du brouillon sur
+laquelle il se fonde et n'est appliqué que si elle n'a pas changé
+(UPDATE ... WHERE version = :version). Sinon le navigateur reçoit l'état
+courant et renvoie ses modifications par rapport à celui-ci.
+
+À l'enregistrement du devis, le formulaire ne renvoie que l'id et la
+version du brouillon : les lignes, déjà normalisées, sont reprises telles
+quelles et le brouillon est supprimé dans la même transaction.
+"""
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from app.models import BrouillonDevis
+from app.calculs import normaliser_ligne
+from app.montants import to_decimal
+from app.taches import tache
+
+# Garde-fous contre un brouillon démesuré
+MAX_LIGNES = 500
+MAX_OPERATIONS = 1000
+TAILLE_UID = 64
+
+# Champs du formulaire gardés avec le brouillon (en texte, tels que saisis)
+CHAMPS_FORMULAIRE = ('client_id', 'date', 'numero_serie', 'inventaire', 'validite_jours', 'remise_pourcent',
+                     'acompte', 'statut')
+
+
+class ConflitVersion(Exception):
+    """Le brouillon a changé depuis la version sur laquelle se fonde l'envoi"""
+
+
+class BrouillonExistant(Exception):
+    """L'utilisateur a déjà un brouillon pour ce devis (créé depuis un autre onglet)"""
+
+    def __init__(self, brouillon):
+        super().__init__(brouillon.id)
+        self.brouillon = brouillon
+
+
+def _dict(valeur, quoi):
+    if not isinstance(valeur, dict):
+        raise ValueError(f'{quoi} invalide')
+    return valeur
+
+
+def _ligne(uid, donnees):
+    """Ligne stockée : champs normalisés (montants en texte exact) et uid"""
+    ligne = normaliser_ligne(donnees)
+    ligne['prix_unitaire_ht'] = str(ligne['prix_unitaire_ht'])
+    ligne['tva_pourcent'] = str(ligne['tva_pourcent'])
+    ligne['uid'] = uid
+    return ligne
+
+
+def appliquer_operations(lignes, operations):
+    """Applique des opérations à des lignes de brouillon (sans modifier la liste reçue)
+
+    Seules les lignes ajoutées ou modifiées sont normalisées.
+
+    Args:
+        lignes: Lignes stockées du brouillon
+        operations: Liste d'opérations (voir la docstring du module)
+
+    Returns:
+        list: Nouvelles lignes
+
+    Raises:
+        ValueError: Opération inconnue ou mal formée, uid inconnu ou en double, trop de lignes
+    """
+    if not isinstance(operations, list) or len(operations) > MAX_OPERATIONS:
+        raise ValueError('Opérations invalides')
+
+    par_uid = {ligne['uid']: ligne for ligne in lignes}
+    ordre = [ligne['uid'] for ligne in lignes]
+
+    for operation in operations:
+        nature, uid = _dict(operation, 'Opération').get('op'), operation.get('uid')
+        if nature == 'ajouter':
+            if not isinstance(uid, str) or not 0 < len(uid) <= TAILLE_UID:
+                raise ValueError('uid de ligne invalide')
+            if uid in par_uid:
+                raise ValueError(f'Ligne {uid} déjà présente')
+            par_uid[uid] = _ligne(uid, _dict(operation.get('ligne'), 'Ligne'))
+            ordre.append(uid)
+        elif nature == 'modifier':
+            if uid not in par_uid:
+                raise ValueError(f'Ligne {uid} inconnue')
+            par_uid[uid] = _ligne(uid, {**par_uid[uid], **_dict(operation.get('champs'), 'Champs')})
+        elif nature == 'supprimer':
+            if par_uid.pop(uid, None) is None:
+                raise ValueError(f'Ligne {uid} inconnue')
+            ordre.remove(uid)
+        elif nature == 'ordonner':
+            uids = operation.get('uids')
+            if (not isinstance(uids, list) or not all(isinstance(autre, str) for autre in uids)
+                    or len(uids) != len(ordre) or set(uids) != set(ordre)):
+                raise ValueError('Ordre des lignes invalide')
+            ordre = uids
+        else:
+            raise ValueError(f'Opération inconnue : {nature}')
+
+    if len(ordre) > MAX_LIGNES:
+        raise ValueError(f'Maximum {MAX_LIGNES} lignes par devis')
+    return [par_uid[uid] for uid in ordre]
+
+
+def _champs(champs):
+    """Champs du formulaire retenus (texte, longueur bornée)"""
+    if champs is None:
+        return {}
+    return {nom: str(valeur)[:200] for nom, valeur in _dict(champs, 'Champs').items()
+            if nom in CHAMPS_FORMULAIRE and valeur is not None}
+
+
+def creer_brouillon(utilisateur, devis_id, lignes, champs):
+    """Crée le brouillon d'un formulaire (version 0) depuis son état complet, sans commit
+
+    Un seul brouillon par utilisateur et par devis : s'il en existe déjà un
+    (autre onglet), il n'est pas remplacé ; le navigateur reçoit son état et
+    y envoie ses différences, avec la vérification de version habituelle.
+
+    Args:
+        utilisateur: username de l'auteur
+        devis_id: Devis édité, ou None pour un nouveau devis
+        lignes: Liste des lignes (dicts avec uid)
+        champs: Autres champs du formulaire
+
+    Returns:
+        BrouillonDevis
+
+    Raises:
+        BrouillonExistant: L'utilisateur a déjà un brouillon pour ce devis
+        ValueError: Lignes ou champs invalides
+    """
+    if not isinstance(lignes, list):
+        raise ValueError('Lignes invalides')
+    lignes = appliquer_operations([], [
+        {'op': 'ajouter', 'uid': _dict(ligne, 'Ligne').get('uid'), 'ligne': ligne} for ligne in lignes
+    ])
+
+    existant = brouillon_en_cours(utilisateur, devis_id)
+    if existant is not None:
+        raise BrouillonExistant(existant)
+    brouillon = BrouillonDevis(utilisateur=utilisateur, devis_id=devis_id, version=0, lignes=lignes,
+                               champs=_champs(champs))
+    db.session.add(brouillon)
+    db.session.flush()
+    return brouillon
+
+
+def enregistrer_operations(brouillon, version, operations, champs=None):
+    """Applique un envoi du formulaire si le brouillon est toujours à `version`, sans commit
+
+    La mise à jour est conditionnelle : de deux envois concurrents fondés
+    sur la même version, un seul passe, même depuis deux workers.
+
+    Args:
+        brouillon: Le brouillon
+        version: Version sur laquelle se fondent les opérations
+        operations: Opérations sur les lignes
+        champs: Autres champs du formulaire (None : inchangés)
+
+    Returns:
+        int: Nouvelle version
+
+    Raises:
+        ConflitVersion: Le brouillon a changé entre-temps
+        ValueError: Opérations ou champs invalides
+    """
+    if version != brouillon.version:
+        raise ConflitVersion()
+
+    valeurs = {'lignes': appliquer_operations(brouillon.lignes, operations), 'version': version + 1,
+               'updated_at': datetime.utcnow()}
+    if champs is not None:
+        valeurs['champs'] = _champs(champs)
+
+    resultat = db.session.execute(
+        db.update(BrouillonDevis)
+        .where(BrouillonDevis.id == brouillon.id, BrouillonDevis.version == version)
+        .values(**valeurs)
+        .execution_options(synchronize_session=False)
+    )
+    if resultat.rowcount != 1:
+        raise ConflitVersion()
+    return version + 1
+
+
+def etat_brouillon(brouillon):
+    """État complet d'un brouillon (réponse en cas de conflit, pour que le navigateur se recale)"""
+    return {'id': brouillon.id, 'version': brouillon.version, 'lignes': brouillon.lignes,
+            'champs': brouillon.champs}
+
+
+def brouillon_en_cours(utilisateur, devis_id):
+    """Brouillon de l'utilisateur pour ce devis (None : nouveau devis), ou None"""
+    return BrouillonDevis.query.filter_by(utilisateur=utilisateur, devis_id=devis_id).first()
+
+
+def lignes_pour_devis(brouillon):
+    """Lignes du brouillon prêtes à enregistrer (déjà normalisées à chaque envoi : montants en Decimal)"""
+    return [
+        {**{champ: valeur for champ, valeur in ligne.items() if champ != 'uid'},
+         'prix_unitaire_ht': to_decimal(ligne['prix_unitaire_ht']),
+         'tva_pourcent': to_decimal(ligne['tva_pourcent'])}
+        for ligne in brouillon.lignes
+    ]
+
+
+@tache('purger-brouillons')
+def purger_brouillons():
+    """Supprime les brouillons abandonnés depuis plus de BROUILLONS_CONSERVATION_JOURS"""
+    limite = datetime.utcnow() - timedelta(days=current_app.config['BROUILLONS_CONSERVATION_JOURS'])
+    resultat = db.session.execute(
+        db.delete(BrouillonDevis)
+        .where(BrouillonDevis.updated_at < limite)
+        .execution_options(synchronize_session=False)
+    )
+    return resultat.rowcount
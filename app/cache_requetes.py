@@ -0,0 +1,226 @@
+"""Cache des résultats de recherche (listes filtrées de devis et de factures)
+
+Les mêmes vues filtrées (devis envoyés, factures en attente...) sont
+réaffichées des dizaines de fois par heure. On garde, par combinaison de
+filtres normalisée, la liste ordonnée des ids trouvés (jamais d'objets ORM) :
+chaque page de la liste (PAR_PAGE documents) relit ses seules lignes par clé
+primaire au lieu de rejouer la recherche.
+
+Invalidation par générations de tables : chaque commit qui écrit dans une
+table incrémente le compteur de cette table (hook after_commit). Une entrée
+n'est valide que si les compteurs des tables dont elle dépend n'ont pas
+bougé depuis son calcul, et pendant REQUETES_CACHE_TTL secondes au plus.
+
+Les compteurs sont partagés entre les workers d'une même machine (fichier
+mappé en mémoire dans le dossier temporaire), ou propres au processus si ce
+fichier est indisponible. Les listes d'ids restent propres à chaque worker.
+
+Avec un réplica, la base lue fait partie de la clé : une liste calculée sur
+un réplica en retard, marquée des générations de la principale, n'est jamais
+servie à un navigateur qui vient d'écrire (il relit la principale pendant
+REPLICA_DELAI_LECTURE, voir app/replica.py).
+"""
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from sqlalchemy import event
+from app.replica import SessionRoutage, BIND_REPLICA, lecture_sur_replica
+
+# Compteurs indexés par crc32(nom de table) % NB_COMPTEURS : une collision ne fait qu'invalider plus souvent
+NB_COMPTEURS = 512
+COMPTEUR = struct.Struct('<Q')
+
+_reglages = {'ttl': 0, 'taille': 0}
+
+
+class _GenerationsLocales:
+    """Compteurs propres au processus (un seul worker, ou pas de fichier partagé)"""
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._compteurs = [0] * NB_COMPTEURS
+
+    def lire(self, positions):
+        return tuple(self._compteurs[position] for position in positions)
+
+    def incrementer(self, positions):
+        with self._verrou:
+            for position in positions:
+                self._compteurs[position] += 1
+
+
+class _GenerationsPartagees:
+    """Compteurs dans un fichier mappé en mémoire, partagés par les processus de la machine
+
+    Le fichier est rouvert dans chaque processus (après un fork, le verrou
+    flock d'un descripteur hérité serait partagé avec le parent).
+    """
+
+    def __init__(self, chemin):
+        import fcntl  # POSIX uniquement : sinon, compteurs locaux
+        self._fcntl = fcntl
+        self._chemin = chemin
+        self._pid = None
+        self._fichier = self._carte = None
+        self._verrou = threading.Lock()
+        self._ouvrir()
+
+    def _ouvrir(self):
+        fichier = open(self._chemin, 'a+b')
+        if os.fstat(fichier.fileno()).st_size < NB_COMPTEURS * COMPTEUR.size:
+            fichier.truncate(NB_COMPTEURS * COMPTEUR.size)
+        self._fichier = fichier
+        self._carte = mmap.mmap(fichier.fileno(), NB_COMPTEURS * COMPTEUR.size)
+        self._pid = os.getpid()
+
+    def _verifier_processus(self):
+        if self._pid != os.getpid():
+            with self._verrou:
+                if self._pid != os.getpid():
+                    self._ouvrir()
+
+    def lire(self, positions):
+        self._verifier_processus()
+        return tuple(COMPTEUR.unpack_from(self._carte, position * COMPTEUR.size)[0] for position in positions)
+
+    def incrementer(self, positions):
+        self._verifier_processus()
+        with self._verrou:
+            self._fcntl.flock(self._fichier, self._fcntl.LOCK_EX)
+            try:
+                for position in positions:
+                    decalage = position * COMPTEUR.size
+                    COMPTEUR.pack_into(self._carte, decalage, COMPTEUR.unpack_from(self._carte, decalage)[0] + 1)
+            finally:
+                self._fcntl.flock(self._fichier, self._fcntl.LOCK_UN)
+
+
+_generations = _GenerationsLocales()
+
+_verrou = threading.Lock()
+_entrees = OrderedDict()  # clé -> (instant de calcul, générations, résultat)
+
+
+def _position(table):
+    return zlib.crc32(table.encode()) % NB_COMPTEURS
+
+
+def _nom_table(cible):
+    """Nom de table d'un modèle, d'une Table ou d'un nom"""
+    if isinstance(cible, str):
+        return cible
+    return getattr(cible, '__table__', cible).name
+
+
+def resultats_en_cache(nom, parametres, tables, calculer):
+    """Résultat d'une recherche (liste d'ids), servi depuis le cache s'il est encore valide
+
+    Args:
+        nom: Nom de la recherche (ex: 'devis_liste')
+        parametres: dict des filtres ; les valeurs vides sont ignorées et le texte
+                    mis en minuscules (les recherches sont insensibles à la casse)
+        tables: Modèles dont le résultat dépend (une écriture dans l'un d'eux l'invalide)
+        calculer: Fonction sans argument qui exécute la recherche et retourne une liste d'ids
+                  (ou un agrégat, ex: total de la recherche)
+
+    Returns:
+        Résultat de `calculer` (à ne pas modifier : partagé avec les requêtes suivantes
+        lues sur la même base, principale ou réplica)
+    """
+    if not _reglages['ttl']:
+        return calculer()
+
+    base = BIND_REPLICA if lecture_sur_replica() else None
+    cle = (nom, base, tuple(sorted(
+        (champ, valeur.strip().lower() if isinstance(valeur, str) else valeur)
+        for champ, valeur in parametres.items() if valeur not in (None, '', False)
+    )))
+    positions = tuple(sorted({_position(_nom_table(table)) for table in tables}))
+    # Générations lues avant le calcul : un commit concurrent rendra l'entrée obsolète
+    generations = _generations.lire(positions)
+
+    with _verrou:
+        entree = _entrees.get(cle)
+        if entree is not None and entree[1] == generations and time.monotonic() - entree[0] < _reglages['ttl']:
+            _entrees.move_to_end(cle)
+            return entree[2]
+
+    resultat = calculer()
+
+    with _verrou:
+        _entrees[cle] = (time.monotonic(), generations, resultat)
+        _entrees.move_to_end(cle)
+        while len(_entrees) > _reglages['taille']:
+            _entrees.popitem(last=False)
+    return resultat
+
+
+def vider_cache_requetes():
+    """Oublie tous les résultats de ce processus"""
+    with _verrou:
+        _entrees.clear()
+
+
+# ========== SUIVI DES ÉCRITURES ==========
+
+def _noter_tables(session, noms):
+    session.info.setdefault('tables_ecrites', set()).update(noms)
+
+
+@event.listens_for(SessionRoutage, 'after_flush')
+def _noter_flush(session, flush_context):
+    """Tables des objets insérés, modifiés ou supprimés par l'ORM"""
+    _noter_tables(session, {
+        table.name
+        for objet in (*session.new, *session.dirty, *session.deleted)
+        for table in type(objet).__mapper__.tables
+    })
+
+
+@event.listens_for(SessionRoutage, 'do_orm_execute')
+def _noter_instruction(etat):
+    """Tables des INSERT / UPDATE / DELETE ensemblistes (archivage, tâches, duplication...)"""
+    if etat.is_insert or etat.is_update or etat.is_delete:
+        table = getattr(etat.statement, 'table', None)
+        if table is not None:
+            _noter_tables(etat.session, {table.name})
+
+
+@event.listens_for(SessionRoutage, 'after_commit')
+def _publier_generations(session):
+    tables = session.info.pop('tables_ecrites', None)
+    if tables:
+        _generations.incrementer(sorted({_position(table) for table in tables}))
+
+
+@event.listens_for(SessionRoutage, 'after_rollback')
+def _oublier_tables(session):
+    session.info.pop('tables_ecrites', None)
+
+
+def register_cache_requetes(app):
+    """Configure le cache (REQUETES_CACHE_TTL, 0 pour le désactiver) et partage les générations
+
+    Args:
+        app: L'instance Flask
+    """
+    global _generations
+    _reglages['ttl'] = app.config['REQUETES_CACHE_TTL']
+    _reglages['taille'] = app.config['REQUETES_CACHE_TAILLE']
+    if not _reglages['ttl']:
+        return
+
+    # Un fichier par base : deux applications de la machine ne s'invalident pas mutuellement
+    empreinte = hashlib.sha1(app.config['SQLALCHEMY_DATABASE_URI'].encode()).hexdigest()[:12]
+    chemin = os.path.join(tempfile.gettempdir(), f'mb-app-generations-{empreinte}')
+    try:
+        _generations = _GenerationsPartagees(chemin)
+    except (ImportError, OSError, ValueError) as e:
+        app.logger.warning(f'Générations du cache non partagées entre workers ({e}) : TTL seul entre processus')
+        _generations = _GenerationsLocales()
@@ -0,0 +1,120 @@
+"""Calcul des totaux de devis (source de vérité côté serveur)"""
+from functools import lru_cache
+from app.montants import to_decimal, arrondir, ZERO, POURCENTAGE_MAX, MontantInvalide
+
+# Plus grande quantité d'une ligne (colonne Integer)
+QUANTITE_MAX = 2 ** 31 - 1
+
+
+def normaliser_ligne(ligne_data):
+    """Convertit une ligne brute (dict JSON du formulaire) en valeurs typées
+
+    Args:
+        ligne_data: dict avec quantite, prix_unitaire_ht, tva_pourcent...
+
+    Returns:
+        dict avec quantite (int), prix_unitaire_ht et tva_pourcent (Decimal)
+
+    Raises:
+        MontantInvalide: Quantité, prix ou taux de TVA trop grand pour la base
+    """
+    try:
+        quantite = int(to_decimal(ligne_data.get('quantite'), defaut=1))
+    except (ValueError, ArithmeticError):
+        quantite = 1
+    if abs(quantite) > QUANTITE_MAX:
+        raise MontantInvalide(f'Quantité trop grande (maximum {QUANTITE_MAX})')
+    return {
+        'tache': ligne_data.get('tache', ''),
+        'vehicule': ligne_data.get('vehicule', ''),
+        'description': ligne_data.get('description', ''),
+        'quantite': quantite,
+        'unite': ligne_data.get('unite', ''),
+        'prix_unitaire_ht': arrondir(ligne_data.get('prix_unitaire_ht')),
+        'tva_pourcent': arrondir(ligne_data.get('tva_pourcent'), POURCENTAGE_MAX),
+    }
+
+
+def calculer_totaux_lignes(lignes, remise_pourcent):
+    """Calcule les totaux par ligne, par taux de TVA et globaux
+
+    Les lignes sont réduites à des tuples (prix, quantité, TVA) pour profiter
+    du cache : le même brouillon envoyé par l'API de recalcul puis au moment
+    de l'enregistrement n'est calculé qu'une fois si les deux requêtes
+    arrivent au même worker (le cache est propre à chaque processus).
+
+    La remise est arrondie au centime comme la colonne Numeric(5, 2) : un
+    devis relu donne les mêmes totaux qu'à l'enregistrement.
+
+    Args:
+        lignes: Itérable de dicts (normalisés) ou d'objets DevisLigne
+        remise_pourcent: Remise globale en pourcentage
+
+    Returns:
+        dict (partagé par le cache, ne pas modifier) avec les clés
+        lignes, par_taux, total_ht_brut, montant_remise, total_ht,
+        total_tva et total_ttc
+
+    Raises:
+        MontantInvalide: Remise ou total trop grand pour la base
+    """
+    cle = tuple(
+        (to_decimal(_champ(ligne, 'prix_unitaire_ht')),
+         int(_champ(ligne, 'quantite') or 0),
+         to_decimal(_champ(ligne, 'tva_pourcent')))
+        for ligne in lignes
+    )
+    return _calculer(cle, arrondir(remise_pourcent, POURCENTAGE_MAX))
+
+
+def _champ(ligne, nom):
+    """Lit un champ sur un dict ou sur un objet modèle"""
+    return ligne.get(nom) if isinstance(ligne, dict) else getattr(ligne, nom)
+
+
+@lru_cache(maxsize=256)
+def _calculer(cle, remise_pourcent):
+    """Calcul effectif, mémorisé sur l'entrée canonique
+
+    Passe unique sur les lignes : le HT est cumulé par taux de TVA, puis
+    remise et TVA sont appliquées une seule fois par taux (et non par ligne).
+    En Decimal exact le résultat est identique au calcul ligne par ligne.
+    """
+    coef_remise = 1 - remise_pourcent / 100
+    lignes = []
+    base_par_taux = {}
+
+    for prix, quantite, tva in cle:
+        montant_ht = prix * quantite
+        base_par_taux[tva] = base_par_taux.get(tva, ZERO) + montant_ht
+        lignes.append({
+            'montant_ht': arrondir(montant_ht),
+            # TTC de la ligne hors remise (affiché dans le tableau des lignes)
+            'total_ttc': arrondir(montant_ht * (1 + tva / 100)),
+        })
+
+    total_ht_brut = ZERO
+    total_ht = ZERO
+    total_tva = ZERO
+    par_taux = []
+    for tva, base_brute in sorted(base_par_taux.items()):
+        base_ht = base_brute * coef_remise
+        montant_tva = base_ht * tva / 100
+        total_ht_brut += base_brute
+        total_ht += base_ht
+        total_tva += montant_tva
+        par_taux.append({
+            'tva_pourcent': tva,
+            'base_ht': arrondir(base_ht),
+            'montant_tva': arrondir(montant_tva),
+        })
+
+    return {
+        'lignes': lignes,
+        'par_taux': par_taux,
+        'total_ht_brut': arrondir(total_ht_brut),
+        'montant_remise': arrondir(total_ht_brut - total_ht),
+        'total_ht': arrondir(total_ht),
+        'total_tva': arrondir(total_tva),
+        'total_ttc': arrondir(total_ht + total_tva),
+    }
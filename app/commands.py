@@ -0,0 +1,310 @@
+"""Commandes CLI de maintenance (flask <commande>)"""
+import click
+from app import db
+from app.models import Client, Utilisateur, Evenement, normaliser_recherche
+from app.auth import definir_mot_de_passe, generer_jeton_api
+from app.archivage import archiver, TAILLE_LOT
+from app.resume_clients import reconstruire_resumes
+from app.taches import TACHES, executer
+from app.modules_differes import emails
+from app.evenements import PUITS, diffuser, exporter, lire_export, rapport_mensuel, en_dict
+
+
+# Colonnes monétaires passées de FLOAT à NUMERIC (table -> [(colonne, type SQL)])
+COLONNES_MONTANTS = {
+    'prix_catalogue': [('prix', 'NUMERIC(12, 2)')],
+    'devis': [
+        ('total_ht', 'NUMERIC(12, 2)'),
+        ('total_ttc', 'NUMERIC(12, 2)'),
+        ('remise_pourcent', 'NUMERIC(5, 2)'),
+        ('acompte', 'NUMERIC(12, 2)'),
+    ],
+    'devis_lignes': [
+        ('prix_unitaire_ht', 'NUMERIC(12, 2)'),
+        ('tva_pourcent', 'NUMERIC(5, 2)'),
+        ('total_ttc', 'NUMERIC(12, 2)'),
+    ],
+    'factures': [
+        ('montant_ttc', 'NUMERIC(12, 2)'),
+        ('acompte', 'NUMERIC(12, 2)'),
+        ('reste_a_payer', 'NUMERIC(12, 2)'),
+    ],
+}
+
+
+def register_commands(app):
+    """Enregistre les commandes CLI de l'application
+
+    Args:
+        app: L'instance Flask
+    """
+
+    @app.cli.command('migrer-montants')
+    @click.option('--corriger-soldes', is_flag=True,
+                  help="Remettre à 0 le reste à payer des factures 'Payé' qui en ont encore un")
+    def migrer_montants(corriger_soldes):
+        """Convertit les montants FLOAT existants en NUMERIC arrondi au centime
+
+        PostgreSQL : change le type des colonnes (ALTER COLUMN ... TYPE NUMERIC).
+        SQLite : il n'existe pas de type décimal exact (une colonne NUMERIC
+        range 12.34 en REAL, comme une colonne FLOAT) : les valeurs sont
+        seulement arrondies en place, et restent des flottants binaires que
+        SQLAlchemy relit en Decimal arrondi au centime. Pour des montants
+        exacts en base, utiliser PostgreSQL.
+
+        Les factures 'Payé' dont le reste à payer n'est pas nul (tolérance
+        float de l'ancien calcul) sont listées ; --corriger-soldes le remet à 0.
+        """
+        dialecte = db.engine.dialect.name
+
+        with db.engine.begin() as conn:
+            for table, colonnes in COLONNES_MONTANTS.items():
+                for colonne, type_sql in colonnes:
+                    if dialecte == 'postgresql':
+                        conn.execute(db.text(
+                            f'ALTER TABLE {table} ALTER COLUMN {colonne} '
+                            f'TYPE {type_sql} USING ROUND({colonne}::numeric, 2)'
+                        ))
+                    else:
+                        conn.execute(db.text(
+                            f'UPDATE {table} SET {colonne} = ROUND({colonne}, 2) '
+                            f'WHERE {colonne} IS NOT NULL'
+                        ))
+                click.echo(f'✅ {table} : {len(colonnes)} colonne(s) migrée(s)')
+
+            if dialecte != 'postgresql':
+                click.echo(f'⚠️  {dialecte} : pas de type décimal exact, les montants sont arrondis au centime '
+                           'mais restent stockés en virgule flottante (voir flask migrer-montants --help)')
+
+            soldes = conn.execute(db.text(
+                "SELECT id, numero, reste_a_payer FROM factures "
+                "WHERE etat_paiement = 'Payé' AND reste_a_payer <> 0 ORDER BY id"
+            )).all()
+            for facture_id, numero, reste in soldes:
+                click.echo(f"  Facture {numero} (id {facture_id}) : 'Payé' avec un reste à payer de {reste} €")
+            if soldes and corriger_soldes:
+                conn.execute(db.text(
+                    "UPDATE factures SET reste_a_payer = 0 "
+                    "WHERE etat_paiement = 'Payé' AND reste_a_payer <> 0"
+                ))
+                click.echo(f'✅ {len(soldes)} facture(s) payée(s) : reste à payer remis à 0')
+            elif soldes:
+                click.echo(f'{len(soldes)} facture(s) payée(s) avec un reste à payer non nul, laissée(s) telle(s) '
+                           'quelle(s) : relancer avec --corriger-soldes pour le remettre à 0')
+
+        click.echo('Migration des montants terminée.')
+
+    @app.cli.command('ajouter-colonnes')
+    def ajouter_colonnes():
+        """Ajoute aux tables existantes les colonnes déclarées dans les modèles qui manquent
+
+        db.create_all() ne modifie pas une table existante. Les colonnes ajoutées
+        reprennent leur valeur par défaut SQL (server_default) si elle existe.
+        """
+        inspecteur = db.inspect(db.engine)
+        dialecte = db.engine.dialect
+        tables_existantes = set(inspecteur.get_table_names())
+        ajoutees = 0
+
+        with db.engine.begin() as conn:
+            for table in db.metadata.sorted_tables:
+                if table.name not in tables_existantes:
+                    continue
+                presentes = {colonne['name'] for colonne in inspecteur.get_columns(table.name)}
+                for colonne in table.columns:
+                    if colonne.name in presentes:
+                        continue
+                    ddl = f'ALTER TABLE {table.name} ADD COLUMN {colonne.name} {colonne.type.compile(dialect=dialecte)}'
+                    if colonne.server_default is not None:
+                        defaut = colonne.server_default.arg
+                        defaut = f"'{defaut}'" if isinstance(defaut, str) else defaut.compile(dialect=dialecte)
+                        ddl += f' DEFAULT {defaut}'
+                        if not colonne.nullable:
+                            ddl += ' NOT NULL'
+                    conn.execute(db.text(ddl))
+                    click.echo(f'✅ {table.name}.{colonne.name} ajoutée')
+                    ajoutees += 1
+
+        click.echo(f'{ajoutees} colonne(s) ajoutée(s).')
+
+    @app.cli.command('creer-index')
+    def creer_index():
+        """Crée les index déclarés dans les modèles qui manquent en base
+
+        db.create_all() ne crée les index qu'avec les nouvelles tables : cette
+        commande les ajoute aux tables existantes (sans toucher aux autres).
+        """
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(db.engine, checkfirst=True)
+            if table.indexes:
+                click.echo(f'✅ {table.name} : {len(table.indexes)} index vérifié(s)')
+
+        click.echo('Index à jour.')
+
+    @app.cli.command('normaliser-clients')
+    def normaliser_clients():
+        """Remplit les colonnes de recherche (nom_recherche, entreprise_recherche) des clients existants
+
+        Les clients créés ou modifiés par l'application les tiennent à jour ;
+        à lancer une fois après flask ajouter-colonnes.
+        """
+        modifies = 0
+        for client in Client.query.yield_per(500):
+            attendu = (normaliser_recherche(client.nom), normaliser_recherche(client.entreprise))
+            if (client.nom_recherche, client.entreprise_recherche) != attendu:
+                client.nom_recherche, client.entreprise_recherche = attendu
+                modifies += 1
+        db.session.commit()
+        click.echo(f'✅ {modifies} client(s) mis à jour')
+
+    @app.cli.command('utilisateur-creer')
+    @click.argument('username')
+    @click.option('--role', type=click.Choice(Utilisateur.ROLES), default='technicien', show_default=True)
+    @click.password_option('--mot-de-passe', prompt='Mot de passe')
+    def utilisateur_creer(username, role, mot_de_passe):
+        """Crée un compte utilisateur"""
+        if Utilisateur.query.filter_by(username=username).first():
+            raise click.ClickException(f"L'utilisateur {username} existe déjà")
+
+        utilisateur = Utilisateur(username=username, role=role)
+        definir_mot_de_passe(utilisateur, mot_de_passe)
+        db.session.add(utilisateur)
+        db.session.commit()
+        click.echo(f'✅ Utilisateur {username} créé ({role})')
+
+    @app.cli.command('utilisateur-modifier')
+    @click.argument('username')
+    @click.option('--role', type=click.Choice(Utilisateur.ROLES), help='Nouveau rôle')
+    @click.option('--mot-de-passe', is_flag=True, help='Demander un nouveau mot de passe')
+    @click.option('--actif/--inactif', default=None, help='Activer ou désactiver le compte')
+    def utilisateur_modifier(username, role, mot_de_passe, actif):
+        """Change le rôle, le mot de passe ou l'état d'un compte
+
+        Les workers en cours prennent le changement en compte au plus tard
+        après USER_CACHE_TTL secondes (cache du chargement de session).
+        """
+        utilisateur = Utilisateur.query.filter_by(username=username).first()
+        if utilisateur is None:
+            raise click.ClickException(f"L'utilisateur {username} n'existe pas")
+
+        if role:
+            utilisateur.role = role
+        if mot_de_passe:
+            definir_mot_de_passe(utilisateur, click.prompt('Nouveau mot de passe', hide_input=True,
+                                                           confirmation_prompt=True))
+        if actif is not None:
+            utilisateur.actif = actif
+        db.session.commit()
+        click.echo(f'✅ Utilisateur {username} mis à jour')
+
+    @app.cli.command('utilisateur-jeton')
+    @click.argument('username')
+    @click.option('--revoquer', is_flag=True, help='Supprimer le jeton sans en créer un nouveau')
+    def utilisateur_jeton(username, revoquer):
+        """Crée (ou révoque) le jeton d'API d'un compte
+
+        Le jeton s'utilise dans l'en-tête Authorization: Bearer <jeton> des
+        appels à /api/v1. Il n'est affiché qu'une fois : seule son empreinte est stockée.
+        """
+        utilisateur = Utilisateur.query.filter_by(username=username).first()
+        if utilisateur is None:
+            raise click.ClickException(f"L'utilisateur {username} n'existe pas")
+
+        if revoquer:
+            utilisateur.api_token_hash = None
+            db.session.commit()
+            click.echo(f'✅ Jeton d\'API de {username} révoqué')
+            return
+
+        jeton = generer_jeton_api(utilisateur)
+        db.session.commit()
+        click.echo(f'✅ Nouveau jeton d\'API de {username} (l\'ancien ne fonctionne plus) :')
+        click.echo(jeton)
+
+    @app.cli.command('archiver')
+    @click.option('--age-jours', type=int, help='Âge minimum des documents (défaut : ARCHIVE_APRES_JOURS)')
+    @click.option('--taille-lot', type=int, default=TAILLE_LOT, show_default=True,
+                  help='Nombre de devis déplacés par transaction')
+    @click.option('--simulation', is_flag=True, help='Compter les documents archivables sans les déplacer')
+    def archiver_documents(age_jours, taille_lot, simulation):
+        """Déplace les devis refusés/expirés et les factures payées anciens vers les archives"""
+        age_jours = age_jours or app.config['ARCHIVE_APRES_JOURS']
+        nombre = archiver(age_jours, taille_lot, simulation)
+
+        if simulation:
+            click.echo(f'{nombre} devis archivable(s) (plus de {age_jours} jours)')
+        else:
+            click.echo(f'✅ {nombre} devis archivé(s) avec leurs lignes et factures')
+
+    @app.cli.command('reparer-resumes')
+    def reparer_resumes():
+        """Recalcule les compteurs de tous les clients (table clients_resume)
+
+        À lancer après une reprise de données ou si les compteurs ont divergé.
+        """
+        nombre = reconstruire_resumes()
+        click.echo(f'✅ Compteurs recalculés pour {nombre} client(s)')
+
+    @app.cli.command('taches')
+    @click.argument('noms', nargs=-1, type=click.Choice(list(TACHES)))
+    def lancer_taches(noms):
+        """Exécute les tâches planifiées (toutes, ou celles nommées)
+
+        Exemple de cron : 0 * * * * flask taches
+        """
+        for nom in noms or TACHES:
+            nombre = executer(app, nom)
+            if nombre is None:
+                raise click.ClickException(f'La tâche {nom} a échoué (voir les logs)')
+            click.echo(f'✅ {nom} : {nombre} ligne(s) modifiée(s)')
+
+    @app.cli.command('emails')
+    @click.option('--relances', is_flag=True, help='Mettre d\'abord en file une relance par facture en retard')
+    def envoyer_emails(relances):
+        """Envoie les emails en attente (boîte d'envoi) par lots
+
+        Utile avec EMAIL_ENVOI_AUTO=False, via cron : */5 * * * * flask emails
+        """
+        if relances:
+            nombre = emails.relancer_factures_impayees()
+            db.session.commit()
+            click.echo(f'{nombre} relance(s) mise(s) en file')
+
+        envoyes, echecs = emails.vider_file(app)
+        click.echo(f'✅ {envoyes} email(s) envoyé(s), {echecs} en échec')
+
+    @app.cli.command('evenements-diffuser')
+    def evenements_diffuser():
+        """Transmet les nouveaux événements aux puits configurés (EVENEMENTS_PUITS)
+
+        Utile avec EVENEMENTS_DIFFUSION_AUTO=False, via cron : * * * * * flask evenements-diffuser
+        """
+        inconnus = [nom for nom in app.config['EVENEMENTS_PUITS'] if nom not in PUITS]
+        if inconnus:
+            raise click.ClickException(f'Puits inconnu(s) : {", ".join(inconnus)} (disponibles : {", ".join(PUITS)})')
+        for nom, nombre in diffuser(app).items():
+            click.echo(f'✅ {nom} : {nombre} événement(s) transmis')
+
+    @app.cli.command('evenements-exporter')
+    @click.argument('fichier')
+    @click.option('--depuis', type=int, default=0, help='Exporter les événements d\'id supérieur (incrémental)')
+    @click.option('--type', 'types', multiple=True, help='Type à exporter (répétable), ex: facture.paiement')
+    def evenements_exporter(fichier, depuis, types):
+        """Exporte le journal des événements en JSON lines (compressé si FICHIER finit par .gz)"""
+        nombre, dernier_id = exporter(fichier, depuis_id=depuis, types=types)
+        click.echo(f'✅ {nombre} événement(s) exporté(s) dans {fichier} (dernier id : {dernier_id})')
+
+    @app.cli.command('evenements-rapport')
+    @click.argument('fichier', required=False)
+    def evenements_rapport(fichier):
+        """Reconstruit l'activité mensuelle en rejouant les événements (export FICHIER, sinon la base)"""
+        if fichier:
+            evenements = lire_export(fichier)
+        else:
+            evenements = (en_dict(evenement) for evenement in Evenement.query.order_by(Evenement.id).yield_per(1000))
+
+        click.echo(f'{"Mois":<9}{"Devis":>7}{"Acceptés":>10}{"Factures":>10}{"Facturé TTC":>15}{"Encaissé":>15}')
+        for mois, ligne in rapport_mensuel(evenements).items():
+            click.echo(f'{mois:<9}{ligne["devis_crees"]:>7}{ligne["devis_acceptes"]:>10}{ligne["factures_emises"]:>10}'
+                       f'{ligne["facture"]:>15}{ligne["encaisse"]:>15}')
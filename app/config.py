@@ -1,9 +1,13 @@
 """Configuration de l'application Flask"""
 import os
-from dotenv import load_dotenv
 
-# Charger les variables d'environnement depuis le fichier .env
-load_dotenv()
+# Charger les variables d'environnement depuis le fichier .env à la racine du projet
+# (chemin explicite : pas de recherche dans les dossiers parents ; en production,
+# sans fichier .env, python-dotenv n'est même pas importé)
+FICHIER_ENV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env')
+if os.path.exists(FICHIER_ENV):
+    from dotenv import load_dotenv
+    load_dotenv(FICHIER_ENV)
 
 class Config:
     """Configuration de base"""
@@ -11,7 +15,7 @@ class Config:
     # Clé secrète pour les sessions et CSRF
     SECRET_KEY = os.environ.get('SECRET_KEY')
     
-    # Identifiants admin (pour l'authentification simple)
+    # Compte admin initial (créé dans la table users au premier démarrage)
     ADMIN_USERNAME = os.environ.get('ADMIN_USERNAME')
     ADMIN_PASSWORD_HASH = os.environ.get('ADMIN_PASSWORD_HASH')
 
@@ -29,8 +33,28 @@ class Config:
         DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
     
     SQLALCHEMY_DATABASE_URI = DATABASE_URL
+    
+    # Réplica en lecture seule (optionnel) pour les listes, recherches et PDF
+    REPLICA_DATABASE_URL = os.environ.get('REPLICA_DATABASE_URL')
+    if REPLICA_DATABASE_URL and REPLICA_DATABASE_URL.startswith('postgres://'):
+        REPLICA_DATABASE_URL = REPLICA_DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+    SQLALCHEMY_BINDS = {'replica': REPLICA_DATABASE_URL} if REPLICA_DATABASE_URL else {}
+    
+    # Après une écriture, le navigateur lit sur la base principale pendant ce délai (retard du réplica)
+    REPLICA_DELAI_LECTURE = int(os.environ.get('REPLICA_DELAI_LECTURE') or 5)  # secondes
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # SQLite en production : WAL, busy_timeout, mmap... appliqués à chaque connexion (voir app/profil_sqlite.py)
+    SQLITE_OPTIMISATIONS = os.environ.get('SQLITE_OPTIMISATIONS', 'True').lower() in ('1', 'true', 'yes')
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000)  # ms d'attente du verrou d'écriture
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024)  # octets lus via mmap
+    SQLITE_CACHE_KO = int(os.environ.get('SQLITE_CACHE_KO') or 64 * 1024)  # cache de pages par connexion
+    SQLITE_TAILLE_WAL_MAX = int(os.environ.get('SQLITE_TAILLE_WAL_MAX') or 64 * 1024 * 1024)  # octets
+    
+    # Cache des listes filtrées de devis et factures (ids), invalidé à chaque écriture ; 0 pour désactiver
+    REQUETES_CACHE_TTL = int(os.environ.get('REQUETES_CACHE_TTL') or 30)  # secondes
+    REQUETES_CACHE_TAILLE = int(os.environ.get('REQUETES_CACHE_TAILLE') or 256)  # recherches gardées par worker
+    
     # Sécurité des cookies de session
     SESSION_COOKIE_HTTPONLY = True  # Empêche JavaScript d'accéder au cookie
     SESSION_COOKIE_SAMESITE = 'Lax'  # Protection CSRF supplémentaire
@@ -40,13 +64,63 @@ class Config:
     if os.environ.get('RAILWAY_ENVIRONMENT'):
         SESSION_COOKIE_SECURE = True  # Cookie uniquement via HTTPS
     
-    # Configuration email (optionnel pour l'instant)
+    # Nombre de proxys de confiance devant l'application (1 sur Railway) : X-Forwarded-For et
+    # X-Forwarded-Proto sont lus (ProxyFix) pour connaître la vraie IP du client ; 0 sans proxy
+    PROXIES_DE_CONFIANCE = int(os.environ.get('PROXIES_DE_CONFIANCE') or (1 if os.environ.get('RAILWAY_ENVIRONMENT') else 0))
+    
+    # Configuration email (envoi des devis, factures et relances)
     MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'smtp.gmail.com'
     MAIL_PORT = int(os.environ.get('MAIL_PORT') or 587)
-    MAIL_USE_TLS = True
+    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'True').lower() in ('1', 'true', 'yes')
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER')
     
+    # Boîte d'envoi : thread d'envoi dans chaque worker (sinon : flask emails via cron)
+    # Désactivé par défaut (commandes flask, scripts) : gunicorn.conf.py l'active pour le serveur
+    EMAIL_ENVOI_AUTO = os.environ.get('EMAIL_ENVOI_AUTO', 'False').lower() in ('1', 'true', 'yes')
+    EMAIL_INTERVALLE = int(os.environ.get('EMAIL_INTERVALLE') or 30)  # secondes entre deux relectures de la file
+    EMAIL_TAILLE_LOT = int(os.environ.get('EMAIL_TAILLE_LOT') or 20)  # emails par connexion SMTP
+    EMAIL_MAX_TENTATIVES = int(os.environ.get('EMAIL_MAX_TENTATIVES') or 5)
+    EMAIL_DELAI_RETRY = int(os.environ.get('EMAIL_DELAI_RETRY') or 60)  # secondes, doublé à chaque échec
+    
+    # Journal des événements métier : diffusion par un thread (un seul worker actif) vers les puits listés
+    # Puits disponibles : journal (fichier de log), fichier (JSON lines dans EVENEMENTS_FICHIER)
+    # Désactivé par défaut (commandes flask, scripts) : gunicorn.conf.py l'active pour le serveur
+    EVENEMENTS_DIFFUSION_AUTO = os.environ.get('EVENEMENTS_DIFFUSION_AUTO', 'False').lower() in ('1', 'true', 'yes')
+    EVENEMENTS_PUITS = [nom.strip() for nom in (os.environ.get('EVENEMENTS_PUITS') or 'journal').split(',') if nom.strip()]
+    EVENEMENTS_FICHIER = os.environ.get('EVENEMENTS_FICHIER')  # ex: logs/evenements.jsonl
+    EVENEMENTS_INTERVALLE = int(os.environ.get('EVENEMENTS_INTERVALLE') or 10)  # secondes
+    EVENEMENTS_TAILLE_LOT = int(os.environ.get('EVENEMENTS_TAILLE_LOT') or 500)
+    # Âge minimum d'un événement avant diffusion : doit dépasser la plus longue transaction
+    # (un id inférieur encore non commité serait sinon sauté par la position du puits)
+    EVENEMENTS_DELAI_STABILISATION = int(os.environ.get('EVENEMENTS_DELAI_STABILISATION') or 30)  # secondes
+    
+    # Moteur PDF : 'xhtml2pdf' (par défaut) ou 'weasyprint'
+    PDF_ENGINE = os.environ.get('PDF_ENGINE', 'xhtml2pdf').lower()
+    if PDF_ENGINE not in ('xhtml2pdf', 'weasyprint'):
+        raise ValueError("PDF_ENGINE doit valoir 'xhtml2pdf' ou 'weasyprint'")
+    
+    # Préchauffage du moteur PDF au démarrage de chaque worker (opt-in)
+    # Le premier PDF a alors la même latence que les suivants, au prix d'un démarrage plus long
+    PDF_WARMUP = os.environ.get('PDF_WARMUP', 'False').lower() in ('1', 'true', 'yes')
+    
+    # Application préchargée dans le maître gunicorn (défini par gunicorn.conf.py si GUNICORN_PRELOAD=True) :
+    # modules lourds chargés avant le fork, threads de fond lancés dans chaque worker après le fork
+    PRELOAD_APP = os.environ.get('PRELOAD_APP', 'False').lower() in ('1', 'true', 'yes')
+    
+    # Archivage des devis/factures clos plus anciens que ce nombre de jours (flask archiver)
+    ARCHIVE_APRES_JOURS = int(os.environ.get('ARCHIVE_APRES_JOURS') or 730)
+    
+    # Délai de paiement des factures : au-delà, la tâche factures-en-retard les signale
+    DELAI_PAIEMENT_JOURS = int(os.environ.get('DELAI_PAIEMENT_JOURS') or 30)
+    
+    # Tâches planifiées dans l'application (sinon : flask taches via cron)
+    TACHES_PLANIFIEES = os.environ.get('TACHES_PLANIFIEES', 'False').lower() in ('1', 'true', 'yes')
+    TACHES_INTERVALLE = int(os.environ.get('TACHES_INTERVALLE') or 3600)  # secondes
+    
+    # Brouillons de devis enregistrés automatiquement : supprimés par la tâche purger-brouillons après ce délai
+    BROUILLONS_CONSERVATION_JOURS = int(os.environ.get('BROUILLONS_CONSERVATION_JOURS') or 30)
+    
     # Limite de taille des requêtes (protection contre saturation)
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max
\ No newline at end of file
@@ -0,0 +1,170 @@
+"""Duplication de devis et modèles de devis (copie des lignes côté serveur)"""
+from datetime import date
+from app import db
+from app.models import Devis, DevisLigne, ModeleDevis, ModeleDevisLigne
+
+# Colonnes communes à DevisLigne et ModeleDevisLigne
+COLONNES_LIGNE = ('tache', 'vehicule', 'description', 'quantite', 'unite',
+                  'prix_unitaire_ht', 'tva_pourcent', 'total_ttc', 'ordre')
+
+# Nombre maximum de devis créés en un seul lot
+TAILLE_LOT_MAX = 200
+
+
+def prochains_numeros_devis(nombre=1):
+    """Génère les prochains numéros de devis (N°001, N°002...)
+
+    Args:
+        nombre: Nombre de numéros consécutifs à réserver
+
+    Returns:
+        Liste de numéros
+    """
+    dernier_devis = Devis.query.order_by(Devis.id.desc()).first()
+    dernier_num = 0
+    if dernier_devis and dernier_devis.numero:
+        # Extraire le numéro et incrémenter
+        try:
+            dernier_num = int(dernier_devis.numero.replace('N°', ''))
+        except (ValueError, AttributeError):
+            dernier_num = 0
+    return [f"N°{str(dernier_num + i).zfill(3)}" for i in range(1, nombre + 1)]
+
+
+def parser_numeros_serie(texte):
+    """Découpe un champ texte (un numéro de série / immatriculation par ligne)
+
+    Args:
+        texte: Contenu du textarea
+
+    Returns:
+        Liste des numéros non vides, dans l'ordre de saisie
+    """
+    return [ligne.strip() for ligne in (texte or '').splitlines() if ligne.strip()]
+
+
+def _copier_lignes_vers_devis(colonne_source, id_source, ids_devis):
+    """Copie les lignes d'une source vers plusieurs devis en un seul INSERT ... SELECT
+
+    Le produit (lignes source x devis cibles) est fait par la base : aucune
+    ligne ne transite par Python, quel que soit le nombre de devis.
+
+    Args:
+        colonne_source: Clé étrangère de la table source (DevisLigne.devis_id
+                        ou ModeleDevisLigne.modele_id)
+        id_source: Identifiant du devis / modèle source
+        ids_devis: Identifiants des devis cibles (déjà insérés)
+    """
+    source = colonne_source.class_
+    # Produit cartésien voulu : jointure explicite sans condition (pas d'avertissement SQLAlchemy)
+    selection = (
+        db.select(Devis.id, *[getattr(source, colonne) for colonne in COLONNES_LIGNE])
+        .select_from(source)
+        .join(Devis, db.true())
+        .where(colonne_source == id_source, Devis.id.in_(ids_devis))
+    )
+
+    db.session.execute(
+        db.insert(DevisLigne).from_select(['devis_id', *COLONNES_LIGNE], selection)
+    )
+
+
+def creer_devis_en_lot(colonne_source, id_source, client_id, numeros_serie, valeurs):
+    """Crée un devis par numéro de série et y copie les lignes de la source
+
+    Tout est fait dans la transaction courante : l'appelant commit (ou rollback).
+
+    Args:
+        colonne_source: Clé étrangère des lignes à copier
+        id_source: Identifiant du devis / modèle source
+        client_id: Client des nouveaux devis
+        numeros_serie: Liste des numéros de série (au moins un élément, None accepté)
+        valeurs: Champs communs (inventaire, remise_pourcent, totaux...)
+
+    Returns:
+        Liste des devis créés
+    """
+    numeros = prochains_numeros_devis(len(numeros_serie))
+    nouveaux = [
+        Devis(numero=numero, date=date.today(), client_id=client_id,
+              numero_serie=numero_serie, statut='brouillon', **valeurs)
+        for numero, numero_serie in zip(numeros, numeros_serie)
+    ]
+    db.session.add_all(nouveaux)
+    db.session.flush()  # Un seul aller-retour pour obtenir les ids
+
+    _copier_lignes_vers_devis(colonne_source, id_source, [d.id for d in nouveaux])
+    return nouveaux
+
+
+def dupliquer_devis(devis, numeros_serie=None):
+    """Duplique un devis (une copie par numéro de série, ou une seule copie)
+
+    Args:
+        devis: Le devis source
+        numeros_serie: Liste de numéros de série, vide pour une copie à l'identique
+
+    Returns:
+        Liste des devis créés
+    """
+    valeurs = {
+        'inventaire': devis.inventaire,
+        'validite_jours': devis.validite_jours,
+        'remise_pourcent': devis.remise_pourcent,
+        'acompte': devis.acompte,
+        # Mêmes lignes et même remise : mêmes totaux, inutile de recalculer
+        'total_ht': devis.total_ht,
+        'total_ttc': devis.total_ttc,
+    }
+    return creer_devis_en_lot(DevisLigne.devis_id, devis.id, devis.client_id,
+                              numeros_serie or [devis.numero_serie], valeurs)
+
+
+def creer_devis_depuis_modele(modele, client_id, numeros_serie=None):
+    """Crée un ou plusieurs devis à partir d'un modèle
+
+    Args:
+        modele: Le ModeleDevis source
+        client_id: Client des nouveaux devis
+        numeros_serie: Liste de numéros de série, vide pour un seul devis
+
+    Returns:
+        Liste des devis créés
+    """
+    valeurs = {
+        'remise_pourcent': modele.remise_pourcent,
+        'total_ht': modele.total_ht,
+        'total_ttc': modele.total_ttc,
+    }
+    return creer_devis_en_lot(ModeleDevisLigne.modele_id, modele.id, client_id,
+                              numeros_serie or [None], valeurs)
+
+
+def enregistrer_comme_modele(devis, nom):
+    """Enregistre les lignes d'un devis comme modèle réutilisable
+
+    Args:
+        devis: Le devis source
+        nom: Nom du modèle
+
+    Returns:
+        Le ModeleDevis créé
+    """
+    modele = ModeleDevis(
+        nom=nom,
+        remise_pourcent=devis.remise_pourcent,
+        total_ht=devis.total_ht,
+        total_ttc=devis.total_ttc
+    )
+    db.session.add(modele)
+    db.session.flush()
+
+    selection = db.select(
+        db.literal(modele.id, db.Integer),
+        *[getattr(DevisLigne, colonne) for colonne in COLONNES_LIGNE]
+    ).where(DevisLigne.devis_id == devis.id)
+
+    db.session.execute(
+        db.insert(ModeleDevisLigne).from_select(['modele_id', *COLONNES_LIGNE], selection)
+    )
+    return modele
@@ -0,0 +1,297 @@
+"""Envoi asynchrone des devis, factures et relances par email
+
+Les routes ne parlent jamais au serveur SMTP : elles ajoutent une ligne à la
+boîte d'envoi (table emails_sortants) dans leur transaction. La file est
+vidée par lots, une seule connexion SMTP par lot :
+- en continu par un thread de fond dans chaque worker (EMAIL_ENVOI_AUTO) ;
+- ou à la demande : flask emails (cron).
+
+Un lot est réservé par un jeton (colonne reserve_par) : plusieurs workers
+peuvent vider la file en même temps sans envoyer deux fois le même email.
+Un échec est retenté avec un délai doublé à chaque tentative, jusqu'à
+EMAIL_MAX_TENTATIVES ; l'email passe alors en 'echec'.
+"""
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app, render_template
+from app import db
+from app.models import Client, EmailSortant, Devis, DevisArchive, Facture, FactureArchive
+from app.entreprise import get_config_entreprise
+from app.modules_differes import pdf
+
+# Un lot réservé par un worker arrêté en plein envoi redevient disponible après ce délai
+DELAI_RESERVATION = 600  # secondes
+
+# Par nature d'email : modèles (courant, archivé), fonction de rendu de app.pdf, nom de la pièce jointe, sujet
+NATURES = {
+    'devis': ((Devis, DevisArchive), 'pdf_devis', 'Devis_{numero}.pdf', 'Devis {numero}'),
+    'facture': ((Facture, FactureArchive), 'pdf_facture', 'Facture_{numero}.pdf', 'Facture {numero}'),
+    'relance': ((Facture, FactureArchive), 'pdf_facture', 'Facture_{numero}.pdf',
+                'Relance : facture {numero} en attente de paiement'),
+}
+
+# Réveille le thread d'envoi du worker dès qu'un email est mis en file
+_reveil = threading.Event()
+
+
+def mettre_en_file(nature, document, destinataire):
+    """Ajoute un email à la boîte d'envoi (sans commit : fait partie de la transaction en cours)
+
+    Le sujet et le corps (templates emails/<nature>.txt) sont rendus tout de
+    suite ; le PDF joint sera généré au moment de l'envoi.
+
+    Args:
+        nature: 'devis', 'facture' ou 'relance'
+        document: Le devis ou la facture concerné
+        destinataire: Adresse email du destinataire
+
+    Returns:
+        EmailSortant ajouté à la session
+    """
+    config = get_config_entreprise()
+    sujet = NATURES[nature][3].format(numero=document.numero)
+    if config:
+        sujet = f'{sujet} - {config.nom_entreprise}'
+
+    email = EmailSortant(
+        nature=nature,
+        document_id=document.id,
+        destinataire=destinataire,
+        sujet=sujet,
+        corps=render_template(f'emails/{nature}.txt', document=document, config=config),
+    )
+    db.session.add(email)
+    return email
+
+
+def relancer_factures_impayees():
+    """Met en file une relance pour chaque facture en retard dont le client a un email
+
+    Seules les factures marquées en retard par la tâche factures-en-retard
+    (non soldées au-delà de DELAI_PAIEMENT_JOURS) sont relancées ; celles
+    ayant déjà une relance en attente d'envoi sont ignorées.
+
+    Returns:
+        int: Nombre de relances mises en file
+    """
+    relances_en_attente = db.select(EmailSortant.document_id).where(
+        EmailSortant.nature == 'relance', EmailSortant.statut == 'en_attente'
+    )
+    factures = (
+        Facture.query.join(Client)
+        .filter(Facture.etat_paiement != 'Payé', Facture.en_retard.is_(True),
+                Client.email.isnot(None), Client.email != '',
+                Facture.id.not_in(relances_en_attente))
+        .order_by(Facture.id)
+        .all()
+    )
+    for facture in factures:
+        mettre_en_file('relance', facture, facture.client.email)
+    return len(factures)
+
+
+def reveiller_envoi():
+    """Signale au thread d'envoi de ce worker qu'un email attend (à appeler après le commit)"""
+    _reveil.set()
+
+
+def _document(nature, document_id):
+    """Retrouve le devis ou la facture, y compris s'il a été archivé depuis la mise en file"""
+    for modele in NATURES[nature][0]:
+        document = db.session.get(modele, document_id)
+        if document is not None:
+            return document
+    return None
+
+
+def _construire_message(email):
+    """Message Flask-Mail avec le PDF du document en pièce jointe
+
+    Raises:
+        ValueError: Document introuvable, PDF en erreur ou expéditeur non configuré
+    """
+    _, rendu, nom_fichier, _ = NATURES[email.nature]
+    document = _document(email.nature, email.document_id)
+    if document is None:
+        raise ValueError(f'{email.nature} {email.document_id} introuvable')
+
+    contenu = getattr(pdf, rendu)(document)
+    if contenu is None:
+        raise ValueError(f'Erreur lors de la génération du PDF ({email.nature} {document.numero})')
+
+    config = get_config_entreprise()
+    expediteur = current_app.config.get('MAIL_DEFAULT_SENDER') or (config.email if config else None)
+    if not expediteur:
+        raise ValueError('Aucun expéditeur : définir MAIL_DEFAULT_SENDER ou l\'email de l\'entreprise')
+
+    from flask_mail import Message
+
+    message = Message(email.sujet, sender=expediteur, recipients=[email.destinataire], body=email.corps)
+    message.attach(nom_fichier.format(numero=document.numero), 'application/pdf', contenu)
+    return message
+
+
+def _serveur_smtp(app):
+    """Extension Flask-Mail de l'application, initialisée au premier envoi
+
+    flask_mail (smtplib, email.mime...) n'est importé qu'ici et dans
+    _construire_message : le démarrage d'un worker ne le charge pas.
+    """
+    if 'mail' not in app.extensions:
+        from flask_mail import Mail
+        Mail(app)
+    return app.extensions['mail']
+
+
+def precharger(app):
+    """Importe Flask-Mail (et smtplib) et initialise l'extension (préchargement gunicorn)
+
+    Args:
+        app: L'instance Flask
+    """
+    _serveur_smtp(app)
+
+
+def _reserver_lot(taille):
+    """Réserve jusqu'à `taille` emails dus pour ce worker (commit immédiat)
+
+    Returns:
+        list[EmailSortant]: Les emails réservés, compteur de tentatives déjà incrémenté
+    """
+    maintenant = datetime.utcnow()
+    ids = db.session.scalars(
+        db.select(EmailSortant.id)
+        .where(EmailSortant.statut == 'en_attente', EmailSortant.prochain_essai <= maintenant)
+        .order_by(EmailSortant.prochain_essai)
+        .limit(taille)
+    ).all()
+    if not ids:
+        return []
+
+    # La condition sur prochain_essai est réévaluée à l'UPDATE : un autre worker
+    # qui a réservé ces lignes entre-temps les a repoussées dans le futur
+    jeton = uuid.uuid4().hex
+    db.session.execute(
+        db.update(EmailSortant)
+        .where(EmailSortant.id.in_(ids), EmailSortant.statut == 'en_attente',
+               EmailSortant.prochain_essai <= maintenant)
+        .values(reserve_par=jeton, tentatives=EmailSortant.tentatives + 1,
+                prochain_essai=maintenant + timedelta(seconds=DELAI_RESERVATION))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+    return db.session.scalars(
+        db.select(EmailSortant).where(EmailSortant.reserve_par == jeton).order_by(EmailSortant.id)
+    ).all()
+
+
+def _marquer_envoye(email):
+    email.statut = 'envoye'
+    email.envoye_at = datetime.utcnow()
+    email.reserve_par = None
+    email.derniere_erreur = None
+
+
+def _marquer_echec(email, erreur):
+    """Planifie le prochain essai (délai doublé à chaque tentative) ou abandonne"""
+    config = current_app.config
+    email.reserve_par = None
+    email.derniere_erreur = str(erreur)[:1000]
+    if email.tentatives >= config['EMAIL_MAX_TENTATIVES']:
+        email.statut = 'echec'
+        current_app.logger.error(f'❌ Email {email.id} ({email.nature} -> {email.destinataire}) abandonné '
+                                 f'après {email.tentatives} tentatives : {erreur}')
+    else:
+        delai = config['EMAIL_DELAI_RETRY'] * 2 ** (email.tentatives - 1)
+        email.prochain_essai = datetime.utcnow() + timedelta(seconds=delai)
+        current_app.logger.warning(f'Email {email.id} en échec (tentative {email.tentatives}), '
+                                   f'nouvel essai dans {delai} s : {erreur}')
+
+
+def envoyer_lot(app, taille=None):
+    """Envoie un lot d'emails dus sur une seule connexion SMTP
+
+    Chaque email est commité dès son envoi : un arrêt en cours de lot ne
+    renvoie pas les emails déjà partis.
+
+    Args:
+        app: L'instance Flask
+        taille: Nombre maximum d'emails (défaut : EMAIL_TAILLE_LOT)
+
+    Returns:
+        tuple: (nombre envoyés, nombre en échec)
+    """
+    with app.app_context():
+        emails = _reserver_lot(taille or app.config['EMAIL_TAILLE_LOT'])
+        if not emails:
+            return 0, 0
+
+        debut = time.perf_counter()
+        envoyes = echecs = 0
+        try:
+            with _serveur_smtp(app).connect() as connexion:
+                for email in emails:
+                    try:
+                        connexion.send(_construire_message(email))
+                    except Exception as e:
+                        _marquer_echec(email, e)
+                        echecs += 1
+                    else:
+                        _marquer_envoye(email)
+                        envoyes += 1
+                    db.session.commit()
+        except Exception as e:
+            # Connexion SMTP impossible (ou perdue) : le reste du lot est retenté plus tard
+            for email in emails:
+                if email.reserve_par is not None:
+                    _marquer_echec(email, e)
+                    echecs += 1
+            db.session.commit()
+
+        app.logger.info(f'📧 Lot d\'emails : {envoyes} envoyé(s), {echecs} en échec '
+                        f'en {(time.perf_counter() - debut) * 1000:.0f} ms')
+        return envoyes, echecs
+
+
+def vider_file(app):
+    """Envoie les emails dus lot par lot jusqu'à ce que la file soit vide ou ne contienne que des échecs
+
+    Returns:
+        tuple: (nombre envoyés, nombre en échec)
+    """
+    total_envoyes = total_echecs = 0
+    while True:
+        envoyes, echecs = envoyer_lot(app)
+        total_envoyes += envoyes
+        total_echecs += echecs
+        # Lot vide, ou lot sans aucun succès (serveur SMTP indisponible) : on s'arrête
+        if envoyes == 0:
+            return total_envoyes, total_echecs
+
+
+def demarrer_envoi_emails(app):
+    """Lance le thread d'envoi des emails de ce worker
+
+    Le thread vide la file dès qu'une route le réveille (reveiller_envoi),
+    et au plus tard toutes les EMAIL_INTERVALLE secondes pour les nouveaux essais.
+
+    Args:
+        app: L'instance Flask
+    """
+    intervalle = app.config['EMAIL_INTERVALLE']
+
+    def boucle():
+        while True:
+            _reveil.wait(intervalle)
+            _reveil.clear()
+            try:
+                vider_file(app)
+            except Exception as e:
+                # Base indisponible... on réessaiera au prochain tour
+                app.logger.error(f'❌ Envoi des emails interrompu : {e}')
+
+    threading.Thread(target=boucle, name='envoi-emails', daemon=True).start()
+    app.logger.info(f'Thread d\'envoi des emails démarré (file relue toutes les {intervalle} s)')
@@ -0,0 +1,86 @@
+"""Cache en mémoire de la configuration entreprise (utilisée par les PDF)"""
+import os
+import base64
+import mimetypes
+import threading
+import time
+from types import SimpleNamespace
+from flask import current_app
+from sqlalchemy import event
+from app.models import Config
+
+# Filet de sécurité : les autres workers gunicorn ne voient pas l'invalidation locale
+CONFIG_CACHE_TTL = 300  # secondes
+
+_verrou = threading.Lock()
+_cache = {'valeur': None, 'charge_le': None}
+
+
+def get_config_entreprise():
+    """Retourne la configuration entreprise (lecture à travers le cache)
+
+    Le résultat est un instantané détaché de la session SQLAlchemy (lecture
+    seule), avec le logo déjà encodé en data URI dans `logo_src`.
+
+    Returns:
+        SimpleNamespace avec les colonnes de Config, ou None si aucune configuration
+    """
+    with _verrou:
+        charge_le = _cache['charge_le']
+        if charge_le is not None and time.monotonic() - charge_le < CONFIG_CACHE_TTL:
+            return _cache['valeur']
+
+    valeur = _charger()
+
+    with _verrou:
+        _cache['valeur'] = valeur
+        _cache['charge_le'] = time.monotonic()
+    return valeur
+
+
+def invalider_config_entreprise(*args):
+    """Vide le cache (appelé automatiquement à chaque écriture sur Config)"""
+    with _verrou:
+        _cache['valeur'] = None
+        _cache['charge_le'] = None
+
+
+def _charger():
+    """Lit la ligne Config en base et prépare l'instantané"""
+    config = Config.query.first()
+    if config is None:
+        return None
+
+    instantane = SimpleNamespace(**{
+        colonne.key: getattr(config, colonne.key) for colonne in Config.__table__.columns
+    })
+    instantane.logo_src = _encoder_logo(config.logo_path)
+    return instantane
+
+
+def _encoder_logo(logo_path):
+    """Lit et encode le logo une seule fois (data URI directement utilisable par xhtml2pdf)
+
+    Args:
+        logo_path: Chemin absolu, ou relatif au dossier static
+
+    Returns:
+        str 'data:image/...;base64,...' ou None
+    """
+    if not logo_path:
+        return None
+
+    chemin = logo_path if os.path.isabs(logo_path) else os.path.join(current_app.static_folder, logo_path)
+    if not os.path.isfile(chemin):
+        current_app.logger.warning(f'Logo introuvable: {chemin}')
+        return None
+
+    mime = mimetypes.guess_type(chemin)[0] or 'image/png'
+    with open(chemin, 'rb') as fichier:
+        contenu = base64.b64encode(fichier.read()).decode('ascii')
+    return f'data:{mime};base64,{contenu}'
+
+
+# Invalidation à chaque écriture sur la table config
+for _evenement in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Config, _evenement, invalider_config_entreprise)
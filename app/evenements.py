@@ -0,0 +1,314 @@
+"""Journal des événements métier (audit en ajout seul, outbox transactionnelle)
+
+Chaque modification métier (devis créé, modifié, changé de statut, supprimé ;
+facture créée, payée, supprimée) ajoute une ligne à la table `evenements`
+dans la transaction de la modification : pas d'écriture de fichier pendant
+la requête, et pas d'événement pour une modification annulée.
+
+Un thread de fond (un seul worker à la fois) transmet ensuite les nouveaux
+événements par lots aux destinations configurées (EVENEMENTS_PUITS), chacune
+avec sa position de lecture (CurseurEvenements), dans l'ordre des ids.
+
+Sous PostgreSQL, un id est attribué à l'insertion mais devient visible au
+commit : l'id 10 peut apparaître après l'id 11 déjà transmis. Seuls les
+événements plus vieux que EVENEMENTS_DELAI_STABILISATION sont donc lus, et la
+position s'arrête au premier événement trop récent. La transmission est "au
+moins une fois" tant qu'aucune transaction ne reste ouverte plus longtemps
+que ce délai après l'insertion de son événement (et que les horloges des
+serveurs concordent) ; au-delà, l'événement peut être sauté. Une
+destination doit ignorer un id déjà reçu.
+
+L'export JSON lines (gzip si le fichier finit par .gz) permet de rejouer
+l'historique, par exemple pour reconstruire les rapports (rapport_mensuel).
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from flask import has_request_context
+from flask_login import current_user
+from app import db
+from app.models import Devis, Evenement, CurseurEvenements
+from app.montants import to_decimal, ZERO
+
+# Destinations enregistrées : nom -> fonction(app, evenements) ; evenements : liste de dicts (voir en_dict)
+PUITS = {}
+
+# Un seul worker diffuse à la fois (verrou fichier, comme le planificateur de tâches)
+FICHIER_VERROU = os.path.join(tempfile.gettempdir(), 'mb-app-evenements.lock')
+
+
+def puits(nom):
+    """Décorateur : enregistre une destination d'événements sous `nom`"""
+    def enregistrer(fonction):
+        PUITS[nom] = fonction
+        return fonction
+    return enregistrer
+
+
+def _json(valeur):
+    """Valeur sérialisable en JSON (montants en texte exact, dates ISO)"""
+    if isinstance(valeur, Decimal):
+        return str(valeur)
+    if isinstance(valeur, (date, datetime)):
+        return valeur.isoformat()
+    return valeur
+
+
+def _instantane(document):
+    """Champs utiles à l'audit et aux rapports d'un devis ou d'une facture"""
+    if isinstance(document, Devis):
+        champs = ('numero', 'date', 'statut', 'total_ht', 'total_ttc')
+    else:
+        champs = ('numero', 'date', 'devis_id', 'montant_ttc', 'reste_a_payer', 'etat_paiement')
+    return {champ: _json(getattr(document, champ)) for champ in champs}
+
+
+def _utilisateur():
+    if has_request_context() and current_user.is_authenticated:
+        return current_user.username
+    return None
+
+
+def enregistrer_evenement(type_evenement, document, **donnees):
+    """Ajoute un événement à la transaction courante (sans commit)
+
+    Args:
+        type_evenement: Ex: 'devis.cree', 'facture.paiement'
+        document: Le devis ou la facture concerné (flushé s'il n'a pas encore d'id)
+        **donnees: Informations propres à l'événement (ex: ancien statut, montant payé)
+    """
+    if document.id is None:
+        db.session.flush()
+    contenu = _instantane(document)
+    contenu.update({cle: _json(valeur) for cle, valeur in donnees.items()})
+    db.session.add(Evenement(type=type_evenement, document_id=document.id, client_id=document.client_id,
+                             utilisateur=_utilisateur(), donnees=contenu))
+
+
+def enregistrer_evenements(type_evenement, documents):
+    """Ajoute en un seul INSERT les événements d'une mise à jour ensembliste (sans commit)
+
+    Args:
+        type_evenement: Ex: 'devis.statut'
+        documents: Liste de (document_id, client_id, donnees)
+    """
+    if not documents:
+        return
+    utilisateur = _utilisateur()
+    maintenant = datetime.utcnow()
+    db.session.execute(db.insert(Evenement), [
+        {'type': type_evenement, 'document_id': document_id, 'client_id': client_id, 'utilisateur': utilisateur,
+         'donnees': {cle: _json(valeur) for cle, valeur in donnees.items()}, 'created_at': maintenant}
+        for document_id, client_id, donnees in documents
+    ])
+
+
+def en_dict(evenement):
+    """Forme exportée d'un événement (JSON)"""
+    return {
+        'id': evenement.id,
+        'type': evenement.type,
+        'document_id': evenement.document_id,
+        'client_id': evenement.client_id,
+        'utilisateur': evenement.utilisateur,
+        'donnees': evenement.donnees,
+        'created_at': evenement.created_at.isoformat(),
+    }
+
+
+# ========== DIFFUSION VERS LES DESTINATIONS ==========
+
+@puits('journal')
+def puits_journal(app, evenements):
+    """Une ligne de log par événement (remplace les app.logger.info des routes)"""
+    for evenement in evenements:
+        app.logger.info(f'📒 {evenement["type"]} {evenement["document_id"]} '
+                        f'({evenement["utilisateur"] or "système"}) {json.dumps(evenement["donnees"])}')
+
+
+@puits('fichier')
+def puits_fichier(app, evenements):
+    """Ajoute les événements au fichier JSON lines EVENEMENTS_FICHIER"""
+    chemin = app.config.get('EVENEMENTS_FICHIER')
+    if not chemin:
+        raise RuntimeError('EVENEMENTS_FICHIER non défini')
+    with _ouvrir(chemin, 'a') as fichier:
+        for evenement in evenements:
+            fichier.write(json.dumps(evenement, ensure_ascii=False) + '\n')
+
+
+def diffuser_lot(app, nom, taille=None):
+    """Transmet au puits `nom` le prochain lot d'événements et avance sa position
+
+    La position est verrouillée pendant la transmission (SELECT ... FOR UPDATE
+    SKIP LOCKED sous PostgreSQL) : deux workers ne diffusent pas le même lot.
+    Le lot s'arrête au premier événement créé depuis moins de
+    EVENEMENTS_DELAI_STABILISATION secondes : une transaction plus ancienne
+    encore ouverte peut porter un id inférieur, pas encore visible.
+
+    Args:
+        app: L'instance Flask
+        nom: Nom du puits (clé de PUITS)
+        taille: Nombre maximum d'événements (défaut : EVENEMENTS_TAILLE_LOT)
+
+    Returns:
+        int: Nombre d'événements transmis
+    """
+    with app.app_context():
+        curseur = (db.session.query(CurseurEvenements).filter_by(puits=nom)
+                   .with_for_update(skip_locked=True).first())
+        if curseur is None:
+            if db.session.get(CurseurEvenements, nom) is not None:
+                db.session.rollback()
+                return 0  # position verrouillée par un autre worker
+            curseur = CurseurEvenements(puits=nom, dernier_id=0)
+            db.session.add(curseur)
+
+        lus = (Evenement.query.filter(Evenement.id > curseur.dernier_id)
+               .order_by(Evenement.id).limit(taille or app.config['EVENEMENTS_TAILLE_LOT']).all())
+        # created_at est posé à l'insertion (datetime.utcnow), comme la limite
+        limite = datetime.utcnow() - timedelta(seconds=app.config['EVENEMENTS_DELAI_STABILISATION'])
+        evenements = []
+        for evenement in lus:
+            if evenement.created_at >= limite:
+                break
+            evenements.append(evenement)
+        if not evenements:
+            db.session.commit()
+            return 0
+
+        try:
+            PUITS[nom](app, [en_dict(evenement) for evenement in evenements])
+        except Exception:
+            db.session.rollback()
+            raise
+        curseur.dernier_id = evenements[-1].id
+        db.session.commit()
+        return len(evenements)
+
+
+def diffuser(app):
+    """Vide le journal vers chaque puits configuré, lot par lot
+
+    Un puits en échec est réessayé au passage suivant sans bloquer les autres.
+
+    Returns:
+        dict: nom du puits -> nombre d'événements transmis
+    """
+    transmis = {}
+    for nom in app.config['EVENEMENTS_PUITS']:
+        transmis[nom] = 0
+        debut = time.perf_counter()
+        try:
+            while (nombre := diffuser_lot(app, nom)):
+                transmis[nom] += nombre
+        except Exception as e:
+            app.logger.error(f'❌ Diffusion des événements vers {nom} interrompue : {e}')
+        if transmis[nom]:
+            app.logger.info(f'⏱️ {transmis[nom]} événement(s) transmis à {nom} '
+                            f'en {(time.perf_counter() - debut) * 1000:.0f} ms')
+    return transmis
+
+
+def demarrer_diffusion_evenements(app):
+    """Lance le thread de diffusion (un par worker, un seul actif grâce au verrou fichier)
+
+    Args:
+        app: L'instance Flask
+    """
+    from app.taches import prendre_verrou
+    intervalle = app.config['EVENEMENTS_INTERVALLE']
+
+    def boucle():
+        verrou = None
+        while True:
+            if verrou is None:
+                verrou = prendre_verrou(FICHIER_VERROU)
+            if verrou is not None:
+                diffuser(app)
+            time.sleep(intervalle)
+
+    threading.Thread(target=boucle, name='diffusion-evenements', daemon=True).start()
+    app.logger.info(f'Diffusion des événements démarrée (toutes les {intervalle} s)')
+
+
+# ========== EXPORT ET REJEU ==========
+
+def _ouvrir(chemin, mode):
+    """Fichier texte UTF-8, compressé en gzip si le nom finit par .gz"""
+    if chemin.endswith('.gz'):
+        import gzip
+        return gzip.open(chemin, mode + 't', encoding='utf-8')
+    return open(chemin, mode, encoding='utf-8')
+
+
+def exporter(chemin, depuis_id=0, types=None, taille_lot=1000):
+    """Écrit les événements en JSON lines (un objet par ligne, dans l'ordre des ids)
+
+    Args:
+        chemin: Fichier de sortie (.jsonl, ou .jsonl.gz compressé)
+        depuis_id: N'exporte que les événements d'id supérieur (export incrémental)
+        types: Types à exporter (défaut : tous)
+        taille_lot: Événements lus par requête
+
+    Returns:
+        tuple: (nombre exporté, dernier id exporté)
+    """
+    nombre, dernier_id = 0, depuis_id
+    with _ouvrir(chemin, 'w') as fichier:
+        while True:
+            requete = Evenement.query.filter(Evenement.id > dernier_id)
+            if types:
+                requete = requete.filter(Evenement.type.in_(types))
+            lot = requete.order_by(Evenement.id).limit(taille_lot).all()
+            if not lot:
+                return nombre, dernier_id
+            for evenement in lot:
+                fichier.write(json.dumps(en_dict(evenement), ensure_ascii=False) + '\n')
+            nombre += len(lot)
+            dernier_id = lot[-1].id
+            db.session.expunge_all()  # mémoire constante quelle que soit la taille du journal
+
+
+def lire_export(chemin):
+    """Relit un export JSON lines
+
+    Yields:
+        dict (voir en_dict)
+    """
+    with _ouvrir(chemin, 'r') as fichier:
+        for ligne in fichier:
+            if ligne.strip():
+                yield json.loads(ligne)
+
+
+def rapport_mensuel(evenements):
+    """Reconstruit l'activité mois par mois en rejouant des événements
+
+    Args:
+        evenements: Itérable de dicts (lire_export, ou en_dict sur la table)
+
+    Returns:
+        dict: 'AAAA-MM' -> compteurs devis_crees, devis_acceptes, factures_emises,
+              facture (TTC émis), encaisse (paiements reçus)
+    """
+    mois = defaultdict(lambda: {'devis_crees': 0, 'devis_acceptes': 0, 'factures_emises': 0,
+                                'facture': ZERO, 'encaisse': ZERO})
+    for evenement in evenements:
+        ligne = mois[evenement['created_at'][:7]]
+        donnees = evenement['donnees']
+        if evenement['type'] == 'devis.cree':
+            ligne['devis_crees'] += 1
+        elif evenement['type'] == 'devis.statut' and donnees.get('statut') == 'accepte':
+            ligne['devis_acceptes'] += 1
+        elif evenement['type'] == 'facture.creee':
+            ligne['factures_emises'] += 1
+            ligne['facture'] += to_decimal(donnees.get('montant_ttc'))
+        elif evenement['type'] == 'facture.paiement':
+            ligne['encaisse'] += to_decimal(donnees.get('montant'))
+    return dict(sorted(mois.items()))
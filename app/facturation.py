@@ -0,0 +1,55 @@
+"""Conversion des devis en factures (formulaire et API)"""
+from datetime import date
+from app.models import Facture
+from app.montants import ZERO
+from app.evenements import enregistrer_evenement
+
+
+def prochains_numeros_factures(nombre=1):
+    """Génère les prochains numéros de facture (001, 002...)
+
+    Args:
+        nombre: Nombre de numéros consécutifs à réserver
+
+    Returns:
+        Liste de numéros
+    """
+    derniere_facture = Facture.query.order_by(Facture.id.desc()).first()
+    dernier_num = 0
+    if derniere_facture and derniere_facture.numero:
+        try:
+            dernier_num = int(derniere_facture.numero)
+        except (ValueError, AttributeError):
+            dernier_num = 0
+    return [str(dernier_num + i).zfill(3) for i in range(1, nombre + 1)]
+
+
+def convertir_en_facture(devis, numero):
+    """Crée la facture d'un devis et marque le devis accepté (sans commit)
+
+    Ajoute les événements 'facture.creee' et, si besoin, 'devis.statut'.
+
+    Args:
+        devis: Le devis, sans facture existante
+        numero: Numéro de la facture (voir prochains_numeros_factures)
+
+    Returns:
+        Facture ajoutée au devis
+    """
+    facture = Facture(
+        numero=numero,
+        date=date.today(),
+        client_id=devis.client_id,
+        montant_ttc=devis.total_ttc,
+        acompte=devis.acompte or ZERO,
+        reste_a_payer=devis.total_ttc - (devis.acompte or ZERO),
+        etat_paiement='En attente'
+    )
+    ancien_statut = devis.statut
+    devis.facture = facture
+    devis.statut = 'accepte'
+
+    enregistrer_evenement('facture.creee', facture, devis_numero=devis.numero)
+    if ancien_statut != 'accepte':
+        enregistrer_evenement('devis.statut', devis, ancien_statut=ancien_statut)
+    return facture
@@ -1,8 +1,11 @@
 """Formulaires WTForms pour l'application"""
 from flask_wtf import FlaskForm
-from wtforms import StringField, FloatField, SelectField, TextAreaField, BooleanField, DateField, IntegerField
-from wtforms.validators import DataRequired, Email, Optional, NumberRange
+from wtforms import StringField, DecimalField, SelectField, TextAreaField, BooleanField, DateField, IntegerField
+from wtforms.validators import DataRequired, Email, Optional, NumberRange, ValidationError
 from datetime import date
+from app import db
+from app.models import Client
+from app.montants import MONTANT_MAX
 
 
 class ClientForm(FlaskForm):
@@ -26,16 +29,17 @@ class PrixForm(FlaskForm):
                           ],
                           validators=[DataRequired(message='La catégorie est requise')])
     description = StringField('Description', validators=[Optional()])
-    prix = FloatField('Prix (€)', validators=[
+    prix = DecimalField('Prix (€)', places=2, validators=[
         DataRequired(message='Le prix est requis'),
-        NumberRange(min=0, message='Le prix doit être positif')
+        NumberRange(min=0, max=MONTANT_MAX, message=f'Le prix doit être entre 0 et {MONTANT_MAX}')
     ])
     actif = BooleanField('Actif', default=True)
 
 
 class DevisForm(FlaskForm):
     """Formulaire pour créer/éditer un devis"""
-    client_id = SelectField('Client', coerce=int, validators=[DataRequired(message='Le client est requis')])
+    # Id du client choisi via l'autocomplétion, vérifié par clé primaire (validate_client_id)
+    client_id = IntegerField('Client', validators=[DataRequired(message='Le client est requis')])
     date = DateField('Date', default=date.today, validators=[DataRequired(message='La date est requise')])
     numero_serie = StringField('N° série / Immatriculation', validators=[Optional()])
     inventaire = StringField('Inventaire', validators=[Optional()])
@@ -43,20 +47,26 @@ class DevisForm(FlaskForm):
         DataRequired(message='La validité est requise'),
         NumberRange(min=1, message='La validité doit être au moins 1 jour')
     ])
-    remise_pourcent = FloatField('Remise (%)', default=0.0, validators=[
+    remise_pourcent = DecimalField('Remise (%)', places=2, default=0, validators=[
         Optional(),
         NumberRange(min=0, max=100, message='La remise doit être entre 0 et 100%')
     ])
-    acompte = FloatField('Acompte (€)', default=0.0, validators=[
+    acompte = DecimalField('Acompte (€)', places=2, default=0, validators=[
         Optional(),
-        NumberRange(min=0, message='L\'acompte doit être positif')
+        NumberRange(min=0, max=MONTANT_MAX, message=f'L\'acompte doit être entre 0 et {MONTANT_MAX}')
     ])
     statut = SelectField('Statut', 
                         choices=[
                             ('brouillon', 'Brouillon'),
                             ('envoye', 'Envoyé'),
                             ('accepte', 'Accepté'),
-                            ('refuse', 'Refusé')
+                            ('refuse', 'Refusé'),
+                            ('expire', 'Expiré')
                         ],
                         default='brouillon',
                         validators=[DataRequired(message='Le statut est requis')])
+
+    def validate_client_id(self, field):
+        """Vérifie que le client existe (une seule lecture par clé primaire)"""
+        if db.session.get(Client, field.data) is None:
+            raise ValidationError('Client introuvable')
@@ -0,0 +1,104 @@
+"""Limitation des tentatives de connexion (fenêtre glissante + backoff exponentiel)
+
+Le refus est décidé avant toute vérification de mot de passe : une rafale de
+tentatives (credential stuffing) ne coûte alors presque rien en CPU, au lieu
+d'occuper chaque worker gunicorn sur le hachage.
+"""
+import threading
+import time
+from collections import deque
+
+# Nombre d'échecs tolérés dans la fenêtre avant blocage, pour le couple (IP, compte)
+MAX_ECHECS = 5
+FENETRE_SECONDES = 15 * 60
+
+# Seuils par type de clé : le couple bloque vite une personne qui se trompe ; l'IP seule
+# (NAT, bureau partagé) et le compte seul (que n'importe qui peut viser) ne sont bloqués
+# qu'au-delà d'un volume d'échecs qu'aucun utilisateur légitime n'atteint
+SEUILS_ECHECS = {'paire': MAX_ECHECS, 'ip': 50, 'user': 20}
+
+# Durée du blocage : 30 s, puis doublée à chaque nouvel échec, plafonnée à 1 h
+BLOCAGE_BASE_SECONDES = 30
+BLOCAGE_MAX_SECONDES = 60 * 60
+
+# Au-delà, on purge les clés inactives (borne la mémoire en cas d'attaque distribuée)
+MAX_CLES = 10000
+
+
+class LimiteurConnexions:
+    """Compteur d'échecs par clé ('paire:...', 'ip:...', 'user:...'), propre à chaque processus"""
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._echecs = {}       # clé -> deque des horodatages d'échec
+        self._bloque_jusqu = {}  # clé -> instant de fin du blocage
+        self.metriques = {'tentatives_refusees': 0, 'echecs': 0, 'blocages': 0}
+
+    def verifier(self, *cles):
+        """Indique si une tentative est autorisée, sans rien hacher
+
+        Args:
+            *cles: Clés concernées par la tentative (voir cles_tentative)
+
+        Returns:
+            int: Secondes d'attente restantes (0 si la tentative est autorisée)
+        """
+        maintenant = time.monotonic()
+        with self._verrou:
+            attente = max((self._bloque_jusqu.get(cle, 0) - maintenant for cle in cles), default=0)
+            if attente > 0:
+                self.metriques['tentatives_refusees'] += 1
+                return int(attente) + 1
+        return 0
+
+    def enregistrer_echec(self, *cles):
+        """Comptabilise un échec ; bloque chaque clé dont le seuil (SEUILS_ECHECS) est atteint dans la fenêtre"""
+        maintenant = time.monotonic()
+        with self._verrou:
+            self.metriques['echecs'] += 1
+            if len(self._echecs) > MAX_CLES:
+                self._purger(maintenant)
+
+            for cle in cles:
+                echecs = self._echecs.setdefault(cle, deque())
+                echecs.append(maintenant)
+                while echecs and echecs[0] <= maintenant - FENETRE_SECONDES:
+                    echecs.popleft()
+
+                seuil = SEUILS_ECHECS.get(cle.split(':', 1)[0], MAX_ECHECS)
+                if len(echecs) >= seuil:
+                    duree = min(BLOCAGE_BASE_SECONDES * 2 ** min(len(echecs) - seuil, 16), BLOCAGE_MAX_SECONDES)
+                    self._bloque_jusqu[cle] = maintenant + duree
+                    self.metriques['blocages'] += 1
+
+    def reinitialiser(self, *cles):
+        """Efface l'historique des clés données (après une connexion réussie : couple et compte, pas l'IP)"""
+        with self._verrou:
+            for cle in cles:
+                self._echecs.pop(cle, None)
+                self._bloque_jusqu.pop(cle, None)
+
+    def _purger(self, maintenant):
+        """Supprime les clés sans échec récent ni blocage en cours (verrou déjà pris)"""
+        for cle in list(self._echecs):
+            if self._echecs[cle][-1] <= maintenant - FENETRE_SECONDES \
+                    and self._bloque_jusqu.get(cle, 0) <= maintenant:
+                del self._echecs[cle]
+                self._bloque_jusqu.pop(cle, None)
+
+
+limiteur_connexions = LimiteurConnexions()
+
+
+def cles_tentative(ip, username):
+    """Clés de limitation d'une tentative
+
+    Args:
+        ip: Adresse du client (request.remote_addr, corrigée par ProxyFix derrière un proxy)
+        username: Nom d'utilisateur saisi
+
+    Returns:
+        tuple: (clé du couple IP/compte, clé de l'IP, clé du compte)
+    """
+    username = (username or '').strip().lower()
+    return f'paire:{ip}|{username}', f'ip:{ip}', f'user:{username}'
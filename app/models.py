@@ -1,6 +1,47 @@
 """Modèles de base de données"""
 from datetime import datetime, date
+from sqlalchemy.orm import validates
 from app import db
+from app.montants import ZERO
+from app.calculs import calculer_totaux_lignes
+
+# Types SQL pour les montants : NUMERIC exact, lu en Decimal côté Python
+Montant = db.Numeric(12, 2)
+Pourcentage = db.Numeric(5, 2)
+
+
+def texte_recherche(longueur):
+    """Type d'une colonne de recherche par préfixe, comparée dans l'ordre des points de code
+
+    SQLite compare déjà les textes octet par octet (collation BINARY) ;
+    PostgreSQL doit utiliser la collation "C", sinon l'ordre dépend de la
+    langue et un intervalle ne correspond plus à un préfixe.
+    """
+    return db.String(longueur).with_variant(db.String(longueur, collation='C'), 'postgresql')
+
+
+def normaliser_recherche(texte):
+    """Forme d'un texte stockée pour la recherche (minuscules Unicode, comme côté Python)"""
+    return texte.strip().lower() if texte else None
+
+class Utilisateur(db.Model):
+    """Compte utilisateur de l'application (un par technicien)"""
+    __tablename__ = 'users'
+    
+    ROLES = ('admin', 'technicien')
+    
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)
+    role = db.Column(db.String(20), nullable=False, default='technicien')
+    actif = db.Column(db.Boolean, default=True, nullable=False)
+    api_token_hash = db.Column(db.String(64), unique=True, index=True)  # SHA-256 du jeton d'API (flask utilisateur-jeton)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Utilisateur {self.username}>'
+
 
 class Client(db.Model):
     """Modèle pour les clients"""
@@ -16,14 +57,71 @@ class Client(db.Model):
     email = db.Column(db.String(120))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Nom et entreprise en minuscules pour la recherche par préfixe (autocomplétion) :
+    # lower() de SQLite ne traite que l'ASCII, la conversion est donc faite en Python
+    nom_recherche = db.Column(texte_recherche(100), index=True)
+    entreprise_recherche = db.Column(texte_recherche(200), index=True)
+    
     # Relations
     devis = db.relationship('Devis', backref='client', lazy=True, cascade='all, delete-orphan')
     factures = db.relationship('Facture', backref='client', lazy=True, cascade='all, delete-orphan')
+    devis_archives = db.relationship('DevisArchive', backref='client', lazy=True, cascade='all, delete-orphan')
+    factures_archives = db.relationship('FactureArchive', backref='client', lazy=True, cascade='all, delete-orphan')
+    resume = db.relationship('ClientResume', backref='client', uselist=False, cascade='all, delete-orphan')
+    
+    @validates('nom', 'entreprise')
+    def _tenir_recherche(self, champ, valeur):
+        """Tient à jour la colonne de recherche du champ modifié"""
+        setattr(self, f'{champ}_recherche', normaliser_recherche(valeur))
+        return valeur
+    
+    @property
+    def libelle(self):
+        """Nom affiché dans les listes de choix (nom - entreprise)"""
+        return f'{self.nom} - {self.entreprise}' if self.entreprise else self.nom
     
     def __repr__(self):
         return f'<Client {self.nom}>'
 
 
+class ClientResume(db.Model):
+    """Compteurs dénormalisés d'un client (tenus à jour par app/resume_clients.py)
+    
+    Couvrent tout l'historique (documents courants et archivés) : la liste et
+    la fiche client les lisent sans agréger les devis et factures.
+    """
+    __tablename__ = 'clients_resume'
+    
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), primary_key=True)
+    
+    # Nombre de devis par statut
+    nb_devis_brouillon = db.Column(db.Integer, default=0, nullable=False)
+    nb_devis_envoye = db.Column(db.Integer, default=0, nullable=False)
+    nb_devis_accepte = db.Column(db.Integer, default=0, nullable=False)
+    nb_devis_refuse = db.Column(db.Integer, default=0, nullable=False)
+    nb_devis_expire = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    
+    # Factures
+    total_facture = db.Column(Montant, default=ZERO, nullable=False)
+    reste_a_payer = db.Column(Montant, default=ZERO, nullable=False, index=True)
+    
+    derniere_activite = db.Column(db.DateTime, index=True)
+    
+    @property
+    def nb_devis(self):
+        """Nombre total de devis"""
+        return (self.nb_devis_brouillon + self.nb_devis_envoye + self.nb_devis_accepte
+                + self.nb_devis_refuse + self.nb_devis_expire)
+    
+    @property
+    def nb_devis_ouverts(self):
+        """Devis en attente de réponse (brouillons et envoyés)"""
+        return self.nb_devis_brouillon + self.nb_devis_envoye
+    
+    def __repr__(self):
+        return f'<ClientResume {self.client_id}>'
+
+
 class PrixCatalogue(db.Model):
     """Catalogue des prix"""
     __tablename__ = 'prix_catalogue'
@@ -32,7 +130,7 @@ class PrixCatalogue(db.Model):
     code = db.Column(db.String(20), unique=True, nullable=False)  # Ex: T1, D1, etc.
     categorie = db.Column(db.String(50), nullable=False)  # TOLERIE_CARROSSERIE, DEBOSSELAGE
     description = db.Column(db.String(200))
-    prix = db.Column(db.Float, nullable=False)
+    prix = db.Column(Montant, nullable=False)
     actif = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -40,71 +138,102 @@ class PrixCatalogue(db.Model):
         return f'<PrixCatalogue {self.code} - {self.prix}€>'
 
 
-class Devis(db.Model):
-    """Modèle pour les devis"""
-    __tablename__ = 'devis'
+class DevisBase:
+    """Colonnes et calculs communs aux devis courants et archivés"""
+    
+    # Vrai pour les documents déplacés dans les tables d'archive (lecture seule)
+    archive = False
     
     id = db.Column(db.Integer, primary_key=True)
     numero = db.Column(db.String(20), unique=True, nullable=False)  # Ex: N°003
     date = db.Column(db.Date, nullable=False, default=date.today)
-    client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=False)
     
     # Informations additionnelles
     numero_serie = db.Column(db.String(100))  # Immatriculation
     inventaire = db.Column(db.String(100))
-    statut = db.Column(db.String(20), default='brouillon')  # brouillon, envoye, accepte, refuse
+    statut = db.Column(db.String(20), default='brouillon')  # brouillon, envoye, accepte, refuse, expire
     validite_jours = db.Column(db.Integer, default=30)  # 1 mois par défaut
     
     # Totaux
-    total_ht = db.Column(db.Float, default=0.0)
-    total_ttc = db.Column(db.Float, default=0.0)
+    total_ht = db.Column(Montant, default=ZERO)
+    total_ttc = db.Column(Montant, default=ZERO)
     
     # Remise et acompte
-    remise_pourcent = db.Column(db.Float, default=0.0)
-    acompte = db.Column(db.Float, default=0.0)
+    remise_pourcent = db.Column(Pourcentage, default=ZERO)
+    acompte = db.Column(Montant, default=ZERO)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    def calculer_totaux(self):
+        """Calcule et met à jour les totaux HT et TTC du devis (et le TTC de chaque ligne)"""
+        self.appliquer_totaux(calculer_totaux_lignes(self.lignes, self.remise_pourcent))
+    
+    def appliquer_totaux(self, resultat):
+        """Reporte sur le devis un résultat de calculer_totaux_lignes
+        
+        Args:
+            resultat: dict retourné par app.calculs.calculer_totaux_lignes,
+                      dans le même ordre que self.lignes
+        """
+        for ligne, totaux_ligne in zip(self.lignes, resultat['lignes']):
+            ligne.total_ttc = totaux_ligne['total_ttc']
+        self.total_ht = resultat['total_ht']
+        self.total_ttc = resultat['total_ttc']
+    
+    @property
+    def total_ht_brut(self):
+        """Total HT avant remise (somme des lignes)"""
+        return sum((ligne.montant_ht for ligne in self.lignes), ZERO)
+    
+    @property
+    def montant_remise(self):
+        """Montant de la remise appliquée sur le HT brut"""
+        return self.total_ht_brut - (self.total_ht or ZERO)
+    
+    @property
+    def montant_tva(self):
+        """Montant total de la TVA"""
+        return (self.total_ttc or ZERO) - (self.total_ht or ZERO)
+
+
+class Devis(DevisBase, db.Model):
+    """Modèle pour les devis"""
+    __tablename__ = 'devis'
+    # Ids jamais réattribués par SQLite : ceux des documents archivés restent uniques (voir app/archivage.py)
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=False, index=True)
+    
     # Relations
     lignes = db.relationship('DevisLigne', backref='devis', lazy=True, cascade='all, delete-orphan')
     facture = db.relationship('Facture', backref='devis', uselist=False, cascade='all, delete-orphan')
     
-    def calculer_totaux(self):
-        """Calcule et met à jour les totaux HT et TTC du devis"""
-        total_ht_brut = 0.0
-        total_ttc = 0.0
-        
-        # Calculer le total HT brut
-        for ligne in self.lignes:
-            montant_ht = ligne.prix_unitaire_ht * ligne.quantite
-            total_ht_brut += montant_ht
-        
-        # Appliquer la remise sur le HT
-        remise_montant = total_ht_brut * (self.remise_pourcent / 100)
-        total_ht_apres_remise = total_ht_brut - remise_montant
-        
-        # Calculer le TTC avec la remise appliquée
-        for ligne in self.lignes:
-            montant_ht = ligne.prix_unitaire_ht * ligne.quantite
-            montant_ht_apres_remise = montant_ht * (1 - self.remise_pourcent / 100)
-            montant_tva = montant_ht_apres_remise * (ligne.tva_pourcent / 100)
-            total_ttc += montant_ht_apres_remise + montant_tva
-        
-        # Mettre à jour les totaux
-        self.total_ht = total_ht_apres_remise
-        self.total_ttc = total_ttc
-    
     def __repr__(self):
         return f'<Devis {self.numero}>'
 
 
-class DevisLigne(db.Model):
-    """Lignes d'un devis"""
-    __tablename__ = 'devis_lignes'
+class DevisArchive(DevisBase, db.Model):
+    """Devis clos déplacé hors de la table courante (voir app/archivage.py)"""
+    __tablename__ = 'devis_archives'
+    
+    archive = True
+    
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=False, index=True)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relations
+    lignes = db.relationship('DevisLigneArchive', backref='devis', lazy=True, cascade='all, delete-orphan')
+    facture = db.relationship('FactureArchive', backref='devis', uselist=False, cascade='all, delete-orphan')
+    
+    def __repr__(self):
+        return f'<DevisArchive {self.numero}>'
+
+
+class DevisLigneBase:
+    """Colonnes communes aux lignes de devis courantes et archivées"""
     
     id = db.Column(db.Integer, primary_key=True)
-    devis_id = db.Column(db.Integer, db.ForeignKey('devis.id'), nullable=False)
     
     # Informations de la ligne
     tache = db.Column(db.String(100))  # Ex: TOLERIE_CARROSSERIE
@@ -112,44 +241,135 @@ class DevisLigne(db.Model):
     description = db.Column(db.String(200))  # Ex: test
     quantite = db.Column(db.Integer, default=1)
     unite = db.Column(db.String(20))  # Ex: T3, DS
-    prix_unitaire_ht = db.Column(db.Float, nullable=False)
-    tva_pourcent = db.Column(db.Float, default=0.0)
-    total_ttc = db.Column(db.Float, nullable=False)
+    prix_unitaire_ht = db.Column(Montant, nullable=False)
+    tva_pourcent = db.Column(Pourcentage, default=ZERO)
+    total_ttc = db.Column(Montant, nullable=False)
     
     ordre = db.Column(db.Integer)  # Pour garder l'ordre des lignes
     
+    @property
+    def montant_ht(self):
+        """Montant HT de la ligne (prix unitaire x quantité), avant remise"""
+        return (self.prix_unitaire_ht or ZERO) * (self.quantite or 0)
+    
     def __repr__(self):
         return f'<DevisLigne {self.description}>'
 
 
-class Facture(db.Model):
-    """Modèle pour les factures"""
-    __tablename__ = 'factures'
+class DevisLigne(DevisLigneBase, db.Model):
+    """Lignes d'un devis"""
+    __tablename__ = 'devis_lignes'
+    # Ids jamais réattribués par SQLite : ceux des documents archivés restent uniques (voir app/archivage.py)
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    devis_id = db.Column(db.Integer, db.ForeignKey('devis.id'), nullable=False)
+
+
+class DevisLigneArchive(DevisLigneBase, db.Model):
+    """Lignes d'un devis archivé"""
+    __tablename__ = 'devis_lignes_archives'
+    
+    devis_id = db.Column(db.Integer, db.ForeignKey('devis_archives.id'), nullable=False)
+
+
+class ModeleDevis(db.Model):
+    """Modèle de devis réutilisable (jeu de lignes type pour les travaux répétitifs)"""
+    __tablename__ = 'modeles_devis'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    nom = db.Column(db.String(100), unique=True, nullable=False)
+    
+    # Remise et totaux figés à l'enregistrement (les lignes ne changent pas)
+    remise_pourcent = db.Column(Pourcentage, default=ZERO)
+    total_ht = db.Column(Montant, default=ZERO)
+    total_ttc = db.Column(Montant, default=ZERO)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relations
+    lignes = db.relationship('ModeleDevisLigne', backref='modele', lazy=True, cascade='all, delete-orphan',
+                             order_by='ModeleDevisLigne.ordre')
+    
+    def __repr__(self):
+        return f'<ModeleDevis {self.nom}>'
+
+
+class ModeleDevisLigne(db.Model):
+    """Lignes d'un modèle de devis (mêmes colonnes que DevisLigne)"""
+    __tablename__ = 'modeles_devis_lignes'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    modele_id = db.Column(db.Integer, db.ForeignKey('modeles_devis.id'), nullable=False)
+    
+    tache = db.Column(db.String(100))
+    vehicule = db.Column(db.String(20))
+    description = db.Column(db.String(200))
+    quantite = db.Column(db.Integer, default=1)
+    unite = db.Column(db.String(20))
+    prix_unitaire_ht = db.Column(Montant, nullable=False)
+    tva_pourcent = db.Column(Pourcentage, default=ZERO)
+    total_ttc = db.Column(Montant, nullable=False)
+    
+    ordre = db.Column(db.Integer)
+    
+    def __repr__(self):
+        return f'<ModeleDevisLigne {self.description}>'
+
+
+class FactureBase:
+    """Colonnes communes aux factures courantes et archivées"""
+    
+    # Vrai pour les documents déplacés dans les tables d'archive (lecture seule)
+    archive = False
     
     id = db.Column(db.Integer, primary_key=True)
     numero = db.Column(db.String(20), unique=True, nullable=False)  # Ex: 001
     date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
     
-    # Liaisons
-    devis_id = db.Column(db.Integer, db.ForeignKey('devis.id'), nullable=False)
-    client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=False)
-    
     # Montants
-    montant_ttc = db.Column(db.Float, nullable=False)
-    acompte = db.Column(db.Float, default=0.0)
-    reste_a_payer = db.Column(db.Float, nullable=False)
+    montant_ttc = db.Column(Montant, nullable=False)
+    acompte = db.Column(Montant, default=ZERO)
+    reste_a_payer = db.Column(Montant, nullable=False)
     
     # Paiement
     etat_paiement = db.Column(db.String(50), default='En attente')  # En attente, Paiement partiel, Payé
     mode_paiement = db.Column(db.String(50))  # Paiement par virement, Espèces, Chèque, Carte bancaire
     date_paiement = db.Column(db.Date)
     
+    # Non soldée au-delà du délai de paiement (positionné par la tâche factures-en-retard)
+    en_retard = db.Column(db.Boolean, default=False, server_default=db.false(), nullable=False)
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class Facture(FactureBase, db.Model):
+    """Modèle pour les factures"""
+    __tablename__ = 'factures'
+    # Ids jamais réattribués par SQLite : ceux des documents archivés restent uniques (voir app/archivage.py)
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    # Liaisons
+    devis_id = db.Column(db.Integer, db.ForeignKey('devis.id'), nullable=False)
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=False, index=True)
     
     def __repr__(self):
         return f'<Facture {self.numero}>'
 
 
+class FactureArchive(FactureBase, db.Model):
+    """Facture payée déplacée hors de la table courante avec son devis"""
+    __tablename__ = 'factures_archives'
+    
+    archive = True
+    
+    # Liaisons
+    devis_id = db.Column(db.Integer, db.ForeignKey('devis_archives.id'), nullable=False)
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<FactureArchive {self.numero}>'
+
+
 class Config(db.Model):
     """Configuration de l'entreprise"""
     __tablename__ = 'config'
@@ -183,3 +403,121 @@ class Config(db.Model):
     
     def __repr__(self):
         return f'<Config {self.nom_entreprise}>'
+
+
+class EmailSortant(db.Model):
+    """Email en file d'envoi (boîte d'envoi persistante, vidée par app/emails.py)
+
+    Le PDF joint est généré au moment de l'envoi, pas dans la requête.
+    """
+    __tablename__ = 'emails_sortants'
+    __table_args__ = (
+        # Sélection des messages à envoyer : statut puis date du prochain essai
+        db.Index('ix_emails_sortants_a_envoyer', 'statut', 'prochain_essai'),
+    )
+    
+    NATURES = ('devis', 'facture', 'relance')
+    
+    id = db.Column(db.Integer, primary_key=True)
+    nature = db.Column(db.String(20), nullable=False)  # devis, facture, relance
+    document_id = db.Column(db.Integer, nullable=False)  # id du devis ou de la facture (courant ou archivé)
+    destinataire = db.Column(db.String(120), nullable=False)
+    sujet = db.Column(db.String(200), nullable=False)
+    corps = db.Column(db.Text, nullable=False)
+    
+    statut = db.Column(db.String(20), nullable=False, default='en_attente')  # en_attente, envoye, echec
+    tentatives = db.Column(db.Integer, nullable=False, default=0)
+    prochain_essai = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    reserve_par = db.Column(db.String(32))  # jeton du worker qui traite le lot en cours
+    derniere_erreur = db.Column(db.Text)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    envoye_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<EmailSortant {self.nature} {self.document_id} -> {self.destinataire}>'
+
+
+class OperationBancaire(db.Model):
+    """Crédit lu sur un relevé bancaire importé, et son rapprochement avec une facture
+
+    L'empreinte empêche d'appliquer deux fois un paiement si le même relevé
+    (ou deux relevés qui se chevauchent) est importé à nouveau.
+    """
+    __tablename__ = 'operations_bancaires'
+    
+    STATUTS = ('rapprochee', 'a_verifier', 'ignoree')
+    
+    id = db.Column(db.Integer, primary_key=True)
+    empreinte = db.Column(db.String(40), unique=True, nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    montant = db.Column(Montant, nullable=False)
+    libelle = db.Column(db.Text, nullable=False)
+    
+    statut = db.Column(db.String(20), nullable=False, index=True)  # rapprochee, a_verifier, ignoree
+    motif = db.Column(db.String(200))  # comment l'opération a été rapprochée, ou pourquoi elle est à vérifier
+    candidats = db.Column(db.JSON)  # ids des factures proposées à la vérification
+    
+    # Pas de clé étrangère : la facture peut être archivée ensuite
+    facture_id = db.Column(db.Integer)
+    facture_numero = db.Column(db.String(200))  # plusieurs numéros si un virement règle plusieurs factures
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<OperationBancaire {self.date} {self.montant} {self.statut}>'
+
+
+class Evenement(db.Model):
+    """Événement métier (journal d'audit en ajout seul)
+
+    Écrit dans la même transaction que la modification qu'il décrit : un
+    événement existe si et seulement si la modification a été commitée.
+    Les lignes ne sont jamais modifiées ; l'id croissant sert de position
+    de lecture aux consommateurs (voir CurseurEvenements).
+    """
+    __tablename__ = 'evenements'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), nullable=False, index=True)  # ex: devis.cree, facture.paiement
+    document_id = db.Column(db.Integer, nullable=False)  # id du devis ou de la facture (pas de clé étrangère)
+    client_id = db.Column(db.Integer, index=True)
+    utilisateur = db.Column(db.String(80))  # username, ou None pour les tâches et la CLI
+    donnees = db.Column(db.JSON, nullable=False)  # montants en texte, dates ISO
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<Evenement {self.id} {self.type} {self.document_id}>'
+
+
+class CurseurEvenements(db.Model):
+    """Dernier événement transmis à chaque destination (puits) du journal"""
+    __tablename__ = 'curseurs_evenements'
+    
+    puits = db.Column(db.String(50), primary_key=True)
+    dernier_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<CurseurEvenements {self.puits} {self.dernier_id}>'
+
+
+class BrouillonDevis(db.Model):
+    """Brouillon d'un devis en cours de saisie (enregistré automatiquement par le formulaire)
+
+    Le formulaire n'envoie que les lignes modifiées (voir app/brouillons.py) ;
+    `version` augmente à chaque envoi accepté : un envoi fondé sur une version
+    dépassée (autre onglet, réponse perdue) est refusé et le navigateur se recale.
+    """
+    __tablename__ = 'brouillons_devis'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    utilisateur = db.Column(db.String(80), nullable=False, index=True)  # username de l'auteur
+    devis_id = db.Column(db.Integer, index=True)  # devis édité (pas de clé étrangère), None pour un nouveau devis
+    version = db.Column(db.Integer, nullable=False, default=0)
+    lignes = db.Column(db.JSON, nullable=False)  # lignes normalisées avec leur uid, montants en texte
+    champs = db.Column(db.JSON, nullable=False)  # autres champs du formulaire (date, client, remise...)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<BrouillonDevis {self.id} {self.utilisateur} v{self.version}>'
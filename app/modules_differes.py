@@ -0,0 +1,77 @@
+"""Modules lourds chargés à leur première utilisation (PDF, emails, rapprochement bancaire)
+
+Un worker ne paie au démarrage que ce qui sert à toutes les requêtes : les
+routes et les commandes accèdent à ces modules par un mandataire qui
+l'importe au premier attribut lu (pdf.pdf_devis(...) charge app.pdf).
+
+En mode préchargement (gunicorn.conf.py, GUNICORN_PRELOAD=True), precharger()
+les importe une fois dans le processus maître, avec les bibliothèques
+qu'ils n'importent eux-mêmes qu'au premier usage (moteur PDF configuré,
+Flask-Mail et smtplib) : chaque module peut définir pour cela une fonction
+precharger(app). Les workers forkés partagent ensuite ces pages mémoire en
+copie sur écriture.
+"""
+import importlib
+
+# Modules enregistrés : nom court -> chemin du module
+MODULES = {}
+
+
+class ModuleDiffere:
+    """Mandataire d'un module, importé au premier accès à l'un de ses attributs"""
+
+    def __init__(self, chemin):
+        self._chemin = chemin
+        self._module = None
+
+    def __getattr__(self, attribut):
+        # Appelé seulement pour les attributs absents du mandataire (ceux du module)
+        if self._module is None:
+            self._module = importlib.import_module(self._chemin)
+        return getattr(self._module, attribut)
+
+    def __repr__(self):
+        etat = 'chargé' if self._module is not None else 'différé'
+        return f'<ModuleDiffere {self._chemin} ({etat})>'
+
+
+def differe(nom, chemin):
+    """Enregistre un module à charger à la première utilisation
+
+    Args:
+        nom: Nom court (clé de MODULES)
+        chemin: Chemin d'import du module (ex: 'app.pdf')
+
+    Returns:
+        ModuleDiffere
+    """
+    MODULES[nom] = chemin
+    return ModuleDiffere(chemin)
+
+
+def precharger(app, noms=None):
+    """Importe tout de suite les modules enregistrés et leurs dépendances lourdes (avant le fork)
+
+    Args:
+        app: L'instance Flask (pour les dépendances qui dépendent de la configuration)
+        noms: Noms courts à charger (défaut : tous)
+
+    Returns:
+        list: Chemins des modules importés
+    """
+    chemins = [MODULES[nom] for nom in (noms or MODULES)]
+    for chemin in chemins:
+        module = importlib.import_module(chemin)
+        if hasattr(module, 'precharger'):
+            module.precharger(app)
+    return chemins
+
+
+# Rendu PDF (le moteur xhtml2pdf/weasyprint n'est lui-même importé qu'au premier rendu, ou par precharger)
+pdf = differe('pdf', 'app.pdf')
+
+# Boîte d'envoi des emails (Flask-Mail n'est importé qu'au premier envoi)
+emails = differe('emails', 'app.emails')
+
+# Import des relevés bancaires (CSV, CAMT.053 en XML) et rapprochement
+rapprochement = differe('rapprochement', 'app.rapprochement')
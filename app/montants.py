@@ -0,0 +1,76 @@
+"""Utilitaires pour les montants (Decimal exact, arrondi au centime)"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# Précision des montants stockés en base
+CENTIME = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+# Plus grandes valeurs des colonnes Numeric(12, 2) (montants) et Numeric(5, 2) (pourcentages)
+MONTANT_MAX = Decimal('9999999999.99')
+POURCENTAGE_MAX = Decimal('999.99')
+
+
+class MontantInvalide(ValueError):
+    """Montant trop grand pour être enregistré en base"""
+
+
+def to_decimal(valeur, defaut=ZERO):
+    """Convertit une valeur (str, int, float, Decimal, None) en Decimal
+
+    Les floats passent par leur représentation texte pour éviter
+    d'importer l'erreur binaire (0.1 -> Decimal('0.1') et non 0.1000000000000000055...).
+
+    Args:
+        valeur: La valeur à convertir
+        defaut: Valeur retournée si la conversion est impossible
+
+    Returns:
+        Decimal
+    """
+    if valeur is None or valeur == '':
+        return defaut
+    if isinstance(valeur, Decimal):
+        return valeur
+    if isinstance(valeur, float):
+        valeur = repr(valeur)
+    try:
+        resultat = Decimal(str(valeur).strip().replace(',', '.'))
+    except (InvalidOperation, ValueError):
+        return defaut
+    # Refuser NaN / Infinity
+    return resultat if resultat.is_finite() else defaut
+
+
+def arrondir(montant, maximum=MONTANT_MAX):
+    """Arrondit un montant au centime (arrondi commercial, demi vers le haut)
+
+    Args:
+        montant: Decimal ou valeur convertible
+        maximum: Plus grande valeur absolue acceptée (celle de la colonne)
+
+    Returns:
+        Decimal avec 2 décimales
+
+    Raises:
+        MontantInvalide: Valeur absolue supérieure à `maximum`
+    """
+    try:
+        resultat = to_decimal(montant).quantize(CENTIME, rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        # Plus de chiffres que la précision du contexte (ex: 1e30)
+        resultat = None
+    if resultat is None or abs(resultat) > maximum:
+        raise MontantInvalide(f'Valeur trop grande (maximum {maximum})')
+    return resultat
+
+
+def format_montant(montant):
+    """Formate un montant pour l'affichage (filtre Jinja `montant`)
+
+    Args:
+        montant: Decimal ou valeur convertible
+
+    Returns:
+        str avec 2 décimales, ex: '1234.50'
+    """
+    return f'{arrondir(montant):.2f}'
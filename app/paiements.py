@@ -0,0 +1,39 @@
+"""Enregistrement des paiements sur les factures (saisie manuelle et rapprochement bancaire)"""
+from datetime import date
+from app.montants import ZERO
+from app.evenements import enregistrer_evenement
+
+
+def appliquer_paiement(facture, montant, mode_paiement, date_paiement=None):
+    """Déduit un paiement du reste à payer et met à jour l'état de la facture
+
+    Ne commite pas et ne recalcule pas le résumé client : l'appelant le fait,
+    une seule fois pour un lot de paiements. L'événement 'facture.paiement'
+    est ajouté à la même transaction.
+
+    Args:
+        facture: La facture (courante) à créditer
+        montant: Montant reçu (Decimal > 0)
+        mode_paiement: Ex: 'Paiement par virement'
+        date_paiement: Date du paiement (défaut : aujourd'hui)
+
+    Returns:
+        bool: True si la facture est soldée
+    """
+    # Montants en Decimal exact : pas de ré-arrondi ni de tolérance nécessaires
+    facture.acompte = (facture.acompte or ZERO) + montant
+    facture.reste_a_payer = facture.montant_ttc - facture.acompte
+
+    if facture.reste_a_payer <= 0:
+        facture.etat_paiement = 'Payé'
+        facture.mode_paiement = mode_paiement
+        facture.date_paiement = date_paiement or date.today()
+        facture.reste_a_payer = ZERO
+        facture.en_retard = False
+    else:
+        facture.etat_paiement = 'Paiement partiel'
+
+    solde = facture.etat_paiement == 'Payé'
+    enregistrer_evenement('facture.paiement', facture, montant=montant, mode_paiement=mode_paiement,
+                          date_paiement=date_paiement or date.today(), solde=solde)
+    return solde
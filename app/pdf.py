@@ -0,0 +1,125 @@
+"""Génération des PDF (devis, factures) avec moteur interchangeable"""
+import importlib
+import re
+import time
+from io import BytesIO
+from flask import current_app, render_template
+
+# Templates HTML rendus en PDF (communs à tous les moteurs)
+TEMPLATES_PDF = ('pdf/devis.html', 'pdf/facture.html')
+
+
+def _rendre_xhtml2pdf(html_content):
+    """Rendu avec xhtml2pdf (pur Python, basé sur ReportLab)"""
+    from xhtml2pdf import pisa
+
+    pdf_buffer = BytesIO()
+    pisa_status = pisa.CreatePDF(html_content, dest=pdf_buffer)
+
+    if pisa_status.err:
+        return None
+    return pdf_buffer.getvalue()
+
+
+def _rendre_weasyprint(html_content):
+    """Rendu avec WeasyPrint (Pango/Cairo, meilleur support CSS)"""
+    from weasyprint import HTML
+
+    try:
+        return HTML(string=html_content).write_pdf()
+    except Exception as error:
+        current_app.logger.error(f'Erreur WeasyPrint: {error}', exc_info=True)
+        return None
+
+
+# Moteurs disponibles (sélection via PDF_ENGINE)
+MOTEURS_PDF = {
+    'xhtml2pdf': _rendre_xhtml2pdf,
+    'weasyprint': _rendre_weasyprint,
+}
+
+# Module importé au premier rendu par chaque moteur (chargé d'avance par precharger)
+MODULES_MOTEURS = {
+    'xhtml2pdf': 'xhtml2pdf.pisa',
+    'weasyprint': 'weasyprint',
+}
+
+
+def generer_pdf(html_content, moteur=None):
+    """Convertit un document HTML en PDF
+
+    Le moteur est importé au premier appel (ou par prechauffer_pdf au démarrage).
+
+    Args:
+        html_content: Le HTML rendu
+        moteur: Nom du moteur, par défaut PDF_ENGINE de la configuration
+
+    Returns:
+        bytes du PDF, ou None en cas d'erreur
+    """
+    moteur = moteur or current_app.config.get('PDF_ENGINE', 'xhtml2pdf')
+    return MOTEURS_PDF[moteur](html_content)
+
+
+def pdf_devis(devis):
+    """PDF d'un devis (courant ou archivé), ou None en cas d'erreur"""
+    from datetime import timedelta
+    from app.entreprise import get_config_entreprise
+
+    html_content = render_template('pdf/devis.html', devis=devis, config=get_config_entreprise(),
+                                   timedelta=timedelta)
+    return generer_pdf(html_content)
+
+
+def pdf_facture(facture):
+    """PDF d'une facture (courante ou archivée), ou None en cas d'erreur"""
+    from app.entreprise import get_config_entreprise
+
+    html_content = render_template('pdf/facture.html', facture=facture, config=get_config_entreprise())
+    return generer_pdf(html_content)
+
+
+def precharger(app):
+    """Importe le moteur PDF configuré (préchargement gunicorn, voir app/modules_differes.py)
+
+    Args:
+        app: L'instance Flask
+    """
+    importlib.import_module(MODULES_MOTEURS[app.config.get('PDF_ENGINE', 'xhtml2pdf')])
+
+
+def prechauffer_pdf(app):
+    """Paie au démarrage du worker le coût du premier PDF
+
+    Importe le moteur, compile les templates Jinja des PDF, fait un rendu
+    à blanc avec leurs feuilles de style (parsing CSS, métriques des polices)
+    et charge la configuration entreprise (logo encodé).
+
+    Args:
+        app: L'instance Flask
+    """
+    debut = time.perf_counter()
+
+    with app.app_context():
+        for nom in TEMPLATES_PDF:
+            # Compile le template (mis en cache par Jinja)
+            app.jinja_env.get_template(nom)
+
+            source = app.jinja_env.loader.get_source(app.jinja_env, nom)[0]
+            styles = ''.join(re.findall(r'<style>(.*?)</style>', source, re.S))
+            generer_pdf(
+                f'<html><head><meta charset="UTF-8"><style>{styles}</style></head>'
+                f'<body><div class="header"><div class="company-name">Préchauffage €</div></div>'
+                f'<table><thead><tr><th>A</th></tr></thead><tbody><tr><td>1</td></tr></tbody></table>'
+                f'</body></html>'
+            )
+
+        from app.entreprise import get_config_entreprise
+        try:
+            get_config_entreprise()
+        except Exception as error:
+            # Tables pas encore créées, base indisponible... le cache se remplira plus tard
+            app.logger.warning(f'Préchauffage config entreprise ignoré: {error}')
+
+    app.logger.info(f'🔥 Moteur PDF {app.config.get("PDF_ENGINE")} préchauffé '
+                    f'en {(time.perf_counter() - debut) * 1000:.0f} ms')
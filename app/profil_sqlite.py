@@ -0,0 +1,94 @@
+"""Réglages SQLite pour la production (petites installations sans PostgreSQL)
+
+Sans réglage, SQLite verrouille toute la base pendant une écriture (journal
+rollback) : avec plusieurs workers gunicorn, les lectures et écritures
+concurrentes finissent en "database is locked". À chaque nouvelle connexion
+on applique donc :
+- journal_mode=WAL : les lectures ne bloquent plus l'écriture (et inversement) ;
+- synchronous=NORMAL : pas de fsync à chaque commit en WAL (durable au checkpoint) ;
+- busy_timeout : un écrivain attend le verrou au lieu d'échouer aussitôt ;
+- mmap_size / cache_size / temp_store : lectures servies depuis la mémoire ;
+- foreign_keys=ON : SQLite ne vérifie pas les clés étrangères par défaut.
+
+La tâche 'optimiser-sqlite' (flask taches, ou TACHES_PLANIFIEES) lance
+périodiquement PRAGMA optimize et un checkpoint du WAL.
+"""
+from sqlalchemy import event
+from app import db
+from app.taches import tache
+
+
+def pragmas(config):
+    """Pragmas appliqués à chaque connexion, d'après la configuration
+
+    Args:
+        config: app.config (ou dict équivalent)
+
+    Returns:
+        list[tuple]: (nom, valeur) dans l'ordre d'application
+    """
+    return [
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        ('busy_timeout', config['SQLITE_BUSY_TIMEOUT']),
+        ('mmap_size', config['SQLITE_MMAP_SIZE']),
+        ('cache_size', -config['SQLITE_CACHE_KO']),  # négatif : taille en Kio, pas en pages
+        ('temp_store', 'MEMORY'),
+        ('journal_size_limit', config['SQLITE_TAILLE_WAL_MAX']),  # WAL tronqué à cette taille après checkpoint
+        ('foreign_keys', 'ON'),
+    ]
+
+
+def appliquer_pragmas(connexion, liste_pragmas):
+    """Applique les pragmas à une connexion sqlite3 (DBAPI)
+
+    Args:
+        connexion: Connexion sqlite3
+        liste_pragmas: Voir pragmas()
+    """
+    curseur = connexion.cursor()
+    for nom, valeur in liste_pragmas:
+        curseur.execute(f'PRAGMA {nom}={valeur}')
+    curseur.close()
+
+
+def _en_memoire(engine):
+    return engine.url.database in (None, '', ':memory:')
+
+
+def register_sqlite(app):
+    """Applique le profil à chaque connexion des bases SQLite (hors base en mémoire)
+
+    Désactivable avec SQLITE_OPTIMISATIONS=False (comparaison, diagnostic).
+
+    Args:
+        app: L'instance Flask
+    """
+    if not app.config['SQLITE_OPTIMISATIONS']:
+        return
+
+    liste_pragmas = pragmas(app.config)
+    with app.app_context():
+        engines = [engine for engine in db.engines.values()
+                   if engine.dialect.name == 'sqlite' and not _en_memoire(engine)]
+    for engine in engines:
+        event.listen(engine, 'connect', lambda connexion, _: appliquer_pragmas(connexion, liste_pragmas))
+
+    if engines:
+        tache('optimiser-sqlite')(optimiser_sqlite)
+
+
+def optimiser_sqlite():
+    """Met à jour les statistiques du planificateur (PRAGMA optimize) et reporte le WAL dans la base
+
+    Le checkpoint PASSIVE n'attend aucun lecteur : ce qui reste en cours de
+    lecture sera reporté au prochain passage.
+
+    Returns:
+        int: Nombre de pages du WAL reportées dans la base
+    """
+    # Hors transaction : un checkpoint ne peut pas s'exécuter dans une transaction ouverte
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connexion:
+        connexion.exec_driver_sql('PRAGMA optimize')
+        _, _, pages_reportees = connexion.exec_driver_sql('PRAGMA wal_checkpoint(PASSIVE)').one()
+    return max(pages_reportees, 0)
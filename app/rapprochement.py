@@ -0,0 +1,256 @@
+"""Rapprochement des relevés bancaires avec les factures non soldées
+
+Les factures ouvertes sont chargées une seule fois dans un index en mémoire
+(par numéro, par reste à payer, par nom de client) : chaque crédit du relevé
+est rapproché par quelques accès dictionnaire, sans requête SQL. Tous les
+paiements rapprochés sont appliqués dans la même transaction ; les cas
+ambigus sont enregistrés 'a_verifier' pour l'écran de vérification.
+"""
+import hashlib
+import re
+from collections import defaultdict, namedtuple, Counter
+from app import db
+from app.models import Facture, OperationBancaire
+from app.paiements import appliquer_paiement
+from app.releves import lire_releve, normaliser
+from app.resume_clients import actualiser_resumes
+
+MODE_PAIEMENT = 'Paiement par virement'
+
+# Numéro de facture cité dans un libellé normalisé : "fact 042", "facture n 42", "fa 042", "inv 42"
+# ("ref" et "f" seuls sont exclus : "REF 17" ou "PRLV F 3" désignent d'autres références)
+RE_NUMERO_FACTURE = re.compile(r'\b(?:factures?|fact|fac|fa|inv|invoice)\s?(?:n|no|num)?\s?0*(\d{1,10})\b')
+
+# Mots ignorés dans les noms de clients (formes juridiques, civilités)
+MOTS_VIDES = {'sarl', 'sas', 'sasu', 'eurl', 'ste', 'societe', 'ets', 'etablissements', 'mr', 'mme', 'madame',
+              'monsieur', 'les', 'des'}
+
+# Part des mots du nom du client à retrouver dans le libellé
+SEUIL_NOM = 0.5
+
+# Nombre d'empreintes par requête IN lors de la recherche des opérations déjà importées
+TAILLE_LOT_EMPREINTES = 500
+
+# Résultat du rapprochement d'un crédit : paiements [(facture, montant)] à appliquer, ou
+# candidats proposés à la vérification (paiements vide), et explication
+Rapprochement = namedtuple('Rapprochement', 'paiements candidats motif')
+
+
+def _cle_numero(numero):
+    """Numéro de facture sans zéros de tête : '042' et 'FACT 42' se retrouvent"""
+    return numero.lstrip('0') or '0'
+
+
+def _mots_nom(*noms):
+    """Mots significatifs d'un nom de client (3 lettres et plus, hors formes juridiques)"""
+    return {mot for nom in noms for mot in normaliser(nom).split() if len(mot) >= 3 and mot not in MOTS_VIDES}
+
+
+def _mot_cite(mot, mots_libelle):
+    """Mot présent dans le libellé, éventuellement tronqué par la banque ('dupon' pour 'dupont')"""
+    return mot in mots_libelle or any(len(m) >= 4 and mot.startswith(m) for m in mots_libelle)
+
+
+class IndexFactures:
+    """Factures non soldées indexées par numéro, reste à payer et nom du client
+
+    L'index suit les paiements appliqués pendant l'import : deux virements
+    partiels du même relevé se rapprochent de la même facture.
+    """
+
+    def __init__(self, factures):
+        self.par_numero = {}
+        self.par_montant = defaultdict(set)
+        self.par_prefixe_nom = defaultdict(set)  # 4 premières lettres d'un mot du nom -> factures
+        self.mots_clients = {}
+        for facture in factures:
+            self.par_numero[_cle_numero(facture.numero)] = facture
+            self.par_montant[facture.reste_a_payer].add(facture)
+            mots = _mots_nom(facture.client.nom, facture.client.entreprise)
+            self.mots_clients[facture.id] = mots
+            for mot in mots:
+                self.par_prefixe_nom[mot[:4]].add(facture)
+
+    def _nom_cite(self, facture, mots_libelle):
+        mots = self.mots_clients[facture.id]
+        if not mots:
+            return False
+        return sum(_mot_cite(mot, mots_libelle) for mot in mots) / len(mots) >= SEUIL_NOM
+
+    def _par_nom(self, mots_libelle):
+        """Factures ouvertes dont le nom du client figure (même approximativement) dans le libellé"""
+        proches = set()
+        for mot in mots_libelle:
+            if len(mot) >= 4:
+                proches |= self.par_prefixe_nom.get(mot[:4], set())
+        return sorted((f for f in proches if self._nom_cite(f, mots_libelle)), key=lambda f: f.id)
+
+    def rapprocher(self, transaction):
+        """Cherche la ou les factures réglées par un crédit
+
+        Dans l'ordre : numéro de facture cité dans le libellé, puis montant
+        exact (départagé par le nom du client), puis paiement partiel probable
+        d'après le nom du client (toujours à vérifier).
+
+        Un paiement n'est appliqué sans vérification que si deux indices
+        concordent : numéro et montant exact, ou nom du client avec le numéro
+        (paiement partiel) ou avec le montant exact. Un indice seul propose
+        la facture à la vérification.
+
+        Args:
+            transaction: Transaction lue sur le relevé
+
+        Returns:
+            Rapprochement
+        """
+        texte = normaliser(transaction.libelle)
+        mots_libelle = set(texte.split())
+        montant = transaction.montant
+
+        cites = sorted({self.par_numero[cle] for cle in RE_NUMERO_FACTURE.findall(texte) if cle in self.par_numero},
+                       key=lambda f: f.id)
+        if len(cites) == 1:
+            facture = cites[0]
+            if montant == facture.reste_a_payer:
+                return Rapprochement([(facture, montant)], cites, 'numéro et montant')
+            if montant < facture.reste_a_payer:
+                if self._nom_cite(facture, mots_libelle):
+                    return Rapprochement([(facture, montant)], cites, 'numéro et nom du client (paiement partiel)')
+                return Rapprochement([], cites, 'numéro seul, paiement partiel (nom du client absent)')
+            return Rapprochement([], cites, f'montant supérieur au reste à payer de la facture {facture.numero}')
+        if len(cites) > 1:
+            if montant == sum(f.reste_a_payer for f in cites):
+                return Rapprochement([(f, f.reste_a_payer) for f in cites], cites, 'numéros et montant total')
+            return Rapprochement([], cites, 'plusieurs factures citées, montant différent du total')
+
+        meme_montant = sorted(self.par_montant.get(montant, ()), key=lambda f: f.id)
+        if meme_montant:
+            par_nom = [f for f in meme_montant if self._nom_cite(f, mots_libelle)]
+            if len(par_nom) == 1:
+                return Rapprochement([(par_nom[0], montant)], par_nom, 'montant exact et nom du client')
+            if len(meme_montant) == 1:
+                return Rapprochement([], meme_montant, 'montant exact seul (nom du client absent)')
+            return Rapprochement([], par_nom or meme_montant, 'plusieurs factures de ce montant')
+
+        proches = [f for f in self._par_nom(mots_libelle) if f.reste_a_payer >= montant]
+        if proches:
+            return Rapprochement([], proches, 'paiement partiel probable (nom du client)')
+        return Rapprochement([], [], 'aucune facture correspondante')
+
+    def payer(self, facture, montant, date_paiement):
+        """Applique un paiement et met l'index à jour (reste à payer, facture soldée)"""
+        self.par_montant[facture.reste_a_payer].discard(facture)
+        if appliquer_paiement(facture, montant, MODE_PAIEMENT, date_paiement):
+            self.par_numero.pop(_cle_numero(facture.numero), None)
+            for mot in self.mots_clients[facture.id]:
+                self.par_prefixe_nom[mot[:4]].discard(facture)
+        else:
+            self.par_montant[facture.reste_a_payer].add(facture)
+
+
+def _empreintes(transactions):
+    """Identifiant stable de chaque crédit (référence bancaire, sinon date, montant, libellé et rang)
+
+    Le rang distingue deux virements identiques le même jour dans un relevé.
+    """
+    vus = Counter()
+    empreintes = []
+    for transaction in transactions:
+        if transaction.reference:
+            source = f'ref|{transaction.reference}'
+        else:
+            cle = (transaction.date, transaction.montant, normaliser(transaction.libelle))
+            vus[cle] += 1
+            source = f'{cle[0].isoformat()}|{cle[1]}|{cle[2]}|{vus[cle]}'
+        empreintes.append(hashlib.sha1(source.encode()).hexdigest())
+    return empreintes
+
+
+def _deja_importees(empreintes):
+    deja = set()
+    for debut in range(0, len(empreintes), TAILLE_LOT_EMPREINTES):
+        lot = empreintes[debut:debut + TAILLE_LOT_EMPREINTES]
+        deja.update(db.session.scalars(
+            db.select(OperationBancaire.empreinte).where(OperationBancaire.empreinte.in_(lot))
+        ))
+    return deja
+
+
+def factures_ouvertes():
+    """Factures courantes non soldées, avec leur client (une requête)"""
+    return (Facture.query
+            .options(db.joinedload(Facture.client))
+            .filter(Facture.etat_paiement != 'Payé', Facture.reste_a_payer > 0)
+            .all())
+
+
+def importer_releve(flux, nom_fichier=''):
+    """Lit un relevé, rapproche ses crédits et applique les paiements (sans commit)
+
+    Les crédits déjà importés (même empreinte) sont ignorés.
+
+    Args:
+        flux: Fichier binaire du relevé (CSV ou CAMT.053)
+        nom_fichier: Nom du fichier envoyé
+
+    Returns:
+        dict: Compteurs 'lues', 'deja_importees', 'rapprochees', 'a_verifier'
+
+    Raises:
+        ValueError: Relevé illisible
+    """
+    transactions = list(lire_releve(flux, nom_fichier))
+    empreintes = _empreintes(transactions)
+    deja = _deja_importees(empreintes)
+
+    index = IndexFactures(factures_ouvertes())
+    compteurs = {'lues': len(transactions), 'deja_importees': 0, 'rapprochees': 0, 'a_verifier': 0}
+    clients = set()
+
+    for transaction, empreinte in zip(transactions, empreintes):
+        if empreinte in deja:
+            compteurs['deja_importees'] += 1
+            continue
+        deja.add(empreinte)
+
+        resultat = index.rapprocher(transaction)
+        for facture, montant in resultat.paiements:
+            index.payer(facture, montant, transaction.date)
+            clients.add(facture.client_id)
+
+        factures = [facture for facture, _ in resultat.paiements]
+        db.session.add(OperationBancaire(
+            empreinte=empreinte,
+            date=transaction.date,
+            montant=transaction.montant,
+            libelle=transaction.libelle,
+            statut='rapprochee' if factures else 'a_verifier',
+            motif=resultat.motif,
+            candidats=[facture.id for facture in resultat.candidats],
+            facture_id=factures[0].id if len(factures) == 1 else None,
+            facture_numero=', '.join(facture.numero for facture in factures) or None,
+        ))
+        compteurs['rapprochees' if factures else 'a_verifier'] += 1
+
+    actualiser_resumes(*clients)
+    return compteurs
+
+
+def valider_operation(operation, facture):
+    """Applique une opération à vérifier sur la facture choisie (sans commit)
+
+    Un excédent éventuel n'est pas imputé : la facture est simplement soldée.
+
+    Args:
+        operation: OperationBancaire 'a_verifier'
+        facture: Facture courante non soldée
+    """
+    montant = min(operation.montant, facture.reste_a_payer)
+    appliquer_paiement(facture, montant, MODE_PAIEMENT, operation.date)
+    operation.statut = 'rapprochee'
+    operation.facture_id = facture.id
+    operation.facture_numero = facture.numero
+    operation.motif = 'validée manuellement'
+    if montant < operation.montant:
+        operation.motif += f' (excédent de {operation.montant - montant:.2f} €)'
+    actualiser_resumes(facture.client_id)
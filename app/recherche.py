@@ -0,0 +1,51 @@
+"""Recherche de clients par préfixe pour l'autocomplétion
+
+La recherche porte sur les colonnes nom_recherche et entreprise_recherche
+(texte en minuscules calculé en Python, voir Client) : comparer lower(nom)
+ne marcherait pas sur SQLite, dont lower() ignore les lettres accentuées
+(« Ér » ne trouverait pas « Éric »).
+"""
+from app import db
+from app.models import Client, normaliser_recherche
+
+LIMITE_DEFAUT = 10
+LIMITE_MAX = 25
+
+
+def _borne_superieure(prefixe):
+    """Plus petite chaîne supérieure à toutes celles qui commencent par `prefixe`
+
+    Ex: 'dup' -> 'duq'. Permet d'écrire la recherche par préfixe comme un
+    intervalle (>= prefixe AND < borne) que les index B-tree savent parcourir.
+    Valable dans l'ordre des points de code : collation BINARY de SQLite,
+    "C" sur PostgreSQL (voir app.models.texte_recherche).
+    """
+    return prefixe[:-1] + chr(ord(prefixe[-1]) + 1)
+
+
+def _filtre_prefixe(colonne, prefixe):
+    """Condition "colonne commence par prefixe" utilisant l'index de la colonne"""
+    return db.and_(colonne >= prefixe, colonne < _borne_superieure(prefixe))
+
+
+def rechercher_clients(texte, limite=LIMITE_DEFAUT):
+    """Clients dont le nom ou l'entreprise commence par `texte` (insensible à la casse)
+
+    Args:
+        texte: Début du nom ou de l'entreprise saisi par l'utilisateur
+        limite: Nombre maximum de résultats (plafonné à LIMITE_MAX)
+
+    Returns:
+        list[Client]: Clients triés par nom, au plus `limite`
+    """
+    prefixe = normaliser_recherche(texte)
+    if not prefixe:
+        return []
+
+    limite = max(1, min(limite or LIMITE_DEFAUT, LIMITE_MAX))
+    return (Client.query
+            .filter(db.or_(_filtre_prefixe(Client.nom_recherche, prefixe),
+                           _filtre_prefixe(Client.entreprise_recherche, prefixe)))
+            .order_by(Client.nom)
+            .limit(limite)
+            .all())
@@ -0,0 +1,240 @@
+"""Lecture des relevés bancaires (CSV, CAMT.053) en flux
+
+Les lecteurs sont des générateurs : le fichier est parcouru une seule fois
+sans être chargé en entier (ligne à ligne pour le CSV, iterparse pour le
+XML). Seuls les crédits (paiements reçus) sont retournés.
+"""
+import csv
+import io
+import re
+import unicodedata
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from datetime import datetime
+from app.montants import to_decimal, arrondir
+
+# Crédit lu sur un relevé ; reference : identifiant unique fourni par la banque, ou ''
+Transaction = namedtuple('Transaction', 'date montant libelle reference')
+
+# En-têtes CSV reconnus (après normaliser()) pour chaque champ
+COLONNES_CSV = {
+    'date': ('date', 'date operation', 'date de l operation', 'date comptable', 'date de comptabilisation',
+             'date valeur', 'date de valeur', 'booking date'),
+    'libelle': ('libelle', 'libelle operation', 'libelle de l operation', 'description', 'intitule', 'motif',
+                'details', 'communication'),
+    'montant': ('montant', 'montant eur', 'montant en euros', 'amount'),
+    'credit': ('credit', 'credit eur', 'credit en euros'),
+    'reference': ('reference', 'ref', 'reference operation', 'reference de l operation'),
+}
+
+# Nombre de lignes parcourues pour trouver l'en-tête (certaines banques ajoutent un préambule)
+LIGNES_PREAMBULE_MAX = 20
+
+FORMATS_DATE = ('%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', '%d.%m.%Y', '%d/%m/%y')
+
+
+def normaliser(texte):
+    """Minuscules sans accents ni ponctuation : 'Réf. N°042' -> 'ref n042'"""
+    texte = unicodedata.normalize('NFKD', texte or '').encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', texte.lower()).split())
+
+
+def _montant(texte):
+    """Montant au format bancaire ('1 234,56', '1.234,56', '+1234.56 €') en Decimal, ou None"""
+    texte = re.sub(r'[\s €+]', '', texte or '')
+    if ',' in texte and '.' in texte:
+        # Le dernier séparateur est le séparateur décimal
+        milliers = '.' if texte.rfind(',') > texte.rfind('.') else ','
+        texte = texte.replace(milliers, '')
+    montant = to_decimal(texte, defaut=None)
+    try:
+        return arrondir(montant) if montant is not None else None
+    except ValueError:
+        return None
+
+
+def _date(texte):
+    texte = (texte or '').strip()[:10]
+    for format_date in FORMATS_DATE:
+        try:
+            return datetime.strptime(texte, format_date).date()
+        except ValueError:
+            continue
+    return None
+
+
+# ========== CSV ==========
+
+def _texte(flux):
+    """Flux texte sur le fichier binaire (UTF-8, sinon Windows-1252 comme la plupart des exports bancaires)"""
+    debut = flux.read(4096)
+    flux.seek(0)
+    try:
+        debut.decode('utf-8')
+        encodage = 'utf-8-sig'
+    except UnicodeDecodeError as erreur:
+        # Caractère multi-octets coupé en fin d'échantillon : c'est bien de l'UTF-8
+        encodage = 'utf-8-sig' if erreur.start >= len(debut) - 3 else 'cp1252'
+    return io.TextIOWrapper(flux, encoding=encodage, errors='replace', newline='')
+
+
+def _colonnes(entete):
+    """Position de chaque champ connu dans la ligne d'en-tête, ou None si ce n'est pas un en-tête"""
+    noms = [normaliser(cellule) for cellule in entete]
+    positions = {}
+    for champ, alias in COLONNES_CSV.items():
+        for position, nom in enumerate(noms):
+            if nom in alias:
+                positions[champ] = position
+                break
+    if 'date' in positions and ('montant' in positions or 'credit' in positions):
+        return positions
+    return None
+
+
+class _PointVirgule(csv.excel):
+    """Dialecte par défaut des exports bancaires français"""
+    delimiter = ';'
+
+
+def lire_csv(flux):
+    """Crédits d'un relevé CSV (séparateur et encodage détectés)
+
+    Colonnes attendues : une date, un libellé, et un montant signé ou une
+    colonne crédit (les noms usuels des banques françaises sont reconnus).
+
+    Args:
+        flux: Fichier binaire ouvert (ex: FileStorage.stream)
+
+    Yields:
+        Transaction
+
+    Raises:
+        ValueError: En-tête non reconnu
+    """
+    texte = _texte(flux)
+    echantillon = texte.read(4096)
+    texte.seek(0)
+    try:
+        dialecte = csv.Sniffer().sniff(echantillon, delimiters=';,\t')
+    except csv.Error:
+        dialecte = _PointVirgule
+
+    lignes = csv.reader(texte, dialecte)
+    positions = None
+    for numero, ligne in enumerate(lignes):
+        positions = _colonnes(ligne)
+        if positions is not None or numero >= LIGNES_PREAMBULE_MAX:
+            break
+    if positions is None:
+        raise ValueError('En-tête CSV non reconnu : colonnes "Date" et "Montant" (ou "Crédit") attendues')
+
+    def cellule(ligne, champ):
+        position = positions.get(champ)
+        return ligne[position].strip() if position is not None and position < len(ligne) else ''
+
+    for ligne in lignes:
+        date_operation = _date(cellule(ligne, 'date'))
+        montant = _montant(cellule(ligne, 'credit') or cellule(ligne, 'montant'))
+        if date_operation is None or montant is None or montant <= 0:
+            continue  # ligne de débit, de total ou vide
+        yield Transaction(date_operation, montant, cellule(ligne, 'libelle'), cellule(ligne, 'reference'))
+
+
+# ========== CAMT.053 (ISO 20022) ==========
+
+def _local(tag):
+    """Nom d'élément sans espace de noms (les versions de camt.053 en changent)"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _enfant(element, *chemin):
+    """Premier descendant suivant le chemin de noms locaux, ou None"""
+    for nom in chemin:
+        if element is None:
+            return None
+        element = next((enfant for enfant in element if _local(enfant.tag) == nom), None)
+    return element
+
+
+def _texte_de(element, *chemin):
+    trouve = _enfant(element, *chemin)
+    return (trouve.text or '').strip() if trouve is not None else ''
+
+
+def _textes(element, *noms):
+    """Textes de tous les descendants portant l'un des noms locaux"""
+    return [enfant.text.strip() for enfant in element.iter()
+            if _local(enfant.tag) in noms and enfant.text and enfant.text.strip()]
+
+
+def _transactions_entree(entree):
+    """Crédits d'une entrée <Ntry> (une par <TxDtls> si l'entrée regroupe plusieurs virements)"""
+    if _texte_de(entree, 'CdtDbtInd') != 'CRDT' or _texte_de(entree, 'RvslInd').lower() == 'true':
+        return []
+
+    date_operation = _date(_texte_de(entree, 'BookgDt', 'Dt') or _texte_de(entree, 'BookgDt', 'DtTm')
+                           or _texte_de(entree, 'ValDt', 'Dt'))
+    if date_operation is None:
+        return []
+    reference_entree = _texte_de(entree, 'AcctSvcrRef') or _texte_de(entree, 'NtryRef')
+    informations = _textes(entree, 'AddtlNtryInf')
+
+    details = [detail for detail in entree.iter() if _local(detail.tag) == 'TxDtls']
+    if len(details) <= 1:
+        # Cas courant : un virement par entrée, montant de l'entrée
+        montant = _montant(_texte_de(entree, 'Amt'))
+        textes = _textes(details[0], 'Ustrd', 'Ref', 'Nm', 'AddtlTxInf') if details else []
+        if montant is None or montant <= 0:
+            return []
+        return [Transaction(date_operation, montant, ' '.join(textes + informations), reference_entree)]
+
+    transactions = []
+    for position, detail in enumerate(details):
+        montant = _montant(_texte_de(detail, 'AmtDtls', 'TxAmt', 'Amt') or _texte_de(detail, 'Amt'))
+        if montant is None or montant <= 0:
+            continue
+        reference = _texte_de(detail, 'Refs', 'AcctSvcrRef') or _texte_de(detail, 'Refs', 'EndToEndId')
+        if not reference or reference == 'NOTPROVIDED':
+            reference = f'{reference_entree}/{position}' if reference_entree else ''
+        textes = _textes(detail, 'Ustrd', 'Ref', 'Nm', 'AddtlTxInf')
+        transactions.append(Transaction(date_operation, montant, ' '.join(textes + informations), reference))
+    return transactions
+
+
+def lire_camt053(flux):
+    """Crédits d'un relevé CAMT.053 (XML ISO 20022), quelle que soit sa version
+
+    Args:
+        flux: Fichier binaire ouvert
+
+    Yields:
+        Transaction
+
+    Raises:
+        ValueError: XML invalide
+    """
+    try:
+        for _, element in ET.iterparse(flux, events=('end',)):
+            if _local(element.tag) == 'Ntry':
+                yield from _transactions_entree(element)
+                element.clear()  # libère l'entrée traitée
+    except ET.ParseError as erreur:
+        raise ValueError(f'Fichier CAMT.053 invalide : {erreur}') from erreur
+
+
+def lire_releve(flux, nom_fichier=''):
+    """Crédits d'un relevé, format déduit de l'extension ou du contenu
+
+    Args:
+        flux: Fichier binaire ouvert et repositionnable (seek)
+        nom_fichier: Nom du fichier envoyé
+
+    Yields:
+        Transaction
+    """
+    debut = flux.read(64).lstrip(b'\xef\xbb\xbf \t\r\n')
+    flux.seek(0)
+    if nom_fichier.lower().endswith('.xml') or debut.startswith(b'<'):
+        return lire_camt053(flux)
+    return lire_csv(flux)
@@ -0,0 +1,73 @@
+"""Routage des lectures vers un réplica PostgreSQL (optionnel)
+
+Les vues marquées @lecture_replica lisent sur le bind 'replica' s'il est
+configuré (REPLICA_DATABASE_URL). Tout le reste (écritures, flush, vues non
+marquées) reste sur la base principale.
+
+Lecture de ses propres écritures : après un commit, la session du navigateur
+est marquée quelques secondes (REPLICA_DELAI_LECTURE) et ses lectures restent
+sur la principale, le temps que le réplica rattrape son retard.
+"""
+import time
+from functools import wraps
+from flask import g, session, has_request_context, current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql.dml import UpdateBase
+
+BIND_REPLICA = 'replica'
+
+
+class SessionRoutage(Session):
+    """Session SQLAlchemy qui envoie les lectures des vues marquées vers le réplica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not isinstance(clause, UpdateBase) \
+                and has_request_context() and g.get('lecture_replica'):
+            replica = self._db.engines.get(BIND_REPLICA)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def lecture_replica(vue):
+    """Décorateur : les requêtes SQL de la vue peuvent être servies par le réplica"""
+    @wraps(vue)
+    def vue_routee(*args, **kwargs):
+        derniere_ecriture = session.get('derniere_ecriture', 0)
+        g.lecture_replica = time.time() - derniere_ecriture > current_app.config['REPLICA_DELAI_LECTURE']
+        return vue(*args, **kwargs)
+    return vue_routee
+
+
+def lecture_sur_replica():
+    """Indique si les lectures de la requête en cours sont servies par le réplica
+
+    Returns:
+        bool: Vrai dans une vue @lecture_replica hors délai de relecture, réplica configuré
+    """
+    return has_request_context() and bool(g.get('lecture_replica')) \
+        and BIND_REPLICA in current_app.config.get('SQLALCHEMY_BINDS', {})
+
+
+@event.listens_for(SessionRoutage, 'after_commit')
+def _noter_ecriture(db_session):
+    """Retient qu'une écriture a eu lieu pendant la requête (voir register_replica)"""
+    if has_request_context():
+        g.a_ecrit = True
+
+
+def register_replica(app):
+    """Mémorise l'heure de la dernière écriture dans la session du navigateur
+
+    Args:
+        app: L'instance Flask
+    """
+    if BIND_REPLICA not in app.config.get('SQLALCHEMY_BINDS', {}):
+        return
+
+    @app.after_request
+    def memoriser_ecriture(response):
+        if g.get('a_ecrit'):
+            session['derniere_ecriture'] = time.time()
+        return response
@@ -0,0 +1,126 @@
+"""Compteurs dénormalisés par client (table clients_resume)
+
+Chaque route qui crée, modifie ou supprime un devis ou une facture appelle
+actualiser_resumes() avant son commit : les compteurs des clients concernés
+sont recalculés dans la même transaction que l'écriture. La liste et la fiche
+client lisent ensuite une seule ligne par client.
+
+Les lignes de clients_resume concernées sont verrouillées (SELECT ... FOR
+UPDATE) avant le recalcul : sous PostgreSQL (READ COMMITTED), deux écritures
+concurrentes pour un même client se suivent, et la seconde compte les
+documents que la première vient de valider au lieu d'écraser ses compteurs
+avec un état périmé. SQLite n'a qu'un écrivain à la fois. En cas de doute,
+flask reparer-resumes recalcule tout.
+
+L'archivage ne déplace que des lignes entre tables courantes et d'archive : les
+compteurs, qui couvrent les deux, n'ont pas à être recalculés.
+"""
+from datetime import datetime, time
+from app import db
+from app.models import (ClientResume, Client, Devis, DevisArchive, Facture, FactureArchive)
+from app.montants import ZERO
+
+STATUTS_DEVIS = ('brouillon', 'envoye', 'accepte', 'refuse', 'expire')
+
+# Nombre de clients recalculés par requête d'agrégation lors d'une reconstruction
+TAILLE_LOT = 500
+
+
+def _calculer(client_ids):
+    """Agrège devis et factures (courants et archivés) des clients donnés
+
+    Args:
+        client_ids: ids des clients à calculer
+
+    Returns:
+        dict client_id -> dict des colonnes de ClientResume
+    """
+    resumes = {client_id: {
+        **{f'nb_devis_{statut}': 0 for statut in STATUTS_DEVIS},
+        'total_facture': ZERO,
+        'reste_a_payer': ZERO,
+        'derniere_activite': None,
+    } for client_id in client_ids}
+
+    def activite(resume, instant):
+        if instant is not None and (resume['derniere_activite'] is None or instant > resume['derniere_activite']):
+            resume['derniere_activite'] = instant
+
+    for modele in (Devis, DevisArchive):
+        lignes = (db.session.query(modele.client_id, modele.statut, db.func.count(modele.id),
+                                   db.func.max(modele.updated_at))
+                  .filter(modele.client_id.in_(client_ids))
+                  .group_by(modele.client_id, modele.statut))
+        for client_id, statut, nombre, modifie_le in lignes:
+            resume = resumes[client_id]
+            if statut in STATUTS_DEVIS:
+                resume[f'nb_devis_{statut}'] += nombre
+            activite(resume, modifie_le)
+
+    for modele in (Facture, FactureArchive):
+        lignes = (db.session.query(modele.client_id, db.func.sum(modele.montant_ttc),
+                                   db.func.sum(modele.reste_a_payer), db.func.max(modele.created_at),
+                                   db.func.max(modele.date_paiement))
+                  .filter(modele.client_id.in_(client_ids))
+                  .group_by(modele.client_id))
+        for client_id, total, reste, cree_le, paye_le in lignes:
+            resume = resumes[client_id]
+            resume['total_facture'] += total or ZERO
+            resume['reste_a_payer'] += reste or ZERO
+            activite(resume, cree_le)
+            activite(resume, datetime.combine(paye_le, time()) if paye_le else None)
+
+    return resumes
+
+
+def _enregistrer(resumes):
+    """Écrit les résumés calculés (création de la ligne si absente), sans commit"""
+    existants = {r.client_id: r for r in ClientResume.query.filter(ClientResume.client_id.in_(list(resumes)))}
+    for client_id, valeurs in resumes.items():
+        resume = existants.get(client_id)
+        if resume is None:
+            resume = ClientResume(client_id=client_id)
+            db.session.add(resume)
+        for colonne, valeur in valeurs.items():
+            setattr(resume, colonne, valeur)
+
+
+def actualiser_resumes(*client_ids):
+    """Recalcule les compteurs des clients touchés par une écriture (avant le commit)
+
+    Les objets en attente sont d'abord envoyés en base (flush) pour être comptés,
+    puis les lignes de résumé sont verrouillées jusqu'au commit (dans l'ordre
+    des ids, pour que deux transactions ne s'attendent pas mutuellement).
+
+    Args:
+        *client_ids: ids des clients concernés (les None sont ignorés)
+    """
+    client_ids = {client_id for client_id in client_ids if client_id is not None}
+    if not client_ids:
+        return
+    db.session.flush()
+    (ClientResume.query.filter(ClientResume.client_id.in_(client_ids))
+     .order_by(ClientResume.client_id).with_for_update().all())
+    _enregistrer(_calculer(client_ids))
+
+
+def reconstruire_resumes(taille_lot=TAILLE_LOT):
+    """Recalcule les compteurs de tous les clients, par lots (commande de réparation)
+
+    Args:
+        taille_lot: Nombre de clients par lot (une transaction par lot)
+
+    Returns:
+        int: Nombre de clients recalculés
+    """
+    total = 0
+    dernier_id = 0
+    while True:
+        client_ids = [client_id for (client_id,) in db.session.query(Client.id)
+                      .filter(Client.id > dernier_id).order_by(Client.id).limit(taille_lot)]
+        if not client_ids:
+            return total
+        _enregistrer(_calculer(client_ids))
+        db.session.commit()
+        total += len(client_ids)
+        dernier_id = client_ids[-1]
@@ -1,12 +1,30 @@
 """Routes de l'application"""
 import json
+import time
 from flask import render_template, redirect, url_for, flash, request, jsonify, make_response, current_app as app
 from flask_login import login_user, logout_user, login_required, current_user
+from werkzeug.datastructures import MultiDict
 from app import db
-from app.models import Client, Devis, Facture, PrixCatalogue, DevisLigne, Config
+from app.models import (Client, ClientResume, Devis, Facture, PrixCatalogue, DevisLigne, ModeleDevis,
+                        DevisArchive, FactureArchive, EmailSortant, OperationBancaire, BrouillonDevis)
+from app.resume_clients import actualiser_resumes
 from app.forms import ClientForm, PrixForm, DevisForm
-from app.auth import User
-from datetime import datetime, date
+from app.auth import User, role_requis
+from app.replica import lecture_replica
+from app.cache_requetes import resultats_en_cache
+from app.limiteur import limiteur_connexions, cles_tentative
+from app.montants import arrondir, ZERO
+from app.paiements import appliquer_paiement
+from app.evenements import enregistrer_evenement
+from app.facturation import prochains_numeros_factures, convertir_en_facture
+from app.brouillons import (ConflitVersion, BrouillonExistant, creer_brouillon, enregistrer_operations,
+                            etat_brouillon, brouillon_en_cours, lignes_pour_devis)
+from app.modules_differes import pdf, emails, rapprochement
+from app.calculs import normaliser_ligne, calculer_totaux_lignes
+from app.recherche import rechercher_clients
+from app.duplication import (prochains_numeros_devis, parser_numeros_serie, dupliquer_devis,
+                             creer_devis_depuis_modele, enregistrer_comme_modele, TAILLE_LOT_MAX)
+from datetime import datetime
 
 
 # ========== ROUTES AUTHENTIFICATION ==========
@@ -21,11 +39,22 @@ def login():
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
+        cle_paire, cle_ip, cle_compte = cles = cles_tentative(request.remote_addr, username)
+        
+        # Refus immédiat (avant tout hachage) si le couple IP/compte, l'IP ou le compte est bloqué
+        attente = limiteur_connexions.verifier(*cles)
+        if attente:
+            app.logger.warning(f'⛔ Connexion refusée (trop de tentatives) - User: {username} - IP: {request.remote_addr}')
+            flash(f'Trop de tentatives. Réessayez dans {attente} secondes.', 'error')
+            return render_template('login.html'), 429
         
         # Vérifier les identifiants
         user = User.authenticate(username, password)
         
         if user:
+            # L'IP n'est pas remise à zéro : se connecter à un compte valide entre deux
+            # essais ne doit pas lever le blocage de l'IP pour les autres comptes
+            limiteur_connexions.reinitialiser(cle_paire, cle_compte)
             login_user(user, remember=True)
             # Log succès avec IP pour traçabilité
             app.logger.info(f'✅ Connexion réussie - User: {username} - IP: {request.remote_addr}')
@@ -36,6 +65,7 @@ def login():
             return redirect(next_page) if next_page else redirect(url_for('index'))
         else:
             # Log échec pour détecter les attaques
+            limiteur_connexions.enregistrer_echec(*cles)
             app.logger.warning(f'⚠️ Tentative de connexion échouée - User: {username} - IP: {request.remote_addr}')
             flash('Identifiants incorrects. Veuillez réessayer.', 'error')
     
@@ -54,10 +84,19 @@ def logout():
     return redirect(url_for('login'))
 
 
+@app.route('/api/metriques/connexions')
+@login_required
+@role_requis('admin')
+def api_metriques_connexions():
+    """Compteurs du limiteur de connexions (propres au worker qui répond)"""
+    return jsonify(limiteur_connexions.metriques)
+
+
 # ========== DASHBOARD ==========
 
 @app.route('/')
 @login_required
+@lecture_replica
 def index():
     """Page d'accueil - Dashboard"""
     # Statistiques rapides
@@ -77,24 +116,49 @@ def index():
 
 # ========== ROUTES CLIENTS ==========
 
+# Tris proposés sur la liste des clients (colonnes de clients_resume, NULL en dernier)
+TRIS_CLIENTS = {
+    'nom': (Client.nom,),
+    'reste': (ClientResume.reste_a_payer.desc().nullslast(), Client.nom),
+    'facture': (ClientResume.total_facture.desc().nullslast(), Client.nom),
+    'ouverts': ((ClientResume.nb_devis_brouillon + ClientResume.nb_devis_envoye).desc().nullslast(), Client.nom),
+    'activite': (ClientResume.derniere_activite.desc().nullslast(), Client.nom),
+}
+
+
 @app.route('/clients')
 @login_required
+@lecture_replica
 def clients_liste():
-    """Liste tous les clients"""
+    """Liste tous les clients avec leurs compteurs (lus dans clients_resume, sans agrégation)"""
     search = request.args.get('search', '')
+    tri = request.args.get('tri', 'nom')
+    if tri not in TRIS_CLIENTS:
+        tri = 'nom'
+    
+    query = db.session.query(Client, ClientResume).outerjoin(ClientResume)
     
     if search:
-        clients = Client.query.filter(
+        query = query.filter(
             db.or_(
                 Client.nom.ilike(f'%{search}%'),
                 Client.entreprise.ilike(f'%{search}%'),
                 Client.email.ilike(f'%{search}%')
             )
-        ).order_by(Client.nom).all()
-    else:
-        clients = Client.query.order_by(Client.nom).all()
+        )
+    
+    clients = query.order_by(*TRIS_CLIENTS[tri]).all()
     
-    return render_template('clients/liste.html', clients=clients, search=search)
+    return render_template('clients/liste.html', clients=clients, search=search, tri=tri)
+
+
+@app.route('/clients/<int:id>')
+@login_required
+@lecture_replica
+def client_voir(id):
+    """Fiche client : coordonnées et compteurs dénormalisés"""
+    client = Client.query.get_or_404(id)
+    return render_template('clients/voir.html', client=client, resume=client.resume)
 
 
 @app.route('/clients/ajouter', methods=['GET', 'POST'])
@@ -113,6 +177,7 @@ def client_ajouter():
             telephone=form.telephone.data,
             email=form.email.data
         )
+        client.resume = ClientResume()
         db.session.add(client)
         db.session.commit()
         
@@ -158,6 +223,7 @@ def client_supprimer(id):
 
 @app.route('/prix')
 @login_required
+@lecture_replica
 def prix_liste():
     """Liste tous les prix du catalogue"""
     categorie_filter = request.args.get('categorie', '')
@@ -238,29 +304,212 @@ def prix_supprimer(id):
 
 # ========== ROUTES DEVIS ==========
 
+def _enregistrer_lignes(devis, lignes):
+    """Crée les lignes d'un devis et met à jour ses totaux
+    
+    Le total TTC envoyé par le navigateur est ignoré : les totaux viennent de
+    calculer_totaux_lignes (déjà en cache si le même worker a servi l'appel
+    à l'API de recalcul pour ce brouillon).
+    
+    Args:
+        devis: Le devis (ses anciennes lignes doivent déjà être supprimées)
+        lignes: Lignes normalisées (voir _lignes_soumises)
+    """
+    for idx, ligne_data in enumerate(lignes):
+        devis.lignes.append(DevisLigne(ordre=idx + 1, total_ttc=ZERO, **ligne_data))
+    
+    devis.appliquer_totaux(calculer_totaux_lignes(lignes, devis.remise_pourcent))
+
+
+def _devis_ou_archive(id):
+    """Devis courant, sinon archivé (consultation et PDF uniquement), sinon 404"""
+    return db.session.get(Devis, id) or DevisArchive.query.get_or_404(id)
+
+
+def _facture_ou_archive(id):
+    """Facture courante, sinon archivée (consultation et PDF uniquement), sinon 404"""
+    return db.session.get(Facture, id) or FactureArchive.query.get_or_404(id)
+
+
+def _envois(natures, document_id):
+    """Historique des emails (en file, envoyés, en échec) d'un document, du plus récent au plus ancien"""
+    natures = (natures,) if isinstance(natures, str) else natures
+    return (EmailSortant.query
+            .filter(EmailSortant.nature.in_(natures), EmailSortant.document_id == document_id)
+            .order_by(EmailSortant.id.desc())
+            .limit(10)
+            .all())
+
+
+def _destinataire(document):
+    """Adresse saisie dans le formulaire, sinon celle du client ; None si invalide"""
+    destinataire = (request.form.get('destinataire') or document.client.email or '').strip()
+    return destinataire if '@' in destinataire else None
+
+
+# Nombre d'ids par requête IN lors du chargement d'une liste en cache
+TAILLE_LOT_IDS = 500
+
+# Documents affichés par page dans les listes de devis et de factures
+PAR_PAGE = 50
+
+
+def _ids_recherche(modeles, filtrer):
+    """Clés (archive, id) des documents trouvés, du plus récent au plus ancien
+
+    Args:
+        modeles: (modèle courant,) ou (modèle courant, modèle d'archive)
+        filtrer: Fonction(modèle, requête sur (id, created_at)) -> requête filtrée
+    """
+    lignes = []
+    for modele in modeles:
+        requete = filtrer(modele, db.session.query(modele.id, modele.created_at))
+        lignes.extend((modele.archive, id_document, cree_le) for id_document, cree_le in requete)
+    lignes.sort(key=lambda ligne: ligne[2], reverse=True)
+    return [(archive, id_document) for archive, id_document, _ in lignes]
+
+
+def _page(cles):
+    """Clés de la page demandée (?page=, 1 par défaut) d'une liste en cache
+
+    Args:
+        cles: Liste complète des clés (voir _ids_recherche)
+
+    Returns:
+        tuple: (clés de la page, dict numero / pages / total pour le template)
+    """
+    pages = max(1, -(-len(cles) // PAR_PAGE))
+    numero = min(max(request.args.get('page', 1, type=int), 1), pages)
+    debut = (numero - 1) * PAR_PAGE
+    return cles[debut:debut + PAR_PAGE], {'numero': numero, 'pages': pages, 'total': len(cles)}
+
+
+def _documents(cles, modele, modele_archive, options):
+    """Charge par clé primaire les documents d'une recherche (en cache), dans l'ordre des clés
+
+    Args:
+        cles: Liste de (archive, id) (voir _ids_recherche)
+        modele, modele_archive: Modèles courant et d'archive
+        options: Fonction(modèle) -> options de chargement (relations affichées)
+    """
+    par_cle = {}
+    for archive, classe in ((False, modele), (True, modele_archive)):
+        ids = [id_document for est_archive, id_document in cles if est_archive == archive]
+        for debut in range(0, len(ids), TAILLE_LOT_IDS):
+            lot = ids[debut:debut + TAILLE_LOT_IDS]
+            for document in classe.query.options(*options(classe)).filter(classe.id.in_(lot)):
+                par_cle[(archive, document.id)] = document
+    # Un document supprimé depuis le calcul de la liste est simplement omis
+    return [par_cle[cle] for cle in cles if cle in par_cle]
+
+
+def _lignes_soumises(devis_id):
+    """Lignes envoyées avec le formulaire de devis
+    
+    Si le brouillon enregistré automatiquement est à jour (brouillon_id et
+    brouillon_version, sans lignes_json), ses lignes déjà normalisées sont
+    reprises telles quelles. Sinon (brouillon en retard sur le navigateur,
+    ou pas de brouillon), les lignes viennent de lignes_json.
+    
+    Args:
+        devis_id: Devis édité, ou None pour un nouveau devis
+    
+    Returns:
+        tuple: (lignes normalisées, ou None si le formulaire n'en envoie pas ;
+                brouillon à supprimer avec l'enregistrement, ou None)
+    
+    Raises:
+        ConflitVersion: Le brouillon a changé depuis la version soumise, ou n'existe
+                        plus (abandonné ou enregistré depuis un autre onglet)
+        ValueError: lignes_json illisible, ou valeur trop grande pour la base
+    """
+    brouillon = None
+    brouillon_id = request.form.get('brouillon_id', type=int)
+    if brouillon_id:
+        brouillon = BrouillonDevis.query.filter_by(id=brouillon_id, utilisateur=current_user.username,
+                                                   devis_id=devis_id).first()
+    
+    lignes_data = request.form.get('lignes_json')
+    if lignes_data:
+        return [normaliser_ligne(ligne_data) for ligne_data in json.loads(lignes_data)], brouillon
+    if brouillon_id and brouillon is None:
+        # Seul l'id du brouillon a été soumis : sans lui, les lignes saisies sont inconnues
+        raise ConflitVersion()
+    if brouillon is None:
+        return None, None
+    if request.form.get('brouillon_version', type=int) != brouillon.version:
+        raise ConflitVersion()
+    return lignes_pour_devis(brouillon), brouillon
+
+
+def _brouillon_formulaire(form, devis=None):
+    """Reprend dans le formulaire le brouillon en cours de l'utilisateur, s'il en a un
+    
+    Les champs du brouillon ne remplacent ceux du formulaire qu'à l'affichage
+    initial (GET) : après une soumission refusée, la saisie est conservée.
+    
+    Args:
+        form: Le DevisForm
+        devis: Le devis édité, ou None pour un nouveau devis
+    
+    Returns:
+        tuple: (lignes du brouillon ou None, état du brouillon pour devis-form.js)
+    """
+    devis_id = devis.id if devis else None
+    etat = {'id': None, 'version': 0, 'devis_id': devis_id, 'restaure': None,
+            'cle': f'brouillon-devis:{current_user.username}:{devis_id or "nouveau"}'}
+    
+    brouillon = brouillon_en_cours(current_user.username, devis_id)
+    if brouillon is None:
+        return None, etat
+    
+    if request.method == 'GET':
+        form.process(formdata=MultiDict(brouillon.champs), obj=devis)
+    etat.update(id=brouillon.id, version=brouillon.version,
+                restaure=brouillon.updated_at.strftime('%d/%m/%Y à %H:%M UTC'))
+    return brouillon.lignes, etat
+
+
+def _client_choisi(form):
+    """Client actuellement sélectionné dans le formulaire de devis (pour l'autocomplétion)"""
+    return db.session.get(Client, form.client_id.data) if form.client_id.data else None
+
+
 @app.route('/devis')
 @login_required
+@lecture_replica
 def devis_liste():
     """Liste tous les devis"""
     search = request.args.get('search', '')
     statut_filter = request.args.get('statut', '')
-    
-    query = Devis.query
-    
-    if search:
-        query = query.join(Client).filter(
-            db.or_(
-                Devis.numero.ilike(f'%{search}%'),
-                Client.nom.ilike(f'%{search}%')
+    avec_archives = request.args.get('archives') == '1'
+    
+    def filtrer(modele, query):
+        if search:
+            query = query.join(Client, modele.client_id == Client.id).filter(
+                db.or_(
+                    modele.numero.ilike(f'%{search}%'),
+                    Client.nom.ilike(f'%{search}%')
+                )
             )
-        )
-    
-    if statut_filter:
-        query = query.filter_by(statut=statut_filter)
-    
-    devis = query.order_by(Devis.created_at.desc()).all()
-    
-    return render_template('devis/liste.html', devis=devis, search=search, statut_filter=statut_filter)
+        
+        if statut_filter:
+            query = query.filter(modele.statut == statut_filter)
+        
+        return query
+    
+    # Liste des ids mise en cache par filtres (invalidée à chaque écriture sur ces tables)
+    modeles = (Devis, DevisArchive) if avec_archives else (Devis,)
+    cles = resultats_en_cache('devis_liste',
+                              {'search': search, 'statut': statut_filter, 'archives': avec_archives},
+                              (Devis, DevisArchive, Client),
+                              lambda: _ids_recherche(modeles, filtrer))
+    # Seule la page affichée est chargée, par clé primaire
+    cles, page = _page(cles)
+    devis = _documents(cles, Devis, DevisArchive, lambda modele: [db.joinedload(modele.client)])
+    
+    return render_template('devis/liste.html', devis=devis, page=page, search=search,
+                           statut_filter=statut_filter, avec_archives=avec_archives)
 
 
 @app.route('/devis/nouveau', methods=['GET', 'POST'])
@@ -269,21 +518,23 @@ def devis_nouveau():
     """Créer un nouveau devis"""
     form = DevisForm()
     
-    # Charger les clients pour le select
-    form.client_id.choices = [(c.id, f"{c.nom} {('- ' + c.entreprise) if c.entreprise else ''}") for c in Client.query.order_by(Client.nom).all()]
-    
     if form.validate_on_submit():
+        try:
+            lignes, brouillon = _lignes_soumises(None)
+            if lignes is None:
+                raise ValueError('aucune ligne reçue avec le formulaire')
+            # Vérifie les totaux avant toute écriture (résultat en cache pour _enregistrer_lignes)
+            calculer_totaux_lignes(lignes, form.remise_pourcent.data)
+        except ConflitVersion:
+            flash('Le brouillon a été modifié ou enregistré dans un autre onglet : '
+                  'vérifiez les lignes puis enregistrez à nouveau.', 'error')
+            return redirect(url_for('devis_nouveau'))
+        except ValueError as e:
+            flash(f'Lignes refusées : {e}', 'error')
+            return redirect(url_for('devis_nouveau'))
+        
         # Générer le numéro de devis
-        dernier_devis = Devis.query.order_by(Devis.id.desc()).first()
-        if dernier_devis and dernier_devis.numero:
-            # Extraire le numéro et incrémenter
-            try:
-                dernier_num = int(dernier_devis.numero.replace('N°', ''))
-                nouveau_num = f"N°{str(dernier_num + 1).zfill(3)}"
-            except (ValueError, AttributeError):
-                nouveau_num = "N°001"
-        else:
-            nouveau_num = "N°001"
+        nouveau_num = prochains_numeros_devis()[0]
         
         # Créer le devis
         devis = Devis(
@@ -293,54 +544,46 @@ def devis_nouveau():
             numero_serie=form.numero_serie.data,
             inventaire=form.inventaire.data,
             validite_jours=form.validite_jours.data,
-            remise_pourcent=form.remise_pourcent.data,
-            acompte=form.acompte.data,
+            remise_pourcent=arrondir(form.remise_pourcent.data),
+            acompte=arrondir(form.acompte.data),
             statut=form.statut.data
         )
         
-        # Récupérer les lignes du formulaire (envoyées via JSON)
-        lignes_data = request.form.get('lignes_json')
-        if lignes_data:
-            lignes = json.loads(lignes_data)
-            
-            for idx, ligne_data in enumerate(lignes):
-                ligne = DevisLigne(
-                    tache=ligne_data.get('tache', ''),
-                    vehicule=ligne_data.get('vehicule', ''),
-                    description=ligne_data.get('description', ''),
-                    quantite=int(ligne_data.get('quantite', 1)),
-                    unite=ligne_data.get('unite', ''),
-                    prix_unitaire_ht=float(ligne_data.get('prix_unitaire_ht', 0)),
-                    tva_pourcent=float(ligne_data.get('tva_pourcent', 0)),
-                    total_ttc=float(ligne_data.get('total_ttc', 0)),
-                    ordre=idx + 1
-                )
-                devis.lignes.append(ligne)
-            
-            # Calculer les totaux via la méthode du modèle
-            devis.calculer_totaux()
+        # Lignes du brouillon enregistré, ou envoyées via JSON
+        _enregistrer_lignes(devis, lignes)
+        if brouillon is not None:
+            db.session.delete(brouillon)
         
         db.session.add(devis)
+        enregistrer_evenement('devis.cree', devis)
+        actualiser_resumes(devis.client_id)
         db.session.commit()
         
         flash(f'Devis {devis.numero} créé avec succès !', 'success')
         return redirect(url_for('devis_liste'))
     
+    # Brouillon enregistré automatiquement (session expirée, page fermée...)
+    lignes_brouillon, brouillon = _brouillon_formulaire(form)
+    
     # Charger les prix pour le formulaire
     prix_catalogue = PrixCatalogue.query.filter_by(actif=True).order_by(PrixCatalogue.categorie, PrixCatalogue.code).all()
     
     return render_template('devis/form.html', 
                          form=form, 
                          title='Nouveau devis',
-                         lignes_dict=[],
+                         client_choisi=_client_choisi(form),
+                         lignes_dict=lignes_brouillon or [],
+                         brouillon=brouillon,
                          prix_catalogue=prix_catalogue)
 
 
 @app.route('/devis/<int:id>')
+@login_required
+@lecture_replica
 def devis_voir(id):
-    """Voir les détails d'un devis"""
-    devis = Devis.query.get_or_404(id)
-    return render_template('devis/voir.html', devis=devis)
+    """Voir les détails d'un devis (courant ou archivé)"""
+    devis = _devis_ou_archive(id)
+    return render_template('devis/voir.html', devis=devis, envois=_envois('devis', id))
 
 
 @app.route('/devis/<int:id>/editer', methods=['GET', 'POST'])
@@ -356,48 +599,43 @@ def devis_editer(id):
     
     form = DevisForm(obj=devis)
     
-    # Charger les clients pour le select
-    form.client_id.choices = [(c.id, f"{c.nom} {('- ' + c.entreprise) if c.entreprise else ''}") for c in Client.query.order_by(Client.nom).all()]
-    
     if form.validate_on_submit():
+        try:
+            lignes, brouillon = _lignes_soumises(devis.id)
+            if lignes is not None:
+                # Vérifie les totaux avant toute écriture (résultat en cache pour _enregistrer_lignes)
+                calculer_totaux_lignes(lignes, form.remise_pourcent.data)
+        except ConflitVersion:
+            flash('Le brouillon a été modifié ou enregistré dans un autre onglet : '
+                  'vérifiez les lignes puis enregistrez à nouveau.', 'error')
+            return redirect(url_for('devis_editer', id=id))
+        except ValueError as e:
+            flash(f'Lignes refusées : {e}', 'error')
+            return redirect(url_for('devis_editer', id=id))
+        
+        ancien_client_id = devis.client_id
+        ancien_statut = devis.statut
         devis.date = form.date.data
         devis.client_id = form.client_id.data
         devis.numero_serie = form.numero_serie.data
         devis.inventaire = form.inventaire.data
         devis.validite_jours = form.validite_jours.data
-        devis.remise_pourcent = form.remise_pourcent.data
-        devis.acompte = form.acompte.data
+        devis.remise_pourcent = arrondir(form.remise_pourcent.data)
+        devis.acompte = arrondir(form.acompte.data)
         devis.statut = form.statut.data
         
-        # Mettre à jour les lignes
-        lignes_data = request.form.get('lignes_json')
-        if lignes_data:
-            lignes = json.loads(lignes_data)
-            
+        # Mettre à jour les lignes (depuis le brouillon enregistré, ou envoyées via JSON)
+        if lignes is not None:
             # Supprimer les anciennes lignes
             DevisLigne.query.filter_by(devis_id=devis.id).delete()
-            
-            for idx, ligne_data in enumerate(lignes):
-                ligne = DevisLigne(
-                    devis_id=devis.id,
-                    tache=ligne_data.get('tache', ''),
-                    vehicule=ligne_data.get('vehicule', ''),
-                    description=ligne_data.get('description', ''),
-                    quantite=int(ligne_data.get('quantite', 1)),
-                    unite=ligne_data.get('unite', ''),
-                    prix_unitaire_ht=float(ligne_data.get('prix_unitaire_ht', 0)),
-                    tva_pourcent=float(ligne_data.get('tva_pourcent', 0)),
-                    total_ttc=float(ligne_data.get('total_ttc', 0)),
-                    ordre=idx + 1
-                )
-                db.session.add(ligne)
-            
-            # Refresh pour avoir les nouvelles lignes en mémoire
-            db.session.flush()
-            
-            # Calculer les totaux via la méthode du modèle
-            devis.calculer_totaux()
+            _enregistrer_lignes(devis, lignes)
+        if brouillon is not None:
+            db.session.delete(brouillon)
         
+        enregistrer_evenement('devis.modifie', devis)
+        if devis.statut != ancien_statut:
+            enregistrer_evenement('devis.statut', devis, ancien_statut=ancien_statut)
+        actualiser_resumes(ancien_client_id, devis.client_id)
         db.session.commit()
         
         flash(f'Devis {devis.numero} modifié avec succès !', 'success')
@@ -412,20 +650,27 @@ def devis_editer(id):
             'description': ligne.description,
             'quantite': ligne.quantite,
             'unite': ligne.unite,
-            'prix_unitaire_ht': float(ligne.prix_unitaire_ht),
-            'tva_pourcent': float(ligne.tva_pourcent),
-            'total_ttc': float(ligne.total_ttc)
+            'prix_unitaire_ht': str(ligne.prix_unitaire_ht),
+            'tva_pourcent': str(ligne.tva_pourcent),
+            'total_ttc': str(ligne.total_ttc)
         }
         lignes_dict.append(ligne_data)
     
+    # Brouillon enregistré automatiquement (session expirée, page fermée...) : ses lignes priment
+    lignes_brouillon, brouillon = _brouillon_formulaire(form, devis)
+    if lignes_brouillon is not None:
+        lignes_dict = lignes_brouillon
+    
     # Charger les prix pour le formulaire
     prix_catalogue = PrixCatalogue.query.filter_by(actif=True).order_by(PrixCatalogue.categorie, PrixCatalogue.code).all()
     
     return render_template('devis/form.html', 
                          form=form, 
                          title='Éditer le devis',
+                         client_choisi=_client_choisi(form),
                          devis=devis,
                          lignes_dict=lignes_dict,
+                         brouillon=brouillon,
                          prix_catalogue=prix_catalogue)
 
 
@@ -436,15 +681,171 @@ def devis_supprimer(id):
     devis = Devis.query.get_or_404(id)
     numero = devis.numero
     
+    enregistrer_evenement('devis.supprime', devis)
     db.session.delete(devis)
+    actualiser_resumes(devis.client_id)
     db.session.commit()
     
-    app.logger.info(f'Devis supprimé: {numero} (ID: {id})')
     flash(f'Devis {numero} supprimé avec succès !', 'success')
     return redirect(url_for('devis_liste'))
 
 
+@app.route('/devis/<int:id>/dupliquer', methods=['POST'])
+@login_required
+def devis_dupliquer(id):
+    """Dupliquer un devis (une copie par N° de série saisi, ou une seule copie)"""
+    devis = Devis.query.get_or_404(id)
+    numeros_serie = parser_numeros_serie(request.form.get('numeros_serie'))
+    
+    if len(numeros_serie) > TAILLE_LOT_MAX:
+        flash(f'Maximum {TAILLE_LOT_MAX} véhicules par lot !', 'error')
+        return redirect(url_for('devis_voir', id=id))
+    
+    nouveaux = dupliquer_devis(devis, numeros_serie)
+    for nouveau in nouveaux:
+        enregistrer_evenement('devis.cree', nouveau, origine=f'duplication de {devis.numero}')
+    actualiser_resumes(devis.client_id)
+    db.session.commit()
+    
+    if len(nouveaux) == 1:
+        flash(f'Devis {nouveaux[0].numero} créé par duplication de {devis.numero} !', 'success')
+        return redirect(url_for('devis_editer', id=nouveaux[0].id))
+    
+    flash(f'{len(nouveaux)} devis créés ({nouveaux[0].numero} à {nouveaux[-1].numero}) !', 'success')
+    return redirect(url_for('devis_liste'))
+
+
+@app.route('/devis/<int:id>/enregistrer-modele', methods=['POST'])
+@login_required
+def devis_enregistrer_modele(id):
+    """Enregistrer les lignes d'un devis comme modèle réutilisable"""
+    devis = Devis.query.get_or_404(id)
+    nom = (request.form.get('nom') or '').strip()
+    
+    if not nom:
+        flash('Le nom du modèle est requis !', 'error')
+        return redirect(url_for('devis_voir', id=id))
+    
+    if ModeleDevis.query.filter_by(nom=nom).first():
+        flash(f'Un modèle nommé "{nom}" existe déjà !', 'error')
+        return redirect(url_for('devis_voir', id=id))
+    
+    enregistrer_comme_modele(devis, nom)
+    db.session.commit()
+    
+    flash(f'Modèle "{nom}" enregistré !', 'success')
+    return redirect(url_for('modeles_liste'))
+
+
+@app.route('/api/devis/totaux', methods=['POST'])
+@login_required
+def api_devis_totaux():
+    """API pour recalculer les totaux d'un brouillon de devis
+    
+    Attend un JSON {"lignes": [...], "remise_pourcent": ...} et renvoie les
+    totaux par ligne, par taux de TVA et globaux (montants en texte).
+    """
+    data = request.get_json(silent=True) or {}
+    lignes = data.get('lignes', [])
+    
+    if not isinstance(lignes, list) or not all(isinstance(l, dict) for l in lignes):
+        return jsonify({'error': 'Lignes invalides'}), 400
+    
+    try:
+        resultat = calculer_totaux_lignes(
+            [normaliser_ligne(ligne_data) for ligne_data in lignes],
+            data.get('remise_pourcent')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(resultat)
+
+
+@app.route('/api/devis/brouillons', methods=['POST'])
+@login_required
+def api_brouillon_creer():
+    """API d'enregistrement automatique : crée le brouillon d'un formulaire de devis
+    
+    Attend un JSON {"devis_id": id ou null, "lignes": [...], "champs": {...}}
+    (chaque ligne porte un uid) et renvoie {"id", "version"}. Si l'utilisateur
+    a déjà un brouillon pour ce devis (autre onglet), renvoie 409 avec son état
+    complet, comme en cas de conflit de version : il n'est pas écrasé.
+    """
+    data = request.get_json(silent=True) or {}
+    devis_id = data.get('devis_id')
+    if devis_id is not None and (not isinstance(devis_id, int) or db.session.get(Devis, devis_id) is None):
+        return jsonify({'error': 'Devis introuvable'}), 404
+    
+    try:
+        brouillon = creer_brouillon(current_user.username, devis_id, data.get('lignes', []), data.get('champs'))
+    except BrouillonExistant as e:
+        return jsonify(etat_brouillon(e.brouillon)), 409
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    db.session.commit()
+    return jsonify({'id': brouillon.id, 'version': brouillon.version}), 201
+
+
+@app.route('/api/devis/brouillons/<int:id>', methods=['PATCH'])
+@login_required
+def api_brouillon_modifier(id):
+    """API d'enregistrement automatique : applique des opérations sur les lignes d'un brouillon
+    
+    Attend un JSON {"version": n, "operations": [...], "champs": {...} (optionnel)}
+    et renvoie {"id", "version"}. Si le brouillon n'est plus à la version n,
+    renvoie 409 avec son état complet : le navigateur recalcule ses opérations.
+    """
+    brouillon = BrouillonDevis.query.filter_by(id=id, utilisateur=current_user.username).first()
+    if brouillon is None:
+        return jsonify({'error': 'Brouillon introuvable'}), 404
+    
+    data = request.get_json(silent=True) or {}
+    version = data.get('version')
+    if not isinstance(version, int):
+        return jsonify({'error': 'Version manquante'}), 400
+    
+    try:
+        version = enregistrer_operations(brouillon, version, data.get('operations', []), data.get('champs'))
+    except ConflitVersion:
+        db.session.rollback()
+        brouillon = db.session.get(BrouillonDevis, id)
+        if brouillon is None:
+            return jsonify({'error': 'Brouillon introuvable'}), 404
+        return jsonify(etat_brouillon(brouillon)), 409
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    db.session.commit()
+    return jsonify({'id': id, 'version': version})
+
+
+@app.route('/api/devis/brouillons/<int:id>', methods=['DELETE'])
+@login_required
+def api_brouillon_supprimer(id):
+    """API : abandonne un brouillon (le formulaire repart du devis enregistré)"""
+    BrouillonDevis.query.filter_by(id=id, utilisateur=current_user.username).delete(synchronize_session=False)
+    db.session.commit()
+    return '', 204
+
+
+@app.route('/api/clients/recherche')
+@login_required
+@lecture_replica
+def api_clients_recherche():
+    """API d'autocomplétion : clients dont le nom ou l'entreprise commence par `q`"""
+    clients = rechercher_clients(request.args.get('q', ''), request.args.get('limite', type=int))
+    return jsonify([{
+        'id': client.id,
+        'nom': client.nom,
+        'entreprise': client.entreprise,
+        'libelle': client.libelle
+    } for client in clients])
+
+
 @app.route('/api/prix/<code>')
+@login_required
+@lecture_replica
 def api_prix_detail(code):
     """API pour récupérer les détails d'un prix"""
     prix = PrixCatalogue.query.filter_by(code=code).first()
@@ -452,45 +853,123 @@ def api_prix_detail(code):
         return jsonify({
             'code': prix.code,
             'description': prix.description,
-            'prix': prix.prix,
+            'prix': str(prix.prix),  # Decimal exact sérialisé en texte
             'categorie': prix.categorie
         })
     return jsonify({'error': 'Prix non trouvé'}), 404
 
 
+# ========== ROUTES MODÈLES DE DEVIS ==========
+
+@app.route('/modeles')
+@login_required
+@lecture_replica
+def modeles_liste():
+    """Liste des modèles de devis"""
+    modeles = ModeleDevis.query.order_by(ModeleDevis.nom).all()
+    return render_template('modeles/liste.html', modeles=modeles,
+                           taille_lot_max=TAILLE_LOT_MAX)
+
+
+@app.route('/modeles/<int:id>/utiliser', methods=['POST'])
+@login_required
+def modele_utiliser(id):
+    """Créer un ou plusieurs devis (un par véhicule) à partir d'un modèle"""
+    modele = ModeleDevis.query.get_or_404(id)
+    client = db.session.get(Client, request.form.get('client_id', type=int) or 0)
+    numeros_serie = parser_numeros_serie(request.form.get('numeros_serie'))
+    
+    if not client:
+        flash('Veuillez choisir un client !', 'error')
+        return redirect(url_for('modeles_liste'))
+    
+    if len(numeros_serie) > TAILLE_LOT_MAX:
+        flash(f'Maximum {TAILLE_LOT_MAX} véhicules par lot !', 'error')
+        return redirect(url_for('modeles_liste'))
+    
+    nouveaux = creer_devis_depuis_modele(modele, client.id, numeros_serie)
+    for nouveau in nouveaux:
+        enregistrer_evenement('devis.cree', nouveau, origine=f'modèle {modele.nom}')
+    actualiser_resumes(client.id)
+    db.session.commit()
+    
+    if len(nouveaux) == 1:
+        flash(f'Devis {nouveaux[0].numero} créé depuis le modèle "{modele.nom}" !', 'success')
+        return redirect(url_for('devis_editer', id=nouveaux[0].id))
+    
+    flash(f'{len(nouveaux)} devis créés depuis le modèle "{modele.nom}" !', 'success')
+    return redirect(url_for('devis_liste'))
+
+
+@app.route('/modeles/<int:id>/supprimer', methods=['POST'])
+@login_required
+def modele_supprimer(id):
+    """Supprimer un modèle de devis"""
+    modele = ModeleDevis.query.get_or_404(id)
+    nom = modele.nom
+    
+    db.session.delete(modele)
+    db.session.commit()
+    
+    flash(f'Modèle "{nom}" supprimé avec succès !', 'success')
+    return redirect(url_for('modeles_liste'))
+
+
 # ========== ROUTES FACTURES ==========
 
 @app.route('/factures')
 @login_required
+@lecture_replica
 def factures_liste():
     """Liste toutes les factures"""
     search = request.args.get('search', '')
     etat_filter = request.args.get('etat', '')
-    
-    query = Facture.query
-    
-    if search:
-        query = query.join(Client).filter(
-            db.or_(
-                Facture.numero.ilike(f'%{search}%'),
-                Client.nom.ilike(f'%{search}%')
+    avec_archives = request.args.get('archives') == '1'
+    
+    def filtrer(modele, query):
+        if search:
+            query = query.join(Client, modele.client_id == Client.id).filter(
+                db.or_(
+                    modele.numero.ilike(f'%{search}%'),
+                    Client.nom.ilike(f'%{search}%')
+                )
             )
-        )
-    
-    if etat_filter:
-        query = query.filter_by(etat_paiement=etat_filter)
-    
-    factures = query.order_by(Facture.created_at.desc()).all()
-    
-    return render_template('factures/liste.html', factures=factures, search=search, etat_filter=etat_filter)
+        
+        if etat_filter:
+            query = query.filter(modele.etat_paiement == etat_filter)
+        
+        return query
+    
+    # Liste des ids mise en cache par filtres (invalidée à chaque écriture sur ces tables)
+    modeles = (Facture, FactureArchive) if avec_archives else (Facture,)
+    cles = resultats_en_cache('factures_liste',
+                              {'search': search, 'etat': etat_filter, 'archives': avec_archives},
+                              (Facture, FactureArchive, Client),
+                              lambda: _ids_recherche(modeles, filtrer))
+    # Total à encaisser sur toute la recherche (pas seulement la page), en cache avec les mêmes filtres
+    def total_reste():
+        return sum((filtrer(modele, db.session.query(db.func.sum(modele.reste_a_payer))).scalar() or ZERO
+                    for modele in modeles), ZERO)
+    
+    reste_a_payer = resultats_en_cache('factures_liste_reste',
+                                       {'search': search, 'etat': etat_filter, 'archives': avec_archives},
+                                       (Facture, FactureArchive, Client), total_reste)
+    # Seule la page affichée est chargée, par clé primaire
+    cles, page = _page(cles)
+    factures = _documents(cles, Facture, FactureArchive,
+                          lambda modele: [db.joinedload(modele.client), db.joinedload(modele.devis)])
+    
+    return render_template('factures/liste.html', factures=factures, page=page, reste_a_payer=reste_a_payer,
+                           search=search, etat_filter=etat_filter, avec_archives=avec_archives)
 
 
 @app.route('/factures/<int:id>')
 @login_required
+@lecture_replica
 def facture_voir(id):
-    """Voir les détails d'une facture"""
-    facture = Facture.query.get_or_404(id)
-    return render_template('factures/voir.html', facture=facture)
+    """Voir les détails d'une facture (courante ou archivée)"""
+    facture = _facture_ou_archive(id)
+    return render_template('factures/voir.html', facture=facture, envois=_envois(('facture', 'relance'), id))
 
 
 @app.route('/devis/<int:id>/changer-statut', methods=['POST'])
@@ -500,8 +979,12 @@ def devis_changer_statut(id):
     devis = Devis.query.get_or_404(id)
     nouveau_statut = request.form.get('statut')
     
-    if nouveau_statut in ['brouillon', 'envoye', 'accepte', 'refuse']:
+    if nouveau_statut in ['brouillon', 'envoye', 'accepte', 'refuse', 'expire']:
+        ancien_statut = devis.statut
         devis.statut = nouveau_statut
+        if nouveau_statut != ancien_statut:
+            enregistrer_evenement('devis.statut', devis, ancien_statut=ancien_statut)
+        actualiser_resumes(devis.client_id)
         db.session.commit()
         flash(f'Devis marqué comme "{nouveau_statut}"', 'success')
     else:
@@ -521,36 +1004,12 @@ def devis_convertir_facture(devis_id):
         flash(f'Une facture existe déjà pour ce devis !', 'error')
         return redirect(url_for('devis_voir', id=devis_id))
     
-    # Générer le numéro de facture
-    derniere_facture = Facture.query.order_by(Facture.id.desc()).first()
-    if derniere_facture and derniere_facture.numero:
-        try:
-            dernier_num = int(derniere_facture.numero)
-            nouveau_num = str(dernier_num + 1).zfill(3)
-        except (ValueError, AttributeError):
-            nouveau_num = "001"
-    else:
-        nouveau_num = "001"
-    
-    # Créer la facture
-    facture = Facture(
-        numero=nouveau_num,
-        date=date.today(),
-        devis_id=devis.id,
-        client_id=devis.client_id,
-        montant_ttc=round(devis.total_ttc, 2),
-        acompte=round(devis.acompte, 2),
-        reste_a_payer=round(devis.total_ttc - devis.acompte, 2),
-        etat_paiement='En attente'
-    )
-    
-    # Mettre à jour le statut du devis
-    devis.statut = 'accepte'
-    
-    db.session.add(facture)
+    # Créer la facture (le devis passe en "accepté")
+    facture = convertir_en_facture(devis, prochains_numeros_factures()[0])
+    
+    actualiser_resumes(devis.client_id)
     db.session.commit()
     
-    app.logger.info(f'Devis {devis.numero} converti en facture {facture.numero} - Montant TTC: {facture.montant_ttc:.2f}€')
     flash(f'Facture {facture.numero} créée avec succès !', 'success')
     return redirect(url_for('facture_voir', id=facture.id))
 
@@ -561,36 +1020,25 @@ def facture_enregistrer_paiement(id):
     """Enregistrer un paiement pour une facture"""
     facture = Facture.query.get_or_404(id)
     
-    montant = round(float(request.form.get('montant', 0)), 2)
+    try:
+        montant = arrondir(request.form.get('montant'))
+    except ValueError as e:
+        flash(f'Montant du paiement invalide : {e}', 'error')
+        return redirect(url_for('facture_voir', id=id))
     mode_paiement = request.form.get('mode_paiement', 'Paiement par virement')
     
     if montant <= 0:
         flash('Le montant du paiement doit être supérieur à 0 !', 'error')
         return redirect(url_for('facture_voir', id=id))
     
-    # Arrondir les montants pour éviter les problèmes de précision float
-    facture.acompte = round(facture.acompte + montant, 2)
-    facture.reste_a_payer = round(facture.montant_ttc - facture.acompte, 2)
-    
-    # Vérifier si la facture est payée (avec une tolérance de 0.01€ pour les erreurs d'arrondi)
-    if facture.reste_a_payer <= 0.01:
-        facture.etat_paiement = 'Payé'
-        facture.mode_paiement = mode_paiement
-        facture.date_paiement = date.today()
-        facture.reste_a_payer = 0
+    if appliquer_paiement(facture, montant, mode_paiement):
         flash(f'Facture {facture.numero} payée intégralement par {mode_paiement.lower()} !', 'success')
     else:
-        facture.etat_paiement = 'Paiement partiel'
         flash(f'Paiement de {montant:.2f} € enregistré. Reste à payer : {facture.reste_a_payer:.2f} €', 'success')
     
+    actualiser_resumes(facture.client_id)
     db.session.commit()
     
-    # Log du paiement
-    if facture.etat_paiement == 'Payé':
-        app.logger.info(f'Facture {facture.numero} payée intégralement - Montant: {facture.montant_ttc:.2f}€ - Mode: {mode_paiement}')
-    else:
-        app.logger.info(f'Paiement partiel facture {facture.numero} - Montant reçu: {montant:.2f}€ - Reste: {facture.reste_a_payer:.2f}€')
-    
     return redirect(url_for('facture_voir', id=id))
 
 
@@ -600,45 +1048,181 @@ def facture_supprimer(id):
     """Supprimer une facture"""
     facture = Facture.query.get_or_404(id)
     numero = facture.numero
-    montant = facture.montant_ttc
-    etat = facture.etat_paiement
     
+    enregistrer_evenement('facture.supprimee', facture)
     db.session.delete(facture)
+    actualiser_resumes(facture.client_id)
     db.session.commit()
     
-    app.logger.warning(f'Facture supprimée: {numero} (ID: {id}) - Montant TTC: {montant:.2f}€ - État: {etat}')
     flash(f'Facture {numero} supprimée avec succès !', 'success')
     return redirect(url_for('factures_liste'))
 
 
+# ========== RAPPROCHEMENT BANCAIRE ==========
+
+@app.route('/factures/rapprochement')
+@login_required
+def factures_rapprochement():
+    """Import de relevé bancaire et vérification des opérations non rapprochées"""
+    a_verifier = (OperationBancaire.query
+                  .filter_by(statut='a_verifier')
+                  .order_by(OperationBancaire.date, OperationBancaire.id)
+                  .limit(200)
+                  .all())
+    recentes = (OperationBancaire.query
+                .filter(OperationBancaire.statut != 'a_verifier')
+                .order_by(OperationBancaire.id.desc())
+                .limit(20)
+                .all())
+    
+    # Factures proposées, chargées en une requête pour toutes les opérations
+    ids_candidats = {facture_id for operation in a_verifier for facture_id in (operation.candidats or [])}
+    candidats = {facture.id: facture for facture in
+                 Facture.query.filter(Facture.id.in_(ids_candidats), Facture.etat_paiement != 'Payé')}
+    
+    return render_template('factures/rapprochement.html', a_verifier=a_verifier, recentes=recentes,
+                           candidats=candidats)
+
+
+@app.route('/factures/rapprochement/importer', methods=['POST'])
+@login_required
+def factures_rapprochement_importer():
+    """Importer un relevé (CSV ou CAMT.053) et appliquer les paiements rapprochés"""
+    fichier = request.files.get('releve')
+    if not fichier or not fichier.filename:
+        flash('Aucun fichier sélectionné', 'error')
+        return redirect(url_for('factures_rapprochement'))
+    
+    debut = time.perf_counter()
+    try:
+        compteurs = rapprochement.importer_releve(fichier.stream, fichier.filename)
+    except ValueError as e:
+        db.session.rollback()
+        flash(f'Relevé illisible : {e}', 'error')
+        return redirect(url_for('factures_rapprochement'))
+    db.session.commit()
+    
+    app.logger.info(f'Relevé {fichier.filename} importé en {(time.perf_counter() - debut) * 1000:.0f} ms : '
+                    f'{compteurs["lues"]} crédit(s), {compteurs["rapprochees"]} rapproché(s), '
+                    f'{compteurs["a_verifier"]} à vérifier, {compteurs["deja_importees"]} déjà importé(s)')
+    flash(f'{compteurs["rapprochees"]} paiement(s) enregistré(s), {compteurs["a_verifier"]} opération(s) à vérifier'
+          + (f', {compteurs["deja_importees"]} déjà importée(s)' if compteurs['deja_importees'] else ''), 'success')
+    return redirect(url_for('factures_rapprochement'))
+
+
+@app.route('/factures/rapprochement/<int:id>', methods=['POST'])
+@login_required
+def factures_rapprochement_valider(id):
+    """Affecter une opération à vérifier à une facture, ou l'ignorer"""
+    operation = OperationBancaire.query.get_or_404(id)
+    if operation.statut != 'a_verifier':
+        flash('Cette opération a déjà été traitée', 'error')
+        return redirect(url_for('factures_rapprochement'))
+    
+    if request.form.get('action') == 'ignorer':
+        operation.statut = 'ignoree'
+        db.session.commit()
+        flash('Opération ignorée', 'success')
+        return redirect(url_for('factures_rapprochement'))
+    
+    # Facture proposée, ou numéro saisi à la main
+    numero = (request.form.get('numero') or '').strip()
+    if numero:
+        facture = Facture.query.filter_by(numero=numero).first()
+    else:
+        facture = db.session.get(Facture, request.form.get('facture_id', type=int) or 0)
+    if facture is None or facture.etat_paiement == 'Payé':
+        flash('Facture introuvable ou déjà payée', 'error')
+        return redirect(url_for('factures_rapprochement'))
+    
+    rapprochement.valider_operation(operation, facture)
+    db.session.commit()
+    
+    app.logger.info(f'Opération bancaire {operation.id} ({operation.montant:.2f}€) affectée à la facture {facture.numero}')
+    flash(f'Paiement de {operation.montant:.2f} € affecté à la facture {facture.numero}', 'success')
+    return redirect(url_for('factures_rapprochement'))
+
+
+# ========== ROUTES EMAILS ==========
+# Les emails sont mis en file puis envoyés en arrière-plan (app/emails.py)
+
+@app.route('/devis/<int:id>/envoyer', methods=['POST'])
+@login_required
+def devis_envoyer_email(id):
+    """Envoyer le PDF d'un devis par email au client"""
+    devis = _devis_ou_archive(id)
+    destinataire = _destinataire(devis)
+    if destinataire is None:
+        flash('Adresse email du destinataire manquante ou invalide', 'error')
+        return redirect(url_for('devis_voir', id=id))
+    
+    emails.mettre_en_file('devis', devis, destinataire)
+    
+    # Un brouillon envoyé au client devient "envoyé"
+    if not devis.archive and devis.statut == 'brouillon':
+        devis.statut = 'envoye'
+        actualiser_resumes(devis.client_id)
+    
+    db.session.commit()
+    emails.reveiller_envoi()
+    
+    app.logger.info(f'Devis {devis.numero} mis en file d\'envoi vers {destinataire}')
+    flash(f'Devis {devis.numero} en cours d\'envoi à {destinataire}', 'success')
+    return redirect(url_for('devis_voir', id=id))
+
+
+@app.route('/factures/<int:id>/envoyer', methods=['POST'])
+@login_required
+def facture_envoyer_email(id):
+    """Envoyer le PDF d'une facture par email au client"""
+    facture = _facture_ou_archive(id)
+    destinataire = _destinataire(facture)
+    if destinataire is None:
+        flash('Adresse email du destinataire manquante ou invalide', 'error')
+        return redirect(url_for('facture_voir', id=id))
+    
+    emails.mettre_en_file('facture', facture, destinataire)
+    db.session.commit()
+    emails.reveiller_envoi()
+    
+    app.logger.info(f'Facture {facture.numero} mise en file d\'envoi vers {destinataire}')
+    flash(f'Facture {facture.numero} en cours d\'envoi à {destinataire}', 'success')
+    return redirect(url_for('facture_voir', id=id))
+
+
+@app.route('/factures/relances', methods=['POST'])
+@login_required
+def factures_relancer():
+    """Envoyer une relance par email pour toutes les factures en retard de paiement"""
+    nombre = emails.relancer_factures_impayees()
+    db.session.commit()
+    emails.reveiller_envoi()
+    
+    app.logger.info(f'{nombre} relance(s) de factures en retard mise(s) en file')
+    if nombre:
+        flash(f'{nombre} relance(s) en cours d\'envoi', 'success')
+    else:
+        flash('Aucune facture en retard à relancer (ou clients sans email)', 'info')
+    return redirect(url_for('factures_liste'))
+
+
 # ===========================
 # Routes PDF
 # ===========================
 
 @app.route('/devis/<int:id>/pdf')
 @login_required
+@lecture_replica
 def devis_pdf(id):
     """Générer le PDF d'un devis"""
-    from xhtml2pdf import pisa
-    from io import BytesIO
-    from datetime import timedelta
-    
-    devis = Devis.query.get_or_404(id)
-    config = Config.query.first()
+    devis = _devis_ou_archive(id)
+    contenu = pdf.pdf_devis(devis)
     
-    # Rendre le template HTML
-    html_content = render_template('pdf/devis.html', devis=devis, config=config, timedelta=timedelta)
-    
-    # Générer le PDF
-    pdf_buffer = BytesIO()
-    pisa_status = pisa.CreatePDF(html_content, dest=pdf_buffer)
-    
-    if pisa_status.err:
+    if contenu is None:
         return "Erreur lors de la génération du PDF", 500
     
     # Créer la réponse
-    pdf_buffer.seek(0)
-    response = make_response(pdf_buffer.getvalue())
+    response = make_response(contenu)
     response.headers['Content-Type'] = 'application/pdf'
     response.headers['Content-Disposition'] = f'inline; filename=Devis_{devis.numero}.pdf'
     
@@ -647,27 +1231,17 @@ def devis_pdf(id):
 
 @app.route('/factures/<int:id>/pdf')
 @login_required
+@lecture_replica
 def facture_pdf(id):
     """Générer le PDF d'une facture"""
-    from xhtml2pdf import pisa
-    from io import BytesIO
-    
-    facture = Facture.query.get_or_404(id)
-    config = Config.query.first()
-    
-    # Rendre le template HTML
-    html_content = render_template('pdf/facture.html', facture=facture, config=config)
-    
-    # Générer le PDF
-    pdf_buffer = BytesIO()
-    pisa_status = pisa.CreatePDF(html_content, dest=pdf_buffer)
+    facture = _facture_ou_archive(id)
+    contenu = pdf.pdf_facture(facture)
     
-    if pisa_status.err:
+    if contenu is None:
         return "Erreur lors de la génération du PDF", 500
     
     # Créer la réponse
-    pdf_buffer.seek(0)
-    response = make_response(pdf_buffer.getvalue())
+    response = make_response(contenu)
     response.headers['Content-Type'] = 'application/pdf'
     response.headers['Content-Disposition'] = f'inline; filename=Facture_{facture.numero}.pdf'
     
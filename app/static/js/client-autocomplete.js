@@ -0,0 +1,80 @@
+/**
+ * Autocomplétion des clients avec Alpine.js (recherche par préfixe côté serveur)
+ */
+function clientAutocomplete(clientInitial = null) {
+    return {
+        clientId: clientInitial ? clientInitial.id : '',
+        saisie: clientInitial ? clientInitial.libelle : '',
+        resultats: [],
+        ouvert: false,
+        indexActif: -1,
+        _minuteur: null,
+        _numeroRequete: 0,
+
+        /**
+         * Nouvelle saisie : le client choisi est oublié et la recherche relancée (debounce)
+         */
+        onSaisie() {
+            this.clientId = '';
+            clearTimeout(this._minuteur);
+            this._minuteur = setTimeout(() => this.rechercher(), 200);
+        },
+
+        /**
+         * Interroge /api/clients/recherche ; seules les réponses de la dernière requête sont affichées
+         */
+        async rechercher() {
+            const texte = this.saisie.trim();
+            const numero = ++this._numeroRequete;
+
+            if (!texte) {
+                this.resultats = [];
+                this.ouvert = false;
+                return;
+            }
+
+            try {
+                const response = await fetch(`/api/clients/recherche?q=${encodeURIComponent(texte)}`);
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                const clients = await response.json();
+
+                if (numero === this._numeroRequete) {
+                    this.resultats = clients;
+                    this.indexActif = clients.length > 0 ? 0 : -1;
+                    this.ouvert = true;
+                }
+            } catch (error) {
+                console.error('Erreur lors de la recherche de clients:', error);
+            }
+        },
+
+        /**
+         * Sélectionne un client de la liste
+         */
+        choisir(client) {
+            this.clientId = client.id;
+            this.saisie = client.libelle;
+            this.ouvert = false;
+        },
+
+        /**
+         * Navigation clavier dans la liste (flèches, Entrée, Échap)
+         */
+        onTouche(event) {
+            if (!this.ouvert || this.resultats.length === 0) return;
+
+            if (event.key === 'ArrowDown') {
+                event.preventDefault();
+                this.indexActif = (this.indexActif + 1) % this.resultats.length;
+            } else if (event.key === 'ArrowUp') {
+                event.preventDefault();
+                this.indexActif = (this.indexActif - 1 + this.resultats.length) % this.resultats.length;
+            } else if (event.key === 'Enter') {
+                event.preventDefault();
+                this.choisir(this.resultats[this.indexActif]);
+            } else if (event.key === 'Escape') {
+                this.ouvert = false;
+            }
+        }
+    };
+}
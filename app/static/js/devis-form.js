@@ -1,12 +1,73 @@
 /**
  * Gestion du formulaire de devis avec Alpine.js
  */
-function devisForm(lignesExistantes = []) {
-    console.log('Initialisation devisForm avec lignes:', lignesExistantes);
 
+// Champs d'une ligne enregistrés dans le brouillon (le total TTC est recalculé par le serveur)
+const CHAMPS_LIGNE = ['tache', 'vehicule', 'description', 'quantite', 'unite', 'prix_unitaire_ht', 'tva_pourcent'];
+
+// Autres champs du formulaire gardés avec le brouillon
+const CHAMPS_FORMULAIRE = ['client_id', 'date', 'numero_serie', 'inventaire', 'validite_jours', 'remise_pourcent',
+    'acompte', 'statut'];
+
+// Délai sans modification avant l'enregistrement du brouillon, et délai maximum entre deux essais hors ligne
+const DELAI_BROUILLON = 2000;
+const DELAI_NOUVEL_ESSAI_MAX = 60000;
+
+/**
+ * Identifiant stable d'une ligne (les opérations du brouillon s'y réfèrent)
+ */
+function nouvelUid() {
+    return window.crypto?.randomUUID?.() || Date.now().toString(36) + Math.random().toString(36).slice(2);
+}
+
+/**
+ * Deux valeurs de champ identiques ("12.50" du serveur et 12.5 du formulaire le sont)
+ */
+function memeValeur(a, b) {
+    if (String(a ?? '') === String(b ?? '')) return true;
+    return a !== '' && b !== '' && a != null && b != null && Number(a) === Number(b);
+}
+
+/**
+ * Opérations qui transforment les lignes `avant` (état du serveur) en `apres`
+ * @param {Array} avant - Lignes telles que le serveur les a
+ * @param {Array} apres - Lignes du formulaire
+ * @returns {Array} Opérations ajouter / modifier / supprimer / ordonner
+ */
+function operationsLignes(avant, apres) {
+    const anciennes = new Map(avant.map(ligne => [ligne.uid, ligne]));
+    const presentes = new Set(apres.map(ligne => ligne.uid));
+    const operations = [];
+
+    for (const ligne of avant) {
+        if (!presentes.has(ligne.uid)) operations.push({ op: 'supprimer', uid: ligne.uid });
+    }
+    for (const ligne of apres) {
+        const ancienne = anciennes.get(ligne.uid);
+        if (!ancienne) {
+            operations.push({ op: 'ajouter', uid: ligne.uid, ligne: Object.fromEntries(CHAMPS_LIGNE.map(c => [c, ligne[c]])) });
+            continue;
+        }
+        const champs = Object.fromEntries(CHAMPS_LIGNE.filter(c => !memeValeur(ligne[c], ancienne[c])).map(c => [c, ligne[c]]));
+        if (Object.keys(champs).length > 0) operations.push({ op: 'modifier', uid: ligne.uid, champs });
+    }
+
+    // Ordre obtenu côté serveur : lignes restantes dans l'ancien ordre, puis lignes ajoutées
+    const ordreServeur = [
+        ...avant.filter(ligne => presentes.has(ligne.uid)),
+        ...apres.filter(ligne => !anciennes.has(ligne.uid))
+    ].map(ligne => ligne.uid);
+    const ordre = apres.map(ligne => ligne.uid);
+    if (ordre.join() !== ordreServeur.join()) operations.push({ op: 'ordonner', uids: ordre });
+
+    return operations;
+}
+
+function devisForm(lignesExistantes = [], brouillon = { id: null, version: 0, devis_id: null, cle: null, restaure: null }) {
     return {
         // Initialisation des lignes existantes ou tableau vide
         lignes: lignesExistantes.length > 0 ? lignesExistantes.map(l => ({
+            uid: l.uid || nouvelUid(),
             tache: l.tache || '',
             vehicule: l.vehicule || '',
             description: l.description || '',
@@ -17,10 +78,333 @@ function devisForm(lignesExistantes = []) {
             total_ttc: parseFloat(l.total_ttc) || 0
         })) : [],
 
+        // Totaux renvoyés par le serveur (null tant qu'un recalcul est en attente)
+        totauxServeur: null,
+        _minuteurRecalcul: null,
+        _numeroRequete: 0,
+
+        // Brouillon enregistré côté serveur (id null tant que rien n'a été modifié)
+        brouillon,
+        // enregistre | modifie | envoi | hors_ligne | session | erreur
+        etatBrouillon: 'enregistre',
+        restaurationLocale: false,
+        _lignesServeur: [],
+        _champsServeur: null,
+        _minuteurBrouillon: null,
+        _envoiBrouillon: null,
+        _brouillonARelancer: false,
+        _modifications: 0,
+        _delaiNouvelEssai: DELAI_BROUILLON,
+
+        /**
+         * Surveille les lignes et la remise pour déclencher le recalcul serveur
+         * et l'enregistrement du brouillon
+         */
+        init() {
+            this._lignesServeur = this.copieLignes();
+            this._champsServeur = this.brouillon.id ? JSON.stringify(this.champsFormulaire()) : null;
+            this.restaurerCopieLocale();
+
+            this.$watch('lignes', () => {
+                this.planifierRecalcul();
+                this.planifierBrouillon();
+            });
+            document.querySelector('[name="remise_pourcent"]')
+                ?.addEventListener('input', () => this.planifierRecalcul());
+            window.addEventListener('online', () => this.planifierBrouillon(0));
+            if (this.lignes.length > 0) {
+                this.recalculerServeur();
+            }
+        },
+
+        /**
+         * Copie simple des lignes (sans le proxy Alpine)
+         */
+        copieLignes() {
+            return JSON.parse(JSON.stringify(this.lignes));
+        },
+
+        /**
+         * Champs du formulaire hors lignes (valeurs texte, telles que soumises)
+         */
+        champsFormulaire() {
+            const donnees = new FormData(document.getElementById('form-devis'));
+            return Object.fromEntries(CHAMPS_FORMULAIRE.filter(nom => donnees.has(nom)).map(nom => [nom, donnees.get(nom)]));
+        },
+
+        /**
+         * Le brouillon du serveur contient toute la saisie : le formulaire
+         * n'envoie alors que son id, pas les lignes
+         */
+        get brouillonAJour() {
+            return Boolean(this.brouillon.id) && this.etatBrouillon === 'enregistre';
+        },
+
+        get messageBrouillon() {
+            return {
+                modifie: 'Modifications non enregistrées…',
+                envoi: 'Enregistrement du brouillon…',
+                enregistre: this.brouillon.id ? 'Brouillon enregistré' : '',
+                hors_ligne: 'Hors ligne : saisie conservée dans ce navigateur, nouvel essai automatique',
+                session: 'Session expirée : reconnectez-vous puis rechargez cette page (saisie conservée dans ce navigateur)',
+                erreur: 'Brouillon non enregistré'
+            }[this.etatBrouillon];
+        },
+
+        get messageRestauration() {
+            if (this.restaurationLocale) return 'Saisie non enregistrée restaurée depuis ce navigateur.';
+            return this.brouillon.restaure ? `Brouillon du ${this.brouillon.restaure} restauré.` : '';
+        },
+
+        /**
+         * Copie locale de la saisie non encore enregistrée sur le serveur
+         * (coupure réseau, session expirée, onglet fermé)
+         */
+        sauverCopieLocale() {
+            try {
+                localStorage.setItem(this.brouillon.cle, JSON.stringify({
+                    id: this.brouillon.id,
+                    version: this.brouillon.version,
+                    lignes: this.copieLignes(),
+                    champs: this.champsFormulaire()
+                }));
+            } catch (error) {
+                // Stockage plein ou désactivé : le brouillon serveur reste la seule sauvegarde
+            }
+        },
+
+        oublierCopieLocale() {
+            try {
+                localStorage.removeItem(this.brouillon.cle);
+            } catch (error) {
+                // Stockage désactivé
+            }
+        },
+
+        /**
+         * Reprend la copie locale si elle prolonge l'état du serveur (même
+         * brouillon, même version) : ce sont des modifications jamais envoyées
+         */
+        restaurerCopieLocale() {
+            let copie = null;
+            try {
+                copie = JSON.parse(localStorage.getItem(this.brouillon.cle));
+            } catch (error) {
+                return;
+            }
+            if (!copie || copie.id !== this.brouillon.id || copie.version !== this.brouillon.version) {
+                this.oublierCopieLocale();
+                return;
+            }
+
+            this.lignes = copie.lignes;
+            for (const [nom, valeur] of Object.entries(copie.champs || {})) {
+                // Le client se choisit par l'autocomplétion : il vient du brouillon serveur
+                const champ = document.getElementById('form-devis').elements[nom];
+                if (nom !== 'client_id' && champ && 'value' in champ) champ.value = valeur;
+            }
+            this.restaurationLocale = true;
+            this.planifierBrouillon(0);
+        },
+
+        /**
+         * Planifie l'enregistrement du brouillon (debounce) après une modification
+         * @param {number} delai - Délai en ms
+         */
+        planifierBrouillon(delai = DELAI_BROUILLON) {
+            this._modifications++;
+            if (this.etatBrouillon !== 'session') this.etatBrouillon = 'modifie';
+            this.sauverCopieLocale();
+            clearTimeout(this._minuteurBrouillon);
+            this._minuteurBrouillon = setTimeout(() => this.enregistrerBrouillon(), delai);
+        },
+
+        /**
+         * Enregistre le brouillon ; un seul envoi à la fois, les modifications
+         * faites pendant l'envoi partent au suivant
+         * @returns {Promise<boolean>} true si le serveur a toute la saisie
+         */
+        enregistrerBrouillon() {
+            if (this._envoiBrouillon) {
+                this._brouillonARelancer = true;
+                return this._envoiBrouillon;
+            }
+            this._envoiBrouillon = this._envoyerBrouillon().finally(() => {
+                this._envoiBrouillon = null;
+                if (this._brouillonARelancer) {
+                    this._brouillonARelancer = false;
+                    this.planifierBrouillon(0);
+                }
+            });
+            return this._envoiBrouillon;
+        },
+
+        async _requeteBrouillon(methode, url, donnees) {
+            return fetch(url, {
+                method: methode,
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-CSRFToken': document.querySelector('[name="csrf_token"]')?.value || ''
+                },
+                body: donnees === undefined ? undefined : JSON.stringify(donnees)
+            });
+        },
+
+        async _envoyerBrouillon() {
+            const modifications = this._modifications;
+            const lignes = this.copieLignes();
+            const champs = this.champsFormulaire();
+            const champsJson = JSON.stringify(champs);
+            let reponse;
+
+            this.etatBrouillon = 'envoi';
+            try {
+                if (!this.brouillon.id) {
+                    // Premier envoi : état complet (les suivants ne contiennent que les différences)
+                    reponse = await this._requeteBrouillon('POST', '/api/devis/brouillons',
+                        { devis_id: this.brouillon.devis_id, lignes, champs });
+                } else {
+                    const operations = operationsLignes(this._lignesServeur, lignes);
+                    const champsModifies = champsJson !== this._champsServeur;
+                    if (operations.length === 0 && !champsModifies) {
+                        return this._brouillonEnregistre(modifications);
+                    }
+                    reponse = await this._requeteBrouillon('PATCH', `/api/devis/brouillons/${this.brouillon.id}`, {
+                        version: this.brouillon.version,
+                        operations,
+                        champs: champsModifies ? champs : undefined
+                    });
+                }
+            } catch (error) {
+                // Réseau indisponible : nouvel essai avec un délai doublé à chaque échec
+                this.etatBrouillon = 'hors_ligne';
+                this._delaiNouvelEssai = Math.min(this._delaiNouvelEssai * 2, DELAI_NOUVEL_ESSAI_MAX);
+                clearTimeout(this._minuteurBrouillon);
+                this._minuteurBrouillon = setTimeout(() => this.enregistrerBrouillon(), this._delaiNouvelEssai);
+                return false;
+            }
+            this._delaiNouvelEssai = DELAI_BROUILLON;
+
+            // Session expirée : redirection vers /login ou refus CSRF, en HTML
+            if (reponse.redirected || !(reponse.headers.get('Content-Type') || '').includes('application/json')) {
+                this.etatBrouillon = 'session';
+                return false;
+            }
+
+            const donnees = await reponse.json();
+            if (reponse.status === 409) {
+                // Le brouillon a avancé ailleurs, ou un autre onglet l'a créé : on repart de son état
+                this.brouillon.id = donnees.id;
+                this.brouillon.version = donnees.version;
+                this._lignesServeur = donnees.lignes;
+                this._champsServeur = JSON.stringify(donnees.champs);
+                this._brouillonARelancer = true;
+                return false;
+            }
+            if (reponse.status === 404 || (reponse.status === 400 && this.brouillon.id)) {
+                // Brouillon supprimé (devis enregistré ailleurs, purge) ou désynchronisé : on en recrée un
+                this.brouillon.id = null;
+                this.brouillon.version = 0;
+                this._brouillonARelancer = true;
+                return false;
+            }
+            if (!reponse.ok) {
+                console.error('Erreur lors de l\'enregistrement du brouillon:', donnees.error);
+                this.etatBrouillon = 'erreur';
+                return false;
+            }
+
+            this.brouillon.id = donnees.id;
+            this.brouillon.version = donnees.version;
+            this._lignesServeur = lignes;
+            this._champsServeur = champsJson;
+            return this._brouillonEnregistre(modifications);
+        },
+
+        /**
+         * Le serveur a la saisie de l'envoi ; rien d'autre n'a changé entre-temps ?
+         * @param {number} modifications - Compteur de modifications au début de l'envoi
+         */
+        _brouillonEnregistre(modifications) {
+            if (modifications !== this._modifications) {
+                this.etatBrouillon = 'modifie';
+                this.sauverCopieLocale();
+                return false;
+            }
+            this.etatBrouillon = 'enregistre';
+            this.oublierCopieLocale();
+            return true;
+        },
+
+        /**
+         * Supprime le brouillon et recharge le formulaire depuis le devis enregistré
+         */
+        async abandonnerBrouillon() {
+            if (!confirm('Abandonner le brouillon et revenir à la dernière version enregistrée ?')) return;
+            clearTimeout(this._minuteurBrouillon);
+            this.oublierCopieLocale();
+            if (this.brouillon.id) {
+                try {
+                    await this._requeteBrouillon('DELETE', `/api/devis/brouillons/${this.brouillon.id}`);
+                } catch (error) {
+                    console.error('Erreur lors de la suppression du brouillon:', error);
+                }
+            }
+            window.location.reload();
+        },
+
+        /**
+         * Planifie un recalcul serveur (debounce) ; l'affichage repasse
+         * sur le calcul local en attendant la réponse
+         */
+        planifierRecalcul() {
+            this.totauxServeur = null;
+            clearTimeout(this._minuteurRecalcul);
+            this._minuteurRecalcul = setTimeout(() => this.recalculerServeur(), 400);
+        },
+
+        /**
+         * Demande au serveur les totaux officiels du brouillon
+         */
+        async recalculerServeur() {
+            const numero = ++this._numeroRequete;
+
+            try {
+                const response = await fetch('/api/devis/totaux', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                        'X-CSRFToken': document.querySelector('[name="csrf_token"]')?.value || ''
+                    },
+                    body: JSON.stringify({
+                        lignes: this.lignes,
+                        remise_pourcent: document.querySelector('[name="remise_pourcent"]')?.value || 0
+                    })
+                });
+                // Ignorer les réponses d'une requête devenue obsolète
+                if (response.ok && numero === this._numeroRequete) {
+                    this.totauxServeur = await response.json();
+                }
+            } catch (error) {
+                console.error('Erreur lors du recalcul des totaux:', error);
+            }
+        },
+
+        /**
+         * Total TTC d'une ligne (valeur serveur si disponible)
+         * @param {Object} ligne - La ligne
+         * @param {number} index - Index de la ligne
+         */
+        totalLigne(ligne, index) {
+            const serveur = this.totauxServeur?.lignes?.[index];
+            return serveur ? parseFloat(serveur.total_ttc) : ligne.total_ttc;
+        },
+
         /**
          * Calcule le total HT brut (avant remise)
          */
         get totalHT() {
+            if (this.totauxServeur) return parseFloat(this.totauxServeur.total_ht_brut);
             return this.lignes.reduce((sum, ligne) => {
                 return sum + (ligne.prix_unitaire_ht * ligne.quantite);
             }, 0);
@@ -30,6 +414,7 @@ function devisForm(lignesExistantes = []) {
          * Calcule le montant de la remise
          */
         get remise() {
+            if (this.totauxServeur) return parseFloat(this.totauxServeur.montant_remise);
             const remisePourcent = parseFloat(document.querySelector('[name="remise_pourcent"]')?.value || 0);
             return this.totalHT * (remisePourcent / 100);
         },
@@ -38,6 +423,7 @@ function devisForm(lignesExistantes = []) {
          * Calcule le total HT après application de la remise
          */
         get totalHTApresRemise() {
+            if (this.totauxServeur) return parseFloat(this.totauxServeur.total_ht);
             return this.totalHT - this.remise;
         },
 
@@ -45,6 +431,7 @@ function devisForm(lignesExistantes = []) {
          * Calcule le total de la TVA sur le montant après remise
          */
         get totalTVA() {
+            if (this.totauxServeur) return parseFloat(this.totauxServeur.total_tva);
             const remisePourcent = parseFloat(document.querySelector('[name="remise_pourcent"]')?.value || 0);
             return this.lignes.reduce((sum, ligne) => {
                 const montantHT = ligne.prix_unitaire_ht * ligne.quantite;
@@ -57,6 +444,7 @@ function devisForm(lignesExistantes = []) {
          * Calcule le total TTC final
          */
         get totalTTC() {
+            if (this.totauxServeur) return parseFloat(this.totauxServeur.total_ttc);
             return this.totalHTApresRemise + this.totalTVA;
         },
 
@@ -65,6 +453,7 @@ function devisForm(lignesExistantes = []) {
          */
         ajouterLigne() {
             this.lignes.push({
+                uid: nouvelUid(),
                 tache: '',
                 vehicule: '',
                 description: '',
@@ -105,7 +494,8 @@ function devisForm(lignesExistantes = []) {
                 const response = await fetch(`/api/prix/${ligne.unite}`);
                 if (response.ok) {
                     const data = await response.json();
-                    ligne.prix_unitaire_ht = data.prix;
+                    // Le prix est transmis en texte (Decimal exact côté serveur)
+                    ligne.prix_unitaire_ht = parseFloat(data.prix) || 0;
                     ligne.description = data.description || '';
                     ligne.tache = data.categorie === 'TOLERIE_CARROSSERIE'
                         ? 'TOLERIE_CARROSSERIE'
@@ -127,14 +517,29 @@ function devisForm(lignesExistantes = []) {
 
         /**
          * Validation avant soumission du formulaire
+         *
+         * Si le brouillon est à jour, seuls son id et sa version sont soumis ;
+         * sinon on tente un dernier enregistrement, et à défaut les lignes
+         * partent en JSON (lignes_json) comme avant.
          * @param {Event} e - L'événement de soumission
          */
-        onSubmit(e) {
+        async onSubmit(e) {
             if (this.lignes.length === 0) {
                 e.preventDefault();
                 alert('Veuillez ajouter au moins une ligne au devis.');
                 return false;
             }
+            clearTimeout(this._minuteurBrouillon);
+            if (this.brouillonAJour || !this.brouillon.id) {
+                this.oublierCopieLocale();
+                return;
+            }
+
+            e.preventDefault();
+            await this.enregistrerBrouillon();
+            this.oublierCopieLocale();
+            // Laisser Alpine mettre à jour les champs cachés (brouillon_version, lignes_json) avant l'envoi
+            this.$nextTick(() => e.target.submit());
         }
     }
 }
@@ -0,0 +1,165 @@
+"""Tâches de fond planifiées (expiration des devis, factures en retard)
+
+Chaque tâche est une mise à jour ensembliste (un UPDATE par tâche) au lieu
+d'un contrôle ligne par ligne à l'affichage. Elles se lancent :
+- à la demande : flask taches [nom...] ;
+- ou périodiquement dans l'application (TACHES_PLANIFIEES=True) : un seul
+  worker gunicorn, le "leader" qui détient le verrou fichier, les exécute.
+"""
+import os
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from flask import current_app
+from app import db
+from app.models import Devis, Facture
+from app.resume_clients import actualiser_resumes
+from app.evenements import enregistrer_evenements
+
+# Tâches enregistrées : nom -> fonction retournant le nombre de lignes modifiées
+TACHES = {}
+
+# Verrou partagé par les workers d'une même machine (libéré par l'OS si le leader meurt)
+FICHIER_VERROU = os.path.join(tempfile.gettempdir(), 'mb-app-taches.lock')
+
+
+def tache(nom):
+    """Décorateur : enregistre une tâche sous `nom`"""
+    def enregistrer(fonction):
+        TACHES[nom] = fonction
+        return fonction
+    return enregistrer
+
+
+def _date_plus_jours(colonne_date, jours):
+    """Expression SQL "colonne_date + jours" (l'arithmétique de dates dépend du SGBD)
+
+    Args:
+        colonne_date: Colonne de type Date
+        jours: Nombre de jours (entier ou colonne entière)
+
+    Returns:
+        Expression comparable à une date Python
+    """
+    if db.engine.dialect.name == 'sqlite':
+        # date('2024-01-31', '+30 days') -> '2024-03-01' (texte ISO, comparable)
+        return db.func.date(colonne_date, db.literal('+').concat(db.cast(jours, db.String)).concat(' days'))
+    return colonne_date + jours
+
+
+@tache('expirer-devis')
+def expirer_devis():
+    """Passe en 'expire' les devis envoyés dont la validité est dépassée
+
+    La condition est reprise dans l'UPDATE : un devis accepté ou facturé
+    entre-temps n'est pas écrasé. Les événements et compteurs ne portent que
+    sur les lignes réellement modifiées (RETURNING, ou relecture si la base
+    ne le permet pas).
+    """
+    aujourd_hui = date.today()
+    condition = db.and_(
+        Devis.statut == 'envoye',
+        ~Devis.facture.has(),
+        _date_plus_jours(Devis.date, db.func.coalesce(Devis.validite_jours, 0)) < aujourd_hui,
+    )
+    requete = (db.update(Devis)
+               .where(condition)
+               .values(statut='expire')
+               .execution_options(synchronize_session=False))
+
+    if db.engine.dialect.update_returning:
+        expires = db.session.execute(requete.returning(Devis.id, Devis.client_id, Devis.numero)).all()
+    else:
+        candidats = [id_devis for (id_devis,) in db.session.query(Devis.id).filter(condition)]
+        if not candidats:
+            return 0
+        db.session.execute(requete.where(Devis.id.in_(candidats)))
+        expires = (db.session.query(Devis.id, Devis.client_id, Devis.numero)
+                   .filter(Devis.id.in_(candidats), Devis.statut == 'expire').all())
+    if not expires:
+        return 0
+
+    enregistrer_evenements('devis.statut', [
+        (id_devis, client_id, {'numero': numero, 'statut': 'expire', 'ancien_statut': 'envoye'})
+        for id_devis, client_id, numero in expires
+    ])
+    actualiser_resumes(*{client_id for _, client_id, _ in expires})
+    return len(expires)
+
+
+@tache('factures-en-retard')
+def marquer_factures_en_retard():
+    """Signale les factures non soldées au-delà du délai de paiement (DELAI_PAIEMENT_JOURS)"""
+    delai = current_app.config['DELAI_PAIEMENT_JOURS']
+    limite = date.today() - timedelta(days=delai)
+
+    resultat = db.session.execute(
+        db.update(Facture)
+        .where(Facture.etat_paiement != 'Payé', Facture.en_retard.is_(False), Facture.date < limite)
+        .values(en_retard=True)
+        .execution_options(synchronize_session=False)
+    )
+    return resultat.rowcount
+
+
+def executer(app, nom):
+    """Exécute une tâche dans sa propre transaction et journalise durée et lignes modifiées
+
+    Args:
+        app: L'instance Flask
+        nom: Nom de la tâche (clé de TACHES)
+
+    Returns:
+        int: Nombre de lignes modifiées, ou None en cas d'erreur
+    """
+    debut = time.perf_counter()
+    with app.app_context():
+        try:
+            nombre = TACHES[nom]()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f'❌ Tâche {nom} en échec après {(time.perf_counter() - debut) * 1000:.0f} ms : {e}')
+            return None
+
+    app.logger.info(f'⏱️ Tâche {nom} : {nombre} ligne(s) modifiée(s) en {(time.perf_counter() - debut) * 1000:.0f} ms')
+    return nombre
+
+
+def prendre_verrou(chemin=FICHIER_VERROU):
+    """Tente de devenir le leader (verrou exclusif non bloquant) ; retourne le fichier ou None"""
+    import fcntl
+    fichier = open(chemin, 'w')
+    try:
+        fcntl.flock(fichier, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        fichier.close()
+        return None
+    return fichier
+
+
+def demarrer_planificateur(app):
+    """Lance le planificateur en tâche de fond (un thread par worker, un seul leader)
+
+    Chaque worker tente de prendre le verrou à chaque intervalle : celui qui
+    l'obtient le garde et exécute toutes les tâches à chaque tour. Si le leader
+    s'arrête, l'OS libère le verrou et un autre worker prend le relais.
+
+    Args:
+        app: L'instance Flask
+    """
+    intervalle = app.config['TACHES_INTERVALLE']
+
+    def boucle():
+        verrou = None
+        while True:
+            if verrou is None:
+                verrou = prendre_verrou()
+            if verrou is not None:
+                for nom in TACHES:
+                    executer(app, nom)
+            time.sleep(intervalle)
+
+    threading.Thread(target=boucle, name='planificateur-taches', daemon=True).start()
+    app.logger.info(f'Planificateur de tâches démarré (toutes les {intervalle} s)')
@@ -0,0 +1,54 @@
+"""Configuration gunicorn (lue automatiquement depuis le dossier courant)
+
+GUNICORN_PRELOAD=True : l'application est créée une seule fois dans le
+processus maître (preload_app), avec les modules lourds (PDF, emails,
+rapprochement) et le préchauffage PDF éventuel, puis les workers sont
+forkés : ils démarrent sans réimporter, et partagent ces pages mémoire en
+copie sur écriture tant qu'ils ne les modifient pas.
+
+Ce qui ne se partage pas entre processus est refait dans chaque worker
+après le fork (post_fork) : connexions à la base, threads de fond.
+
+Les threads d'envoi des emails et de diffusion des événements ne sont
+lancés par défaut que sous gunicorn : les commandes flask et les scripts,
+qui créent aussi l'application, n'en démarrent pas. EMAIL_ENVOI_AUTO=False
+ou EVENEMENTS_DIFFUSION_AUTO=False les désactivent ici aussi (cron).
+"""
+import gc
+import os
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'False').lower() in ('1', 'true', 'yes')
+
+# Lus par app.config.Config dans le maître et les workers, sauf valeur explicite
+os.environ.setdefault('EMAIL_ENVOI_AUTO', 'True')
+os.environ.setdefault('EVENEMENTS_DIFFUSION_AUTO', 'True')
+
+if preload_app:
+    # Lu par app.config.Config : create_app laisse les threads de fond à post_fork
+    os.environ['PRELOAD_APP'] = 'True'
+
+
+def pre_fork(server, worker):
+    """Gèle les objets du maître avant le fork
+
+    Le ramasse-miettes n'écrit plus dans leurs en-têtes : leurs pages restent
+    partagées au lieu d'être copiées dans chaque worker au premier passage.
+    """
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    """Dans le worker : oublie les connexions héritées du maître et lance les threads de fond"""
+    if not preload_app:
+        return  # l'application est créée dans le worker, qui a déjà tout lancé
+
+    from run import app
+    from app import db, demarrer_services
+
+    with app.app_context():
+        for engine in db.engines.values():
+            # close=False : ne ferme pas les connexions du maître, le worker en ouvrira de nouvelles
+            engine.dispose(close=False)
+
+    demarrer_services(app)
@@ -0,0 +1,100 @@
+"""Benchmark des moteurs PDF : latence, mémoire crête et taille du fichier
+
+Rend le vrai template pdf/devis.html pour un petit devis et un devis de 200 lignes,
+chaque moteur dans un processus séparé (mémoire crête non polluée par l'autre) :
+    python scripts/bench_pdf_engines.py
+"""
+import os
+import sys
+import json
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MOTEURS = ('xhtml2pdf', 'weasyprint')
+TAILLES = (5, 200)
+REPETITIONS = 5
+
+
+def mesurer(moteur):
+    """Mode enfant : rend les devis avec un moteur et affiche les mesures en JSON"""
+    sys.path.insert(0, RACINE)
+    from datetime import date, timedelta
+    from flask import render_template
+    from app import create_app
+    from app.models import Client, Devis, DevisLigne
+    from app.pdf import generer_pdf
+
+    app = create_app()
+    resultats = []
+
+    with app.test_request_context():
+        # Premier rendu hors mesure (imports et initialisation du moteur)
+        generer_pdf('<html><body><p>init</p></body></html>', moteur=moteur)
+
+        for nb_lignes in TAILLES:
+            devis = Devis(numero='N°999', date=date.today(), validite_jours=30,
+                          remise_pourcent=10, acompte=0, client=Client(nom='Client bench'))
+            devis.lignes = [DevisLigne(description=f'Réparation élément {i}', unite='T3', tache='DEBOSSELAGE',
+                                       quantite=1 + i % 3, prix_unitaire_ht=85, tva_pourcent=20,
+                                       total_ttc=0, ordre=i) for i in range(nb_lignes)]
+            devis.calculer_totaux()
+            html = render_template('pdf/devis.html', devis=devis, config=None, timedelta=timedelta)
+
+            latences = []
+            tracemalloc.start()
+            for _ in range(REPETITIONS):
+                debut = time.perf_counter()
+                pdf = generer_pdf(html, moteur=moteur)
+                latences.append(time.perf_counter() - debut)
+            pic_python = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            resultats.append({
+                'lignes': nb_lignes,
+                'latence_ms': statistics.median(latences) * 1000,
+                'pic_python_mo': pic_python / 1024 / 1024,
+                'taille_ko': len(pdf) / 1024 if pdf else 0,
+            })
+
+    # RSS max du processus (inclut les bibliothèques C : Cairo, Pango...), en Ko sous Linux
+    rss_mo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'moteur': moteur, 'rss_max_mo': rss_mo, 'resultats': resultats}))
+
+
+def lancer(moteur):
+    """Lance un processus enfant pour un moteur et retourne ses mesures"""
+    with tempfile.TemporaryDirectory() as dossier:
+        env = dict(os.environ)
+        env.setdefault('SECRET_KEY', 'bench')
+        env.setdefault('ADMIN_USERNAME', 'admin')
+        env.setdefault('ADMIN_PASSWORD_HASH', 'bench')
+        env['DATABASE_URL'] = f'sqlite:///{os.path.join(dossier, "bench.db")}'
+        sortie = subprocess.run([sys.executable, __file__, '--enfant', moteur], env=env, cwd=dossier,
+                                check=True, capture_output=True, text=True).stdout
+        return json.loads(sortie.strip().splitlines()[-1])
+
+
+def main():
+    print(f'{"Moteur":<12}{"Lignes":>8}{"Latence (ms)":>14}{"Pic Python (Mo)":>17}'
+          f'{"Taille (Ko)":>13}{"RSS max (Mo)":>14}')
+    for moteur in MOTEURS:
+        try:
+            mesures = lancer(moteur)
+        except subprocess.CalledProcessError as error:
+            print(f'{moteur:<12}  indisponible ({error.stderr.strip().splitlines()[-1]})')
+            continue
+        for r in mesures['resultats']:
+            print(f'{moteur:<12}{r["lignes"]:>8}{r["latence_ms"]:>14.1f}{r["pic_python_mo"]:>17.1f}'
+                  f'{r["taille_ko"]:>13.1f}{mesures["rss_max_mo"]:>14.0f}')
+
+
+if __name__ == '__main__':
+    if '--enfant' in sys.argv:
+        mesurer(sys.argv[-1])
+    else:
+        main()
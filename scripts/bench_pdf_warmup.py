@@ -0,0 +1,80 @@
+"""Benchmark : latence du premier PDF avec et sans préchauffage (PDF_WARMUP)
+
+Chaque mesure tourne dans un processus neuf (comme un worker gunicorn fraîchement forké) :
+    python scripts/bench_pdf_warmup.py
+"""
+import os
+import sys
+import json
+import subprocess
+import tempfile
+import time
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ESSAIS = 3
+
+
+def mesurer():
+    """Mode enfant : démarre l'application et mesure deux rendus de PDF successifs"""
+    sys.path.insert(0, RACINE)
+    from datetime import date
+
+    debut = time.perf_counter()
+    from app import create_app, db
+    app = create_app()
+    demarrage = time.perf_counter() - debut
+
+    from app.models import Client, Devis, DevisLigne
+    with app.app_context():
+        client = Client(nom='Client bench')
+        devis = Devis(numero='N°001', date=date.today(), client=client)
+        devis.lignes = [DevisLigne(description=f'Ligne {i}', quantite=1, prix_unitaire_ht=100,
+                                   tva_pourcent=20, total_ttc=120, ordre=i) for i in range(20)]
+        devis.calculer_totaux()
+        db.session.add(devis)
+        db.session.commit()
+        devis_id = devis.id
+
+    client_http = app.test_client()
+    with client_http.session_transaction() as session:
+        session['_user_id'] = os.environ['ADMIN_USERNAME']
+        session['_fresh'] = True
+
+    latences = []
+    for _ in range(2):
+        debut = time.perf_counter()
+        reponse = client_http.get(f'/devis/{devis_id}/pdf')
+        latences.append(time.perf_counter() - debut)
+        assert reponse.status_code == 200, reponse.status_code
+
+    print(json.dumps({'demarrage': demarrage, 'premier': latences[0], 'second': latences[1]}))
+
+
+def lancer(warmup):
+    """Lance un processus enfant et retourne ses mesures"""
+    with tempfile.TemporaryDirectory() as dossier:
+        env = dict(os.environ)
+        env.setdefault('SECRET_KEY', 'bench')
+        env.setdefault('ADMIN_USERNAME', 'admin')
+        env.setdefault('ADMIN_PASSWORD_HASH', 'bench')
+        env['DATABASE_URL'] = f'sqlite:///{os.path.join(dossier, "bench.db")}'
+        env['PDF_WARMUP'] = 'true' if warmup else 'false'
+        sortie = subprocess.run([sys.executable, __file__, '--enfant'], env=env, cwd=dossier,
+                                check=True, capture_output=True, text=True).stdout
+        return json.loads(sortie.strip().splitlines()[-1])
+
+
+def main():
+    print(f'{"Mode":<16}{"Démarrage":>12}{"1er PDF":>12}{"2e PDF":>12}   (ms, moyenne sur {ESSAIS})')
+    for warmup in (False, True):
+        mesures = [lancer(warmup) for _ in range(ESSAIS)]
+        moyenne = {cle: sum(m[cle] for m in mesures) / ESSAIS * 1000 for cle in mesures[0]}
+        libelle = 'PDF_WARMUP=true' if warmup else 'sans warm-up'
+        print(f'{libelle:<16}{moyenne["demarrage"]:>12.0f}{moyenne["premier"]:>12.0f}{moyenne["second"]:>12.0f}')
+
+
+if __name__ == '__main__':
+    if '--enfant' in sys.argv:
+        mesurer()
+    else:
+        main()
@@ -0,0 +1,143 @@
+"""Benchmark : débit en lecture/écriture concurrentes sur SQLite, avec et sans le profil de production
+
+Plusieurs processus (comme des workers gunicorn) lisent et écrivent la même
+base pendant DUREE secondes ; on compte les opérations réussies et les
+erreurs "database is locked" :
+    python scripts/bench_sqlite.py
+    python scripts/bench_sqlite.py --lecteurs 8 --ecrivains 4 --duree 20
+"""
+import argparse
+import os
+import sys
+import json
+import random
+import subprocess
+import tempfile
+import time
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NB_CLIENTS = 200
+NB_DEVIS = 2000
+DELAI_DEMARRAGE = 5  # secondes laissées aux processus pour charger l'application
+
+
+def _app():
+    sys.path.insert(0, RACINE)
+    from app import create_app
+    return create_app()
+
+
+def initialiser():
+    """Mode enfant : crée le schéma et un jeu de données (clients, devis avec lignes)"""
+    from datetime import date
+    app = _app()
+    from app import db
+    from app.models import Client, Devis, DevisLigne
+
+    with app.app_context():
+        clients = [Client(nom=f'Client {i}') for i in range(NB_CLIENTS)]
+        db.session.add_all(clients)
+        for i in range(NB_DEVIS):
+            devis = Devis(numero=f'N°{i + 1:05d}', date=date.today(), client=clients[i % NB_CLIENTS])
+            devis.lignes = [DevisLigne(description=f'Ligne {j}', quantite=1, prix_unitaire_ht=100,
+                                       tva_pourcent=20, total_ttc=120, ordre=j) for j in range(5)]
+            devis.calculer_totaux()
+            db.session.add(devis)
+        db.session.commit()
+
+
+def travailler(role, debut, fin):
+    """Mode enfant : lit ou écrit en boucle entre `debut` et `fin` (horloge time.time)"""
+    from sqlalchemy.exc import OperationalError
+    app = _app()
+    from app import db
+    from app.models import Devis, DevisLigne
+
+    operations = verrouillees = 0
+    time.sleep(max(0, debut - time.time()))
+    with app.app_context():
+        while time.time() < fin:
+            try:
+                if role == 'lecture':
+                    # Liste des devis (page d'accueil) et agrégat par statut (tableau de bord)
+                    (Devis.query.options(db.joinedload(Devis.client))
+                     .order_by(Devis.id.desc()).limit(50).all())
+                    db.session.query(Devis.statut, db.func.count(Devis.id)).group_by(Devis.statut).all()
+                    db.session.rollback()
+                else:
+                    # Lecture puis écriture dans la même transaction, comme la modification d'un devis
+                    devis = db.session.get(Devis, random.randint(1, NB_DEVIS))
+                    devis.lignes.append(DevisLigne(description='Ajout', quantite=1, prix_unitaire_ht=10,
+                                                   tva_pourcent=20, total_ttc=12,
+                                                   ordre=len(devis.lignes) + 1))
+                    devis.calculer_totaux()
+                    db.session.commit()
+                operations += 1
+            except OperationalError as erreur:
+                db.session.rollback()
+                if 'locked' not in str(erreur):
+                    raise
+                verrouillees += 1
+
+    print(json.dumps({'operations': operations, 'verrouillees': verrouillees}))
+
+
+def mesurer(optimise, lecteurs, ecrivains, duree):
+    """Lance les processus sur une base neuve et agrège leurs compteurs par rôle"""
+    with tempfile.TemporaryDirectory() as dossier:
+        env = dict(os.environ)
+        env.setdefault('SECRET_KEY', 'bench')
+        env.setdefault('ADMIN_USERNAME', 'admin')
+        env.setdefault('ADMIN_PASSWORD_HASH', 'bench')
+        env['DATABASE_URL'] = f'sqlite:///{os.path.join(dossier, "bench.db")}'
+        env['SQLITE_OPTIMISATIONS'] = 'true' if optimise else 'false'
+        env['EMAIL_ENVOI_AUTO'] = 'false'
+        env['TACHES_PLANIFIEES'] = 'false'
+
+        subprocess.run([sys.executable, __file__, '--enfant', 'init'], env=env, cwd=dossier, check=True)
+
+        # Départ commun, une fois les processus lancés et l'application chargée
+        debut = time.time() + DELAI_DEMARRAGE
+        roles = ['lecture'] * lecteurs + ['ecriture'] * ecrivains
+        processus = [(role, subprocess.Popen([sys.executable, __file__, '--enfant', role,
+                                              str(debut), str(debut + duree)],
+                                             env=env, cwd=dossier, stdout=subprocess.PIPE, text=True))
+                     for role in roles]
+
+        totaux = {role: {'operations': 0, 'verrouillees': 0} for role in ('lecture', 'ecriture')}
+        for role, proc in processus:
+            sortie, _ = proc.communicate()
+            if proc.returncode != 0:
+                raise RuntimeError(f'Processus {role} en échec (code {proc.returncode})')
+            resultat = json.loads(sortie.strip().splitlines()[-1])
+            for cle in resultat:
+                totaux[role][cle] += resultat[cle]
+        return totaux
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lecteurs', type=int, default=4)
+    parser.add_argument('--ecrivains', type=int, default=2)
+    parser.add_argument('--duree', type=int, default=10, help='secondes de mesure')
+    args = parser.parse_args()
+
+    print(f'{args.lecteurs} lecteurs, {args.ecrivains} écrivains, {args.duree} s')
+    print(f'{"Profil":<24}{"Lectures/s":>12}{"Écritures/s":>13}{"Verrouillées":>14}')
+    for optimise in (False, True):
+        totaux = mesurer(optimise, args.lecteurs, args.ecrivains, args.duree)
+        libelle = 'WAL + pragmas' if optimise else 'SQLite par défaut'
+        erreurs = totaux['lecture']['verrouillees'] + totaux['ecriture']['verrouillees']
+        print(f'{libelle:<24}{totaux["lecture"]["operations"] / args.duree:>12.0f}'
+              f'{totaux["ecriture"]["operations"] / args.duree:>13.0f}{erreurs:>14}')
+
+
+if __name__ == '__main__':
+    if '--enfant' in sys.argv:
+        role = sys.argv[sys.argv.index('--enfant') + 1]
+        if role == 'init':
+            initialiser()
+        else:
+            travailler(role, float(sys.argv[-2]), float(sys.argv[-1]))
+    else:
+        main()
@@ -0,0 +1,107 @@
+"""Budget de temps d'import au démarrage d'un worker (python -X importtime)
+
+Mesure les imports faits par create_app() dans un processus neuf, affiche
+les paquets les plus coûteux et échoue (code de sortie 1) si le total
+dépasse le budget ou si un module à chargement différé (PDF, emails,
+rapprochement : voir app/modules_differes.py) est importé au démarrage :
+    python scripts/budget_imports.py
+    python scripts/budget_imports.py --budget-ms 800 --essais 5
+"""
+import argparse
+import os
+import sys
+import subprocess
+import tempfile
+from collections import defaultdict
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Budget par défaut du démarrage (imports de create_app), en millisecondes
+BUDGET_MS = 1500
+
+# Modules qui ne doivent être importés qu'à leur première utilisation
+MODULES_DIFFERES = ('app.pdf', 'app.emails', 'app.rapprochement', 'app.releves', 'flask_mail', 'xhtml2pdf',
+                    'reportlab', 'weasyprint')
+
+# Écrit par l'enfant juste avant create_app : les imports de l'interpréteur (site, encodings) sont ignorés
+MARQUEUR = '--- create_app ---'
+
+CODE_ENFANT = f'''
+import sys
+sys.path.insert(0, {RACINE!r})
+sys.stderr.write({MARQUEUR!r} + "\\n")
+from app import create_app
+create_app()
+'''
+
+
+def mesurer(env, dossier):
+    """Lance create_app() sous -X importtime dans un processus neuf (dossier courant : `dossier`)
+
+    Returns:
+        list: (module, profondeur, temps propre en µs, temps cumulé en µs), dans l'ordre d'import
+    """
+    sortie = subprocess.run([sys.executable, '-X', 'importtime', '-c', CODE_ENFANT], env=env, cwd=dossier,
+                            check=True, capture_output=True, text=True).stderr
+    imports = []
+    lignes = sortie.split(MARQUEUR, 1)[1].splitlines()
+    for ligne in lignes:
+        if not ligne.startswith('import time:') or 'imported package' in ligne:
+            continue
+        propre, cumule, nom = ligne[len('import time:'):].split('|')
+        nom = nom[1:]  # un espace après le séparateur, puis deux par niveau d'imbrication
+        profondeur = (len(nom) - len(nom.lstrip())) // 2
+        imports.append((nom.strip(), profondeur, int(propre), int(cumule)))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS, help=f'Budget en ms (défaut : {BUDGET_MS})')
+    parser.add_argument('--essais', type=int, default=3, help='Mesures (la plus rapide est retenue)')
+    parser.add_argument('--top', type=int, default=15, help='Nombre de paquets affichés')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dossier:
+        env = dict(os.environ)
+        env.setdefault('SECRET_KEY', 'budget')
+        env.setdefault('ADMIN_USERNAME', 'admin')
+        env.setdefault('ADMIN_PASSWORD_HASH', 'budget')
+        env['DATABASE_URL'] = f'sqlite:///{os.path.join(dossier, "budget.db")}'
+        # Démarrage d'un worker ordinaire : ni préchargement ni préchauffage PDF
+        env['PRELOAD_APP'] = 'False'
+        env['PDF_WARMUP'] = 'False'
+
+        mesurer(env, dossier)  # premier lancement : compile les .pyc, non compté
+        mesures = [mesurer(env, dossier) for _ in range(args.essais)]
+
+    imports = min(mesures, key=lambda mesure: sum(cumule for _, profondeur, _, cumule in mesure if profondeur == 0))
+    total_ms = sum(cumule for _, profondeur, _, cumule in imports if profondeur == 0) / 1000
+
+    par_paquet = defaultdict(int)
+    for nom, _, propre, _ in imports:
+        par_paquet[nom.split('.')[0]] += propre
+    print(f'{"Paquet":<32}{"Temps propre (ms)":>20}')
+    for paquet, propre in sorted(par_paquet.items(), key=lambda item: -item[1])[:args.top]:
+        print(f'{paquet:<32}{propre / 1000:>20.1f}')
+
+    print(f'\n{len(imports)} module(s) importé(s) par create_app en {total_ms:.0f} ms '
+          f'(budget {args.budget_ms:.0f} ms, meilleur de {args.essais})')
+
+    erreurs = []
+    if total_ms > args.budget_ms:
+        erreurs.append(f'budget dépassé de {total_ms - args.budget_ms:.0f} ms')
+    importes = {nom for nom, _, _, _ in imports}
+    for module in MODULES_DIFFERES:
+        if any(nom == module or nom.startswith(module + '.') for nom in importes):
+            erreurs.append(f'{module} importé au démarrage (devrait être différé)')
+
+    for erreur in erreurs:
+        print(f'❌ {erreur}')
+    if erreurs:
+        sys.exit(1)
+    print('✅ Démarrage dans le budget')
+
+
+if __name__ == '__main__':
+    main()
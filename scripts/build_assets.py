@@ -0,0 +1,199 @@
+"""Build des assets front : CSS Tailwind purgé/minifié et Alpine.js auto-hébergé
+
+Produit des fichiers à nom haché dans app/static/dist/ et un manifest.json lu
+par l'application (servis ensuite avec un cache immutable) :
+    python scripts/build_assets.py
+
+Le binaire Tailwind standalone (pas besoin de Node) est téléchargé une fois dans .cache/,
+ou pris dans la variable TAILWIND_BIN / le PATH s'il est déjà installé.
+
+Chaque fichier téléchargé est vérifié contre son SHA-256 épinglé dans
+scripts/assets.sha256 (y compris lorsqu'il est relu depuis .cache/) : un
+fichier sans empreinte ou dont l'empreinte diffère arrête le build. Après un
+changement de version, regénérer les empreintes puis relire et commiter le
+fichier :
+    python scripts/build_assets.py --epingler
+"""
+import os
+import sys
+import json
+import shutil
+import hashlib
+import platform
+import subprocess
+import tempfile
+import urllib.request
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DOSSIER_DIST = os.path.join(RACINE, 'app', 'static', 'dist')
+DOSSIER_CACHE = os.path.join(RACINE, '.cache')
+
+TAILWIND_VERSION = 'v3.4.17'
+ALPINE_VERSION = '3.14.9'
+ALPINE_URL = f'https://cdn.jsdelivr.net/npm/alpinejs@{ALPINE_VERSION}/dist/cdn.min.js'
+ALPINE_FICHIER = f'alpine-{ALPINE_VERSION}.min.js'
+
+# Empreintes attendues, au format de sha256sum : "<sha256>  <nom du fichier dans .cache/>"
+FICHIER_EMPREINTES = os.path.join(RACINE, 'scripts', 'assets.sha256')
+
+# Binaires Tailwind publiés (tous épinglés pour que le build marche sur chaque plateforme)
+PLATEFORMES_TAILWIND = ('linux-x64', 'linux-arm64', 'macos-x64', 'macos-arm64', 'windows-x64', 'windows-arm64')
+
+
+def nom_tailwind(plateforme):
+    """Nom du binaire publié pour une plateforme (ex: tailwindcss-linux-x64)"""
+    return f'tailwindcss-{plateforme}' + ('.exe' if plateforme.startswith('windows') else '')
+
+
+def url_tailwind(plateforme):
+    return f'https://github.com/tailwindlabs/tailwindcss/releases/download/{TAILWIND_VERSION}/{nom_tailwind(plateforme)}'
+
+
+def fichier_tailwind(plateforme):
+    """Nom du binaire dans .cache/ (versionné : une nouvelle version demande une nouvelle empreinte)"""
+    return f'{nom_tailwind(plateforme)}-{TAILWIND_VERSION}'
+
+
+def empreinte(chemin):
+    """SHA-256 (hexadécimal) d'un fichier, lu par blocs"""
+    hachage = hashlib.sha256()
+    with open(chemin, 'rb') as fichier:
+        for bloc in iter(lambda: fichier.read(1024 * 1024), b''):
+            hachage.update(bloc)
+    return hachage.hexdigest()
+
+
+def lire_empreintes():
+    """Empreintes épinglées {nom de fichier: sha256} (lignes vides et # ignorées)"""
+    empreintes = {}
+    if os.path.exists(FICHIER_EMPREINTES):
+        with open(FICHIER_EMPREINTES) as fichier:
+            for ligne in fichier:
+                ligne = ligne.strip()
+                if ligne and not ligne.startswith('#'):
+                    valeur, nom = ligne.split(maxsplit=1)
+                    empreintes[nom.lstrip('*')] = valeur.lower()
+    return empreintes
+
+
+def verifier_empreinte(chemin):
+    """Vérifie un fichier de .cache/ contre son empreinte épinglée
+
+    Raises:
+        SystemExit: Empreinte absente ou différente (le fichier est supprimé)
+    """
+    nom = os.path.basename(chemin)
+    attendue = lire_empreintes().get(nom)
+    if attendue is None:
+        os.remove(chemin)
+        raise SystemExit(f'❌ Aucune empreinte SHA-256 pour {nom} dans scripts/assets.sha256 '
+                         f'(python scripts/build_assets.py --epingler)')
+    obtenue = empreinte(chemin)
+    if obtenue != attendue:
+        os.remove(chemin)
+        raise SystemExit(f'❌ Empreinte SHA-256 invalide pour {nom} : {obtenue} au lieu de {attendue}')
+
+
+def telecharger(url, chemin):
+    """Télécharge url dans chemin si absent, puis vérifie son empreinte
+
+    Le téléchargement passe par un fichier .part : un transfert interrompu
+    ne laisse pas de fichier tronqué dans le cache.
+    """
+    if not os.path.exists(chemin):
+        os.makedirs(DOSSIER_CACHE, exist_ok=True)
+        print(f'Téléchargement de {url}')
+        urllib.request.urlretrieve(url, chemin + '.part')
+        os.replace(chemin + '.part', chemin)
+    verifier_empreinte(chemin)
+
+
+def binaire_tailwind():
+    """Retourne le chemin du CLI Tailwind standalone (téléchargé si besoin)"""
+    chemin = os.environ.get('TAILWIND_BIN') or shutil.which('tailwindcss')
+    if chemin:
+        return chemin
+
+    systeme = {'Linux': 'linux', 'Darwin': 'macos', 'Windows': 'windows'}[platform.system()]
+    archi = 'arm64' if platform.machine().lower() in ('arm64', 'aarch64') else 'x64'
+    plateforme = f'{systeme}-{archi}'
+    chemin = os.path.join(DOSSIER_CACHE, fichier_tailwind(plateforme))
+    telecharger(url_tailwind(plateforme), chemin)
+    os.chmod(chemin, 0o755)
+    return chemin
+
+
+def compiler_css():
+    """Compile app/static/src/app.css (seules les classes utilisées sont conservées)"""
+    with tempfile.TemporaryDirectory() as dossier:
+        sortie = os.path.join(dossier, 'app.css')
+        subprocess.run([binaire_tailwind(), '-c', 'tailwind.config.js', '-i', 'app/static/src/app.css',
+                        '-o', sortie, '--minify'], cwd=RACINE, check=True)
+        with open(sortie, 'rb') as fichier:
+            return fichier.read()
+
+
+def telecharger_alpine():
+    """Récupère la version épinglée d'Alpine.js (mise en cache dans .cache/)"""
+    chemin = os.path.join(DOSSIER_CACHE, ALPINE_FICHIER)
+    telecharger(ALPINE_URL, chemin)
+    with open(chemin, 'rb') as fichier:
+        return fichier.read()
+
+
+def ecrire_hache(nom, contenu):
+    """Écrit un fichier nommé d'après le hash de son contenu (ex: app.3f2a9c1b7d4e.css)"""
+    base, extension = os.path.splitext(nom)
+    empreinte = hashlib.sha256(contenu).hexdigest()[:12]
+    nom_hache = f'{base}.{empreinte}{extension}'
+    with open(os.path.join(DOSSIER_DIST, nom_hache), 'wb') as fichier:
+        fichier.write(contenu)
+    return f'dist/{nom_hache}'
+
+
+def epingler():
+    """Télécharge les versions configurées et écrit leurs empreintes dans scripts/assets.sha256
+
+    À lancer après un changement de TAILWIND_VERSION / ALPINE_VERSION ; le
+    fichier produit est à relire (comparer avec les sha256sums publiés) et
+    à commiter.
+    """
+    fichiers = [(url_tailwind(plateforme), fichier_tailwind(plateforme)) for plateforme in PLATEFORMES_TAILWIND]
+    fichiers.append((ALPINE_URL, ALPINE_FICHIER))
+    lignes = []
+    with tempfile.TemporaryDirectory() as dossier:
+        for url, nom in fichiers:
+            print(f'Téléchargement de {url}')
+            chemin = os.path.join(dossier, nom)
+            urllib.request.urlretrieve(url, chemin)
+            lignes.append(f'{empreinte(chemin)}  {nom}\n')
+    with open(FICHIER_EMPREINTES, 'w') as fichier:
+        fichier.write('# Empreintes SHA-256 des assets téléchargés par scripts/build_assets.py\n')
+        fichier.writelines(lignes)
+    print(f'✅ {len(lignes)} empreintes écrites dans scripts/assets.sha256')
+    return 0
+
+
+def main():
+    if '--epingler' in sys.argv[1:]:
+        return epingler()
+
+    # Repartir d'un dossier propre : les anciennes versions hachées ne servent plus
+    shutil.rmtree(DOSSIER_DIST, ignore_errors=True)
+    os.makedirs(DOSSIER_DIST)
+
+    manifeste = {
+        'app.css': ecrire_hache('app.css', compiler_css()),
+        'alpine.js': ecrire_hache('alpine.js', telecharger_alpine()),
+    }
+    with open(os.path.join(DOSSIER_DIST, 'manifest.json'), 'w') as fichier:
+        json.dump(manifeste, fichier, indent=2)
+
+    for nom, chemin in manifeste.items():
+        taille = os.path.getsize(os.path.join(RACINE, 'app', 'static', chemin)) / 1024
+        print(f'✅ {nom:<10} -> static/{chemin} ({taille:.1f} Ko)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,19 @@
+/** Configuration Tailwind pour le build CSS (python scripts/build_assets.py) */
+module.exports = {
+    content: [
+        './app/templates/**/*.html',
+        './app/static/js/**/*.js',
+    ],
+    theme: {
+        extend: {
+            colors: {
+                primary: '#1e40af', // Bleu profond
+                secondary: '#1f2937', // Noir grisé
+                accent: '#dc2626', // Rouge accent
+                success: '#10b981',
+                warning: '#f59e0b',
+                danger: '#ef4444',
+            }
+        }
+    }
+}